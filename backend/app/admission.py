@@ -0,0 +1,290 @@
+import asyncio
+import contextlib
+import math
+import os
+import sqlite3
+import time
+import uuid
+from typing import AsyncIterator, Optional
+
+from app.cache import TTLCache
+
+# Admission control in front of Gemini.
+# - A global cap on concurrent LLM turns with a bounded wait queue: when every slot is busy
+#   a turn waits up to LLM_QUEUE_TIMEOUT_SECONDS, and when the queue is full (or the wait
+#   times out) it is refused at once with 503 + Retry-After instead of piling onto the quota.
+# - A per-user token bucket on the chat endpoints (429 + Retry-After).
+# Both are per process by default. With ADMISSION_BACKEND=sqlite, the slot count and the
+# buckets live in one SQLite file shared by every worker on the host.
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "10"))
+# A worker that dies holding a shared slot gives it back after this long
+LLM_SLOT_LEASE_SECONDS = float(os.getenv("LLM_SLOT_LEASE_SECONDS", "120"))
+CHAT_RATE_LIMIT_ENABLED = os.getenv("CHAT_RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+CHAT_RATE_LIMIT_PER_MINUTE = float(os.getenv("CHAT_RATE_LIMIT_PER_MINUTE", "20"))
+CHAT_RATE_LIMIT_BURST = float(os.getenv("CHAT_RATE_LIMIT_BURST", "5"))
+ADMISSION_BACKEND = os.getenv("ADMISSION_BACKEND", "memory")  # "memory" or "sqlite"
+ADMISSION_SQLITE_PATH = os.getenv("ADMISSION_SQLITE_PATH", "admission.sqlite3")
+# Checked at import, not when the app starts or the first chat comes in. The bucket math divides
+# by the rate, and a burst below one token would refuse every request.
+if CHAT_RATE_LIMIT_PER_MINUTE <= 0 or CHAT_RATE_LIMIT_BURST < 1:
+    raise ValueError(
+        "CHAT_RATE_LIMIT_PER_MINUTE must be above 0 and CHAT_RATE_LIMIT_BURST at least 1; "
+        "to turn the limit off, set CHAT_RATE_LIMIT_ENABLED=false instead"
+    )
+if ADMISSION_BACKEND not in ("memory", "sqlite"):
+    raise ValueError(f"Unsupported ADMISSION_BACKEND: {ADMISSION_BACKEND}")
+
+class AdmissionRejected(Exception):
+    """A request refused by admission control; carries the HTTP status and Retry-After seconds."""
+
+    def __init__(self, status_code: int, retry_after: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.detail = detail
+
+def _sqlite_connect(path: str) -> sqlite3.Connection:
+    # Autocommit mode, so "BEGIN IMMEDIATE" below takes the write lock explicitly
+    return sqlite3.connect(path, timeout=5, isolation_level=None)
+
+class SQLiteSlotLeases:
+    """Host-wide LLM slots as lease rows in a SQLite file; expired leases are reclaimed."""
+
+    def __init__(self, path: str, max_concurrency: int, lease_seconds: float):
+        self.path = path
+        self.max_concurrency = max_concurrency
+        self.lease_seconds = lease_seconds
+        with contextlib.closing(_sqlite_connect(path)) as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS llm_slots (id TEXT PRIMARY KEY, expires_at REAL NOT NULL)")
+
+    def _try_acquire(self) -> Optional[str]:
+        now = time.time()
+        with contextlib.closing(_sqlite_connect(self.path)) as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.execute("DELETE FROM llm_slots WHERE expires_at <= ?", (now,))
+                (held,) = connection.execute("SELECT count(*) FROM llm_slots").fetchone()
+                if held >= self.max_concurrency:
+                    return None
+                lease_id = uuid.uuid4().hex
+                connection.execute("INSERT INTO llm_slots (id, expires_at) VALUES (?, ?)", (lease_id, now + self.lease_seconds))
+                return lease_id
+            finally:
+                connection.execute("COMMIT")
+
+    def _release(self, lease_id: str) -> None:
+        with contextlib.closing(_sqlite_connect(self.path)) as connection:
+            connection.execute("DELETE FROM llm_slots WHERE id = ?", (lease_id,))
+
+    async def try_acquire(self) -> Optional[str]:
+        return await asyncio.to_thread(self._try_acquire)
+
+    async def release(self, lease_id: str) -> None:
+        await asyncio.to_thread(self._release, lease_id)
+
+class LLMConcurrencyLimiter:
+    """
+    At most max_concurrency LLM turns at once per process (and host-wide with shared leases),
+    at most max_queue waiting for a slot, none waiting longer than queue_timeout.
+    """
+
+    # How often a waiter polls the shared leases
+    _SHARED_POLL_SECONDS = 0.05
+
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float, shared: Optional[SQLiteSlotLeases] = None):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.shared = shared
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.total_wait_seconds = 0.0
+        # Moving average of how long a turn holds its slot, for Retry-After
+        self._hold_seconds = 1.0
+
+    def retry_after(self) -> int:
+        # Roughly how long until the current queue has drained through the slots
+        backlog = (self.waiting + 1) / max(self.max_concurrency, 1)
+        return max(1, math.ceil(backlog * self._hold_seconds))
+
+    def stats(self) -> dict:
+        return {
+            "backend": "sqlite" if self.shared else "memory",
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "avg_wait_ms": round(1000 * self.total_wait_seconds / self.admitted, 2) if self.admitted else 0.0,
+            "avg_hold_ms": round(1000 * self._hold_seconds, 2),
+        }
+
+    async def _acquire_shared(self, deadline: float) -> str:
+        while True:
+            lease_id = await self.shared.try_acquire()
+            if lease_id is not None:
+                return lease_id
+            if time.monotonic() >= deadline:
+                raise asyncio.TimeoutError
+            await asyncio.sleep(self._SHARED_POLL_SECONDS)
+
+    async def acquire(self) -> "LLMSlot":
+        """Wait for a slot, or raise AdmissionRejected (503) if the queue is full or the wait times out."""
+        if self.waiting >= self.max_queue and (self._semaphore.locked() or self.shared):
+            self.rejected_queue_full += 1
+            raise AdmissionRejected(503, self.retry_after(), "The assistant is busy, please retry shortly")
+
+        started = time.monotonic()
+        deadline = started + self.queue_timeout
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            try:
+                lease_id = await self._acquire_shared(deadline) if self.shared else None
+            except BaseException:
+                self._semaphore.release()
+                raise
+        except asyncio.TimeoutError:
+            self.rejected_timeout += 1
+            raise AdmissionRejected(503, self.retry_after(), "The assistant is busy, please retry shortly")
+        finally:
+            self.waiting -= 1
+
+        now = time.monotonic()
+        self.active += 1
+        self.admitted += 1
+        self.total_wait_seconds += now - started
+        return LLMSlot(self, lease_id, now)
+
+    async def _release(self, slot: "LLMSlot") -> None:
+        self.active -= 1
+        self._hold_seconds = 0.9 * self._hold_seconds + 0.1 * (time.monotonic() - slot.acquired_at)
+        self._semaphore.release()
+        if slot.lease_id is not None:
+            await self.shared.release(slot.lease_id)
+
+    @contextlib.asynccontextmanager
+    async def slot(self) -> AsyncIterator["LLMSlot"]:
+        slot = await self.acquire()
+        try:
+            yield slot
+        finally:
+            await slot.release()
+
+class LLMSlot:
+    """A held LLM slot; release() is idempotent so cleanup paths can call it freely."""
+
+    def __init__(self, limiter: LLMConcurrencyLimiter, lease_id: Optional[str], acquired_at: float):
+        self._limiter = limiter
+        self.lease_id = lease_id
+        self.acquired_at = acquired_at
+        self._released = False
+
+    async def release(self) -> None:
+        if not self._released:
+            self._released = True
+            await self._limiter._release(self)
+
+def _take_token(tokens: float, updated_at: float, now: float, rate: float, burst: float):
+    """Refill a bucket to now and try to take one token. Returns (tokens, seconds to wait or 0)."""
+    tokens = min(burst, tokens + (now - updated_at) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / rate
+
+class MemoryTokenBuckets:
+    """Per-process buckets; idle ones expire once they would have refilled anyway."""
+
+    def __init__(self, rate: float, burst: float, maxsize: int = 100_000):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = TTLCache(maxsize=maxsize, ttl=burst / rate)
+
+    async def take(self, key: str) -> float:
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(key, (self.burst, now))
+        tokens, wait = _take_token(tokens, updated_at, now, self.rate, self.burst)
+        self._buckets.set(key, (tokens, now))
+        return wait
+
+class SQLiteTokenBuckets:
+    """Buckets shared by every worker on the host through one SQLite file."""
+
+    def __init__(self, path: str, rate: float, burst: float):
+        self.path = path
+        self.rate = rate
+        self.burst = burst
+        with contextlib.closing(_sqlite_connect(path)) as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limit_buckets "
+                "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    def _take(self, key: str) -> float:
+        now = time.time()
+        with contextlib.closing(_sqlite_connect(self.path)) as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = connection.execute("SELECT tokens, updated_at FROM rate_limit_buckets WHERE key = ?", (key,)).fetchone()
+                tokens, wait = _take_token(*(row or (self.burst, now)), now, self.rate, self.burst)
+                connection.execute(
+                    "INSERT OR REPLACE INTO rate_limit_buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                    (key, tokens, now)
+                )
+                # Full buckets carry no information
+                connection.execute("DELETE FROM rate_limit_buckets WHERE updated_at < ?", (now - self.burst / self.rate,))
+            finally:
+                connection.execute("COMMIT")
+        return wait
+
+    async def take(self, key: str) -> float:
+        return await asyncio.to_thread(self._take, key)
+
+class ChatRateLimiter:
+    """Per-user token bucket: CHAT_RATE_LIMIT_BURST requests at once, refilled at CHAT_RATE_LIMIT_PER_MINUTE."""
+
+    def __init__(self, buckets, enabled: bool = True):
+        self.buckets = buckets
+        self.enabled = enabled
+        self.allowed = 0
+        self.limited = 0
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "backend": type(self.buckets).__name__,
+            "allowed": self.allowed,
+            "limited": self.limited,
+        }
+
+    async def check(self, user_id: str) -> None:
+        """Take a token for user_id, or raise AdmissionRejected (429)."""
+        if not self.enabled:
+            return
+        wait = await self.buckets.take(user_id)
+        if wait > 0:
+            self.limited += 1
+            raise AdmissionRejected(429, max(1, math.ceil(wait)), "Too many chat requests, please slow down")
+        self.allowed += 1
+
+def make_llm_limiter() -> LLMConcurrencyLimiter:
+    shared = None
+    if ADMISSION_BACKEND == "sqlite":
+        shared = SQLiteSlotLeases(ADMISSION_SQLITE_PATH, LLM_MAX_CONCURRENCY, LLM_SLOT_LEASE_SECONDS)
+    return LLMConcurrencyLimiter(LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE, LLM_QUEUE_TIMEOUT_SECONDS, shared)
+
+def make_chat_rate_limiter() -> ChatRateLimiter:
+    rate = CHAT_RATE_LIMIT_PER_MINUTE / 60
+    if ADMISSION_BACKEND == "sqlite":
+        buckets = SQLiteTokenBuckets(ADMISSION_SQLITE_PATH, rate, CHAT_RATE_LIMIT_BURST)
+    else:
+        buckets = MemoryTokenBuckets(rate, CHAT_RATE_LIMIT_BURST)
+    return ChatRateLimiter(buckets, enabled=CHAT_RATE_LIMIT_ENABLED)
@@ -0,0 +1,88 @@
+import logging
+import os
+from typing import Dict, List, Optional
+
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app import crud
+from app.models import Conversation, Message
+
+logger = logging.getLogger(__name__)
+
+# The most recent messages are sent to Gemini verbatim while they fit in both limits below;
+# older ones are folded into Conversation.summary so the prompt size stays roughly constant.
+CHAT_CONTEXT_MAX_MESSAGES = int(os.getenv("CHAT_CONTEXT_MAX_MESSAGES", "20"))
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "4000"))
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token; close enough for budgeting without a count_tokens round-trip
+    return len(text or "") // 4 + 4
+
+def select_recent_window(messages: List[Message], token_budget: int, max_messages: int) -> int:
+    """
+    Return the index where the verbatim window starts: the longest suffix of `messages`
+    within both limits. The newest message is always included.
+    """
+    start = len(messages)
+    used = 0
+    while start > 0 and len(messages) - start < max_messages:
+        cost = estimate_tokens(messages[start - 1].content)
+        if used + cost > token_budget and start < len(messages):
+            break
+        used += cost
+        start -= 1
+    return start
+
+async def build_chat_context(
+    session: AsyncSession,
+    conversation: Conversation,
+    gemini_service,
+    up_to_message_id: Optional[int] = None
+) -> List[Dict[str, str]]:
+    """
+    Build the role/content message list for a chat turn. Expects the new user message
+    to already be saved, so it is the last message of the conversation, or the one
+    given as up_to_message_id (queued chat jobs, where later messages may exist).
+    """
+    # Only messages not yet covered by the rolling summary are loaded
+    messages = await crud.get_messages_after(session, conversation.id, conversation.summary_message_id)
+    if up_to_message_id is not None:
+        messages = [msg for msg in messages if msg.id <= up_to_message_id]
+    # End the read transaction so the pooled connection isn't held while waiting on Gemini.
+    # A unit of work keeps its transaction (and connection) open until the turn commits.
+    if not crud.in_unit_of_work(session):
+        await session.commit()
+
+    summary = conversation.summary
+    budget = max(CHAT_CONTEXT_TOKEN_BUDGET - (estimate_tokens(summary) if summary else 0), 0)
+    start = select_recent_window(messages, budget, CHAT_CONTEXT_MAX_MESSAGES)
+
+    if start > 0:
+        # Fold the overflow plus the older half of the window, so the summary is refreshed
+        # every few turns rather than on every turn once the conversation is long
+        fold_end = start + (len(messages) - start) // 2
+        folded = messages[:fold_end]
+        try:
+            summary = await gemini_service.summarize_conversation(
+                summary,
+                [{"role": msg.role, "content": msg.content} for msg in folded]
+            )
+            await crud.update_conversation_summary(session, conversation, summary, folded[-1].id)
+            start = fold_end
+        except Exception:
+            # Keep going with the stale summary; the overflow is simply left out of this turn
+            logger.exception("Error updating conversation summary")
+            summary = conversation.summary
+
+    context = []
+    if summary:
+        context.append({
+            "role": "user",
+            "content": f"Summary of our earlier conversation:\n{summary}"
+        })
+    for msg in messages[start:]:
+        context.append({
+            "role": msg.role,
+            "content": msg.content
+        })
+    return context
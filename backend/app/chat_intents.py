@@ -0,0 +1,131 @@
+import json
+import os
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.gemini_service import ChatTurn
+from app.task_mcp_tools import execute_tool_call
+
+# Short, unambiguous task commands ("add buy milk", "complete 12", "delete task 3",
+# "show pending tasks") are run directly against the task tools with a templated reply,
+# skipping the two Gemini round-trips a tool call otherwise costs. Anything that does
+# not match a pattern exactly goes to Gemini as before.
+CHAT_FAST_PATH_ENABLED = os.getenv("CHAT_FAST_PATH_ENABLED", "true").lower() in ("1", "true", "yes")
+CHAT_FAST_PATH_MAX_TITLE_LENGTH = 80
+
+_TASK_REF = r"(?:task\s+)?#?(?P<task_id>\d+)"
+_PATTERNS = [
+    ("add_task", re.compile(r"(?:add|create)(?:\s+a)?(?:\s+new)?(?:\s+task)?\s*:?\s+(?P<title>.+)", re.IGNORECASE)),
+    ("complete_task", re.compile(rf"(?:complete|finish|check\s+off)\s+{_TASK_REF}", re.IGNORECASE)),
+    ("complete_task", re.compile(rf"mark\s+{_TASK_REF}\s+(?:as\s+)?(?:done|complete|completed)", re.IGNORECASE)),
+    ("delete_task", re.compile(rf"(?:delete|remove)\s+{_TASK_REF}", re.IGNORECASE)),
+    ("list_tasks", re.compile(
+        r"(?:show|list|view)(?:\s+me)?(?:\s+(?:my|the))?(?:\s+(?P<status>all|pending|open|completed|done))?\s+tasks",
+        re.IGNORECASE,
+    )),
+]
+_STATUS_ALIASES = {None: "all", "open": "pending", "done": "completed"}
+# Titles that may hold several tasks, a question, a reminder or a date are left to the model
+_AMBIGUOUS_TITLE = re.compile(
+    r"\?|,|;|\b(?:and|then|remind(?:er|ers)?)\b|^(?:called|named|titled)\b"
+    r"|\b(?:today|tonight|tomorrow|yesterday|noon|midnight|next|every|due|until|before)\b"
+    r"|\b(?:mon|tues|wednes|thurs|fri|satur|sun)day\b"
+    r"|\b(?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\.?\s+\d"
+    r"|\b\d{1,4}[/.-]\d{1,2}(?:[/.-]\d{1,4})?\b"
+    r"|\b\d{1,2}(?::\d{2})?\s*(?:am|pm)\b|\b\d{1,2}:\d{2}\b",
+    re.IGNORECASE,
+)
+# "add task", "add a new task": no title at all, so the model asks for one
+_FILLER_TITLE = re.compile(r"(?:(?:a|an|the|new|task|todo|item)\b\s*)+", re.IGNORECASE)
+
+@dataclass
+class LocalIntent:
+    tool_name: str
+    arguments: Dict[str, Any]
+
+class FastPathStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.tool_errors = 0
+
+    def snapshot(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "tool_errors": self.tool_errors,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+fast_path_stats = FastPathStats()
+
+def parse_intent(message: str) -> Optional[LocalIntent]:
+    """Map a message to a single tool call, or None if it isn't a plain task command."""
+    text = " ".join(message.split()).rstrip(".!")
+    for tool_name, pattern in _PATTERNS:
+        match = pattern.fullmatch(text)
+        if not match:
+            continue
+        if tool_name == "add_task":
+            title = match["title"].strip()
+            if (
+                len(title) > CHAT_FAST_PATH_MAX_TITLE_LENGTH
+                or _FILLER_TITLE.fullmatch(title)
+                or _AMBIGUOUS_TITLE.search(title)
+            ):
+                return None
+            return LocalIntent(tool_name, {"title": title})
+        if tool_name == "list_tasks":
+            status = match["status"] and match["status"].lower()
+            return LocalIntent(tool_name, {"status": _STATUS_ALIASES.get(status, status)})
+        return LocalIntent(tool_name, {"task_id": int(match["task_id"])})
+    return None
+
+def format_reply(intent: LocalIntent, result: Any) -> str:
+    if isinstance(result, dict) and "error" in result:
+        return f"{result['error']}."
+    if intent.tool_name == "add_task":
+        return f"Added \"{result['title']}\" as task #{result['task_id']}."
+    if intent.tool_name == "complete_task":
+        return f"Marked task #{result['task_id']} \"{result['title']}\" as complete."
+    if intent.tool_name == "delete_task":
+        return f"Deleted task #{result['task_id']} \"{result['title']}\"."
+
+    status = intent.arguments["status"]
+    label = "" if status == "all" else f"{status} "
+    if result and "error" in result[0]:
+        return f"{result[0]['error']}."
+    if not result:
+        return f"You have no {label}tasks."
+    lines = [f"- #{task['id']} {task['title']}" + (" (done)" if task["completed"] else "") for task in result]
+    return f"Your {label}tasks:\n" + "\n".join(lines)
+
+def is_fast_path_command(message: str) -> bool:
+    """Whether try_fast_path will answer this message without Gemini."""
+    return CHAT_FAST_PATH_ENABLED and parse_intent(message) is not None
+
+async def try_fast_path(message: str, db_session: AsyncSession, user_id: str) -> Optional[ChatTurn]:
+    """
+    Run a recognised task command locally. Returns the turn in the same shape
+    chat_with_function_calling does, or None to fall back to Gemini.
+    """
+    if not CHAT_FAST_PATH_ENABLED:
+        return None
+    intent = parse_intent(message)
+    if intent is None:
+        fast_path_stats.misses += 1
+        return None
+
+    fast_path_stats.hits += 1
+    result = await execute_tool_call(intent.tool_name, json.dumps(intent.arguments), db_session, user_id)
+    if isinstance(result, dict) and "error" in result:
+        fast_path_stats.tool_errors += 1
+    step = {
+        "calls": [{"name": intent.tool_name, "arguments": intent.arguments}],
+        "responses": [{"name": intent.tool_name, "response": result}],
+    }
+    return ChatTurn(text=format_reply(intent, result), steps=[step])
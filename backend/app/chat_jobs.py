@@ -0,0 +1,243 @@
+import asyncio
+import contextlib
+import logging
+import os
+from typing import Awaitable, Callable, List, Optional
+
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app import crud
+from app.admission import AdmissionRejected, make_llm_limiter
+from app.chat_context import build_chat_context
+from app.chat_intents import try_fast_path
+from app.database import WRITER_KEY, async_session_factory, ensure_schema
+from app.gemini_service import GeminiAIService
+from app.llm_cache import CachedGeminiService, LLM_CACHE_ENABLED
+from app.models import ChatJob, Conversation, Message
+from app.task_events import task_event_bus
+
+logger = logging.getLogger(__name__)
+
+# Job mode for POST /chat: a request sent with "Prefer: respond-async" saves the user's
+# message, queues the turn in the chat_jobs table and gets 202 with the job id. Workers
+# claim queued jobs from the table and run the turns; clients poll (or long-poll with
+# ?wait=) GET /chat/jobs/{id} for the result. Workers run inside the web process
+# (CHAT_JOB_IN_PROCESS_WORKERS) and/or as separate processes (python -m app.chat_jobs),
+# so the web tier and the LLM tier can be scaled apart.
+CHAT_JOBS_ENABLED = os.getenv("CHAT_JOBS_ENABLED", "false").lower() in ("1", "true", "yes")
+CHAT_JOB_IN_PROCESS_WORKERS = int(os.getenv("CHAT_JOB_IN_PROCESS_WORKERS", "2"))
+# Concurrent turns per standalone worker process
+CHAT_JOB_CONCURRENCY = int(os.getenv("CHAT_JOB_CONCURRENCY", "4"))
+# A job whose worker died is claimed again once its lease lapses, up to CHAT_JOB_MAX_ATTEMPTS times.
+# The worker running a job renews its lease every CHAT_JOB_LEASE_RENEW_SECONDS.
+CHAT_JOB_LEASE_SECONDS = float(os.getenv("CHAT_JOB_LEASE_SECONDS", "300"))
+CHAT_JOB_LEASE_RENEW_SECONDS = float(os.getenv("CHAT_JOB_LEASE_RENEW_SECONDS", str(CHAT_JOB_LEASE_SECONDS / 3)))
+CHAT_JOB_MAX_ATTEMPTS = int(os.getenv("CHAT_JOB_MAX_ATTEMPTS", "3"))
+# How often idle workers (and long-polling clients) look at the table again
+CHAT_JOB_POLL_INTERVAL_SECONDS = float(os.getenv("CHAT_JOB_POLL_INTERVAL_SECONDS", "1"))
+CHAT_JOB_WAIT_MAX_SECONDS = float(os.getenv("CHAT_JOB_WAIT_MAX_SECONDS", "30"))
+
+FINISHED_STATUSES = ("succeeded", "failed")
+
+# Wakes this process's idle workers when a job is queued here, instead of waiting for their next poll
+_job_queued: Optional[asyncio.Event] = None
+
+def _job_queued_event() -> asyncio.Event:
+    global _job_queued
+    if _job_queued is None:
+        _job_queued = asyncio.Event()
+    return _job_queued
+
+def notify_chat_job_queued() -> None:
+    _job_queued_event().set()
+
+async def _renew_lease(job_id: int, attempt: int) -> None:
+    # Own session: the turn's session is busy with the turn
+    while True:
+        await asyncio.sleep(CHAT_JOB_LEASE_RENEW_SECONDS)
+        try:
+            async with async_session_factory() as session:
+                await crud.renew_chat_job_lease(session, job_id, attempt, CHAT_JOB_LEASE_SECONDS)
+        except crud.ChatJobLeaseLost:
+            # finish_chat_job will find out too and discard the turn
+            logger.warning("Chat job %s lost its lease", job_id)
+            return
+        except Exception:
+            logger.exception("Error renewing chat job %s lease", job_id)
+
+@contextlib.asynccontextmanager
+async def _lease_renewal(job_id: int, attempt: int):
+    renewal = asyncio.create_task(_renew_lease(job_id, attempt))
+    try:
+        yield
+    finally:
+        renewal.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await renewal
+
+async def run_chat_job(session: AsyncSession, job: ChatJob, gemini_service, llm_limiter=None) -> None:
+    """
+    Run a claimed job's turn, save the assistant message and finish the job, renewing its
+    lease meanwhile. Raises AdmissionRejected, with the job back in the queue, if no LLM
+    slot frees up in time, and crud.ChatJobLeaseLost, with nothing saved, if another worker
+    took the job over.
+    """
+    # The claim: job.attempts is reloaded below, and may be another worker's by then
+    attempt = job.attempts
+    async with _lease_renewal(job.id, attempt):
+        await _run_chat_turn(session, job, attempt, gemini_service, llm_limiter)
+
+async def _run_chat_turn(session: AsyncSession, job: ChatJob, attempt: int, gemini_service, llm_limiter) -> None:
+    # Pins the user to the primary once the turn's writes commit (see app.read_replica)
+    session.info[WRITER_KEY] = job.user_id
+    conversation = await session.get(Conversation, job.conversation_id)
+    user_message = await session.get(Message, job.user_message_id)
+    try:
+        # The whole turn is one transaction, ended by finish_chat_job: if the lease was lost
+        # meanwhile, the tool calls' task writes are rolled back along with the reply, and the
+        # worker that took the job over doesn't find them already applied
+        async with crud.unit_of_work(session):
+            chat_turn = await try_fast_path(user_message.content, session, job.user_id)
+            if chat_turn is None:
+                if gemini_service is None:
+                    raise RuntimeError("Chat assistant is not configured")
+                async with llm_limiter.slot() if llm_limiter else contextlib.nullcontext():
+                    # Messages queued after this one are left out of its context
+                    gemini_messages = await build_chat_context(session, conversation, gemini_service, job.user_message_id)
+                    chat_turn = await gemini_service.chat_with_function_calling(
+                        messages=gemini_messages,
+                        db_session=session,
+                        user_id=job.user_id
+                    )
+            if chat_turn.error:
+                # Don't commit the tool writes of a turn that failed part-way
+                raise RuntimeError(chat_turn.error)
+
+            assistant_message = await crud.create_message(
+                session,
+                conversation_id=job.conversation_id,
+                role="assistant",
+                content=chat_turn.text,
+                tool_calls=chat_turn.tool_calls,
+                tool_responses=chat_turn.tool_responses
+            )
+            await crud.finish_chat_job(session, job, attempt, "succeeded", assistant_message.id, response=chat_turn.text)
+    except crud.ChatJobLeaseLost:
+        await session.rollback()
+        raise
+    except AdmissionRejected:
+        # Anything the turn wrote was rolled back with it
+        await session.rollback()
+        await session.refresh(job)
+        await crud.release_chat_job(session, job, attempt)
+        raise
+    except Exception as e:
+        await session.rollback()
+        await session.refresh(job)
+        error_message = f"Sorry, I encountered an error processing your request: {str(e)}"
+        async with crud.unit_of_work(session):
+            assistant_message = await crud.create_message(
+                session,
+                conversation_id=job.conversation_id,
+                role="assistant",
+                content=error_message
+            )
+            await crud.finish_chat_job(session, job, attempt, "failed", assistant_message.id, response=error_message, error=str(e))
+
+async def wait_for_chat_job(session: AsyncSession, job_id: int, user_id: str, timeout: float) -> Optional[ChatJob]:
+    """The job, once finished or after timeout seconds, whichever is first. None if it doesn't exist."""
+    deadline = asyncio.get_running_loop().time() + timeout
+    while True:
+        job = await crud.get_chat_job(session, job_id, user_id)
+        # Don't hold the connection between polls
+        await session.commit()
+        if job is None or job.status in FINISHED_STATUSES or asyncio.get_running_loop().time() >= deadline:
+            return job
+        await asyncio.sleep(min(CHAT_JOB_POLL_INTERVAL_SECONDS, max(deadline - asyncio.get_running_loop().time(), 0)))
+
+class ChatJobWorkerPool:
+    """concurrency workers, each claiming and running one job at a time until cancelled."""
+
+    def __init__(self, concurrency: int, get_gemini_service: Callable[[], Awaitable[Optional[object]]], llm_limiter=None):
+        self.concurrency = concurrency
+        self.get_gemini_service = get_gemini_service
+        self.llm_limiter = llm_limiter
+        self.busy = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.requeued = 0
+        self.lease_lost = 0
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.concurrency,
+            "busy": self.busy,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "requeued": self.requeued,
+            "lease_lost": self.lease_lost,
+        }
+
+    async def _run_next(self) -> bool:
+        """Claim and run one job. Returns False when the queue had nothing runnable."""
+        # Already done unless FAST_COLD_START deferred it
+        await ensure_schema()
+        async with async_session_factory() as session:
+            job = await crud.claim_chat_job(session, CHAT_JOB_LEASE_SECONDS, CHAT_JOB_MAX_ATTEMPTS)
+            if job is None:
+                return False
+            self.busy += 1
+            try:
+                await run_chat_job(session, job, await self.get_gemini_service(), self.llm_limiter)
+            except crud.ChatJobLeaseLost as e:
+                # Another worker has the job now; its result is the one kept
+                self.lease_lost += 1
+                logger.warning("%s", e)
+                return True
+            finally:
+                self.busy -= 1
+            if job.status == "succeeded":
+                self.succeeded += 1
+            else:
+                self.failed += 1
+            return True
+
+    async def _worker(self) -> None:
+        job_queued = _job_queued_event()
+        while True:
+            try:
+                if await self._run_next():
+                    continue
+            except AdmissionRejected as e:
+                # Web requests hold every LLM slot; back off before claiming again
+                self.requeued += 1
+                await asyncio.sleep(e.retry_after)
+                continue
+            except Exception:
+                logger.exception("Error in chat job worker")
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(job_queued.wait(), CHAT_JOB_POLL_INTERVAL_SECONDS)
+            job_queued.clear()
+
+    def start(self) -> List[asyncio.Task]:
+        return [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+async def run_worker_process(concurrency: int) -> None:
+    """Entry point of a standalone worker process."""
+    await ensure_schema()
+    # Relays task changes made by tool calls to sockets held by the web workers
+    await task_event_bus.start()
+    gemini_service = GeminiAIService()
+    if LLM_CACHE_ENABLED:
+        gemini_service = CachedGeminiService(gemini_service)
+
+    async def get_gemini_service():
+        return gemini_service
+
+    pool = ChatJobWorkerPool(concurrency, get_gemini_service, make_llm_limiter())
+    logger.info("Chat job worker running %d workers", concurrency)
+    await asyncio.gather(*pool.start())
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_worker_process(CHAT_JOB_CONCURRENCY))
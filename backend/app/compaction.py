@@ -0,0 +1,92 @@
+import asyncio
+import contextlib
+import datetime
+import logging
+import os
+from typing import Awaitable, Callable, Optional
+
+from app import crud
+from app.admission import AdmissionRejected
+from app.database import async_session_factory
+from app.models import Conversation
+
+logger = logging.getLogger(__name__)
+
+# Conversations with no new message for MESSAGE_COMPACTION_INACTIVE_DAYS are summarised into
+# Conversation.summary and their messages moved to one compressed MessageArchive row, which
+# keeps the messages table (and its index) to recently active conversations.
+# Reading a conversation rehydrates the archive; chatting in it again continues from the summary.
+# Opt-in with MESSAGE_COMPACTION_ENABLED=true: it changes how existing conversations are stored
+# and each summary is a billed Gemini call.
+MESSAGE_COMPACTION_ENABLED = os.getenv("MESSAGE_COMPACTION_ENABLED", "false").lower() in ("1", "true", "yes")
+MESSAGE_COMPACTION_INACTIVE_DAYS = float(os.getenv("MESSAGE_COMPACTION_INACTIVE_DAYS", "30"))
+MESSAGE_COMPACTION_INTERVAL_SECONDS = float(os.getenv("MESSAGE_COMPACTION_INTERVAL_SECONDS", "3600"))
+MESSAGE_COMPACTION_BATCH_SIZE = int(os.getenv("MESSAGE_COMPACTION_BATCH_SIZE", "100"))
+
+async def compact_conversation(session, conversation_id: int, inactive_before: datetime.datetime, gemini_service, llm_limiter=None) -> int:
+    """Summarise and archive one conversation's messages. Returns how many were archived."""
+    conversation = await session.get(Conversation, conversation_id)
+    messages = await crud.get_messages_after(session, conversation_id, None) if conversation else []
+    # Release the connection while the summary is generated
+    await session.commit()
+    if not messages or messages[-1].created_at >= inactive_before:
+        return 0
+
+    summary = conversation.summary
+    unsummarised = [
+        msg for msg in messages
+        if conversation.summary_message_id is None or msg.id > conversation.summary_message_id
+    ]
+    if unsummarised:
+        if gemini_service is None:
+            # Archiving without a summary would drop these turns from the chat context
+            return 0
+        # Takes an LLM slot like a chat turn does, so compaction can't add to a burst
+        async with llm_limiter.slot() if llm_limiter else contextlib.nullcontext():
+            summary = await gemini_service.summarize_conversation(
+                summary,
+                [{"role": msg.role, "content": msg.content} for msg in unsummarised]
+            )
+
+    async with crud.unit_of_work(session):
+        conversation = await crud.lock_conversation(session, conversation_id)
+        if conversation is None:
+            return 0  # Another worker has it
+        live = await crud.get_messages_after(session, conversation_id, None)
+        if [msg.id for msg in live] != [msg.id for msg in messages]:
+            return 0  # A message arrived (or another worker archived) while summarising
+        await crud.archive_messages(session, conversation, live, summary)
+    return len(live)
+
+async def compact_inactive_conversations(gemini_service, inactive_days: float = None, batch_size: int = None, llm_limiter=None) -> int:
+    """One compaction pass over up to batch_size conversations. Returns the number of messages archived."""
+    inactive_days = MESSAGE_COMPACTION_INACTIVE_DAYS if inactive_days is None else inactive_days
+    batch_size = batch_size or MESSAGE_COMPACTION_BATCH_SIZE
+    inactive_before = datetime.datetime.utcnow() - datetime.timedelta(days=inactive_days)
+
+    archived = 0
+    async with async_session_factory() as session:
+        conversation_ids = await crud.get_inactive_conversation_ids(session, inactive_before, batch_size)
+        await session.commit()
+        for conversation_id in conversation_ids:
+            try:
+                archived += await compact_conversation(session, conversation_id, inactive_before, gemini_service, llm_limiter)
+            except AdmissionRejected:
+                # Chat turns are using every LLM slot; try again next pass
+                await session.rollback()
+                break
+            except Exception:
+                await session.rollback()
+                logger.exception("Error compacting conversation %s", conversation_id)
+    return archived
+
+async def run_compaction_loop(get_gemini_service: Callable[[], Awaitable[Optional[object]]], llm_limiter=None) -> None:
+    """Background task started by the app lifespan; runs a pass every MESSAGE_COMPACTION_INTERVAL_SECONDS."""
+    while True:
+        await asyncio.sleep(MESSAGE_COMPACTION_INTERVAL_SECONDS)
+        try:
+            archived = await compact_inactive_conversations(await get_gemini_service(), llm_limiter=llm_limiter)
+            if archived:
+                logger.info("Archived %d messages from inactive conversations", archived)
+        except Exception:
+            logger.exception("Error in message compaction")
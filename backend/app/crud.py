@@ -1,80 +1,484 @@
-from typing import List, Optional
-from sqlmodel import Session, select
-from app.models import User, Task, Conversation, Message
-from app.schemas import UserCreate, TaskCreate, TaskUpdate
-from app.security import get_password_hash
+from contextlib import asynccontextmanager
+import json
+import zlib
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, List, Optional, Tuple
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import aliased
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.models import User, Task, TaskChangeCounter, TaskTombstone, Conversation, Message, MessageArchive, ChatJob
+from app.schemas import UserCreate, TaskCreate, TaskUpdate, TaskBatchUpdateItem
+from app.security import hash_password_async
+from app.task_events import record_task_events
+from app.task_search import search_statement
 import datetime # Import datetime for utcnow
 
+# --- Unit of work ---
+# Write functions below commit their own transaction, unless they run inside unit_of_work(),
+# in which case they only flush and the whole block is committed (or rolled back) once.
+_UNIT_OF_WORK_KEY = "unit_of_work_depth"
+
+def in_unit_of_work(session: AsyncSession) -> bool:
+    return session.info.get(_UNIT_OF_WORK_KEY, 0) > 0
+
+@asynccontextmanager
+async def unit_of_work(session: AsyncSession, enabled: bool = True) -> AsyncIterator[AsyncSession]:
+    """
+    Run a block of CRUD calls as a single transaction: one commit when the block exits,
+    a rollback if it raises. Nested blocks join the outermost one.
+    """
+    if not enabled:
+        yield session
+        return
+    depth = session.info.get(_UNIT_OF_WORK_KEY, 0)
+    session.info[_UNIT_OF_WORK_KEY] = depth + 1
+    try:
+        yield session
+        if depth == 0:
+            await session.commit()
+    except BaseException:
+        if depth == 0:
+            await session.rollback()
+        raise
+    finally:
+        session.info[_UNIT_OF_WORK_KEY] = depth
+
+async def _save(session: AsyncSession, *instances: Any) -> None:
+    # Inside a unit of work, flushing is enough to get ids and surface constraint errors;
+    # otherwise commit and reload server-side values as before
+    if in_unit_of_work(session):
+        await session.flush()
+        return
+    await session.commit()
+    for instance in instances:
+        await session.refresh(instance)
+
 # --- User CRUD ---
-def get_user_by_email(session: Session, email: str) -> Optional[User]:
-    return session.exec(select(User).where(User.email == email)).first()
+async def get_user_by_email(session: AsyncSession, email: str) -> Optional[User]:
+    return (await session.exec(select(User).where(User.email == email))).first()
 
-def create_user(session: Session, user_create: UserCreate) -> User:
-    hashed_password = get_password_hash(user_create.password)
+async def create_user(session: AsyncSession, user_create: UserCreate) -> User:
+    # bcrypt is CPU-bound; it runs on the dedicated password-hashing pool
+    hashed_password = await hash_password_async(user_create.password)
     user = User(email=user_create.email, hashed_password=hashed_password)
     session.add(user)
-    session.commit()
-    session.refresh(user)
+    await _save(session, user)
+    return user
+
+async def update_user_password_hash(session: AsyncSession, user: User, hashed_password: str) -> User:
+    user.hashed_password = hashed_password
+    user.updated_at = datetime.datetime.utcnow()
+    session.add(user)
+    await _save(session)
     return user
 
 # --- Task CRUD ---
-def get_task_by_id_and_owner(session: Session, task_id: int, owner_id: str) -> Optional[Task]:
-    return session.exec(select(Task).where(Task.id == task_id, Task.owner_id == owner_id)).first()
+async def get_task_by_id_and_owner(session: AsyncSession, task_id: int, owner_id: str) -> Optional[Task]:
+    return (await session.exec(select(Task).where(Task.id == task_id, Task.owner_id == owner_id))).first()
+
+async def get_tasks_by_owner(session: AsyncSession, owner_id: str, completed: Optional[bool] = None) -> List[Task]:
+    statement = select(Task).where(Task.owner_id == owner_id)
+    if completed is not None:
+        statement = statement.where(Task.completed == completed)
+    return (await session.exec(statement.order_by(Task.id))).all()
+
+# Sort keys accepted by get_tasks_page; each is paired with Task.id as the keyset tiebreaker
+TASK_SORT_COLUMNS = {
+    "id": Task.id,
+    "updated_at": Task.updated_at,
+}
+
+async def get_tasks_page(
+    session: AsyncSession,
+    owner_id: str,
+    limit: Optional[int],
+    after: Optional[Tuple[Any, int]] = None,
+    completed: Optional[bool] = None,
+    updated_since: Optional[datetime.datetime] = None,
+    sort: str = "id",
+    descending: bool = False,
+) -> Tuple[List[Task], Optional[Tuple[Any, int]]]:
+    """
+    Keyset-paginated task listing. `after` is the (sort value, id) of the last row of the
+    previous page; returns the page and the key to pass as `after` for the next one (or None).
+    A limit of None returns every remaining task as one page.
+    """
+    sort_column = TASK_SORT_COLUMNS[sort]
+    statement = select(Task).where(Task.owner_id == owner_id)
+    if completed is not None:
+        statement = statement.where(Task.completed == completed)
+    if updated_since is not None:
+        statement = statement.where(Task.updated_at >= updated_since)
+
+    if after is not None:
+        after_value, after_id = after
+        if sort == "id":
+            statement = statement.where(Task.id < after_id if descending else Task.id > after_id)
+        else:
+            key = sa.tuple_(sort_column, Task.id)
+            bound = sa.tuple_(sa.literal(after_value, type_=sort_column.type), sa.literal(after_id))
+            statement = statement.where(key < bound if descending else key > bound)
+
+    if sort == "id":
+        ordering = [Task.id.desc() if descending else Task.id]
+    else:
+        ordering = [sort_column.desc(), Task.id.desc()] if descending else [sort_column, Task.id]
+
+    statement = statement.order_by(*ordering)
+    if limit is None:
+        return (await session.exec(statement)).all(), None
+    # Fetch one extra row to know whether another page exists
+    tasks = (await session.exec(statement.limit(limit + 1))).all()
+    if len(tasks) <= limit:
+        return tasks, None
+    tasks = tasks[:limit]
+    last = tasks[-1]
+    return tasks, (getattr(last, sort), last.id)
+
+async def search_tasks(
+    session: AsyncSession,
+    owner_id: str,
+    query: str,
+    limit: int,
+    offset: int = 0,
+) -> Tuple[List[Tuple[Task, float]], bool]:
+    """
+    Full-text search of owner_id's tasks, best match first. Returns (task, rank) pairs
+    and whether more results follow.
+    """
+    statement = search_statement(session.bind.dialect.name, owner_id, query)
+    if statement is None:
+        return [], False
+    rows = (await session.exec(statement.limit(limit + 1).offset(offset))).all()
+    return [(task, rank) for task, rank in rows[:limit]], len(rows) > limit
+
+async def next_task_change_seq(session: AsyncSession, owner_id: str) -> int:
+    """
+    Take the next value of owner_id's change sequence. The counter row stays locked until the
+    transaction ends, so the owner's task writes commit in change_seq order.
+    """
+    insert = postgresql.insert if session.bind.dialect.name == "postgresql" else sqlite.insert
+    # A new counter starts above the owner's existing tasks (backfilled with their ids)
+    start = (
+        select(sa.func.coalesce(sa.func.max(Task.change_seq), 0))
+        .where(Task.owner_id == owner_id)
+        .scalar_subquery()
+    )
+    statement = (
+        insert(TaskChangeCounter)
+        .values(owner_id=owner_id, last_seq=start + 1)
+        .on_conflict_do_update(
+            index_elements=[TaskChangeCounter.owner_id],
+            set_={"last_seq": TaskChangeCounter.last_seq + 1}
+        )
+        .returning(TaskChangeCounter.last_seq)
+    )
+    return (await session.exec(statement)).scalar_one()
+
+async def get_task_list_version(session: AsyncSession, owner_id: str) -> int:
+    """Version of owner_id's task list: the last change_seq taken, 0 before the first write."""
+    last_seq = (await session.exec(
+        select(TaskChangeCounter.last_seq).where(TaskChangeCounter.owner_id == owner_id)
+    )).first()
+    return last_seq or 0
 
-def get_tasks_by_owner(session: Session, owner_id: str) -> List[Task]:
-    return session.exec(select(Task).where(Task.owner_id == owner_id)).all()
+async def get_task_pruned_seq(session: AsyncSession, owner_id: str) -> int:
+    """Oldest watermark delta sync can still answer for owner_id: deletions up to it are gone."""
+    pruned_seq = (await session.exec(
+        select(TaskChangeCounter.pruned_seq).where(TaskChangeCounter.owner_id == owner_id)
+    )).first()
+    return pruned_seq or 0
 
-def create_task(session: Session, task_create: TaskCreate, owner_id: str) -> Task:
+async def prune_task_tombstones(session: AsyncSession, deleted_before: datetime.datetime) -> int:
+    """
+    Drop tombstones of tasks deleted before deleted_before, raising each affected owner's
+    pruned_seq to the last change_seq dropped. Returns how many were dropped. Commits.
+    """
+    pruned = (
+        select(TaskTombstone.change_seq)
+        .where(TaskTombstone.owner_id == TaskChangeCounter.owner_id, TaskTombstone.deleted_at < deleted_before)
+    )
+    # Tombstones are pruned oldest first, so the newest pruned change_seq only ever grows
+    await session.exec(
+        sa.update(TaskChangeCounter)
+        .where(pruned.exists())
+        .values(pruned_seq=pruned.with_only_columns(sa.func.max(TaskTombstone.change_seq)).scalar_subquery())
+        .execution_options(synchronize_session=False)
+    )
+    deleted = await session.exec(
+        sa.delete(TaskTombstone)
+        .where(TaskTombstone.deleted_at < deleted_before)
+        .execution_options(synchronize_session=False)
+    )
+    await session.commit()
+    return deleted.rowcount
+
+def _add_tombstones(session: AsyncSession, owner_id: str, task_ids: List[int], change_seq: int) -> None:
+    session.add_all([TaskTombstone(task_id=task_id, owner_id=owner_id, change_seq=change_seq) for task_id in task_ids])
+
+async def create_task(session: AsyncSession, task_create: TaskCreate, owner_id: str) -> Task:
     task_data = task_create.model_dump()
     task_data['owner_id'] = owner_id
+    task_data['change_seq'] = await next_task_change_seq(session, owner_id)
     task = Task(**task_data)
     session.add(task)
-    session.commit()
-    session.refresh(task)
+    record_task_events(session, owner_id, "created", [task])
+    await _save(session, task)
     return task
 
-def update_task(session: Session, db_task: Task, task_update: TaskUpdate) -> Task:
+async def update_task(session: AsyncSession, db_task: Task, task_update: TaskUpdate) -> Task:
     # Use task_update.model_dump(exclude_unset=True) to get only provided fields
     task_data = task_update.model_dump(exclude_unset=True)
-    
+
     # Update attributes of the db_task instance
     for key, value in task_data.items():
         setattr(db_task, key, value)
-    
+
     # Update updated_at timestamp
     db_task.updated_at = datetime.datetime.utcnow()
-    
+    db_task.change_seq = await next_task_change_seq(session, db_task.owner_id)
+
     session.add(db_task)
-    session.commit()
-    session.refresh(db_task)
+    record_task_events(session, db_task.owner_id, "updated", [db_task])
+    await _save(session, db_task)
     return db_task
 
-def delete_task(session: Session, db_task: Task):
-    session.delete(db_task)
-    session.commit()
+async def delete_task(session: AsyncSession, db_task: Task):
+    change_seq = await next_task_change_seq(session, db_task.owner_id)
+    await session.delete(db_task)
+    _add_tombstones(session, db_task.owner_id, [db_task.id], change_seq)
+    record_task_events(session, db_task.owner_id, "deleted", [db_task], change_seq)
+    await _save(session)
+
+# --- Bulk Task CRUD ---
+# Set-based statements, one commit per batch. Rows not owned by owner_id are ignored
+# and simply missing from the result. A batch shares one change_seq.
+
+async def bulk_create_tasks(session: AsyncSession, task_creates: List[TaskCreate], owner_id: str) -> List[Task]:
+    now = datetime.datetime.utcnow()
+    change_seq = await next_task_change_seq(session, owner_id)
+    rows = [
+        {**task_create.model_dump(), "owner_id": owner_id, "created_at": now, "updated_at": now, "change_seq": change_seq}
+        for task_create in task_creates
+    ]
+    # Multi-row INSERT ... RETURNING
+    tasks = (await session.scalars(sa.insert(Task).returning(Task, sort_by_parameter_order=True), rows)).all()
+    record_task_events(session, owner_id, "created", tasks)
+    await _save(session)
+    return list(tasks)
+
+async def bulk_update_tasks(session: AsyncSession, task_updates: List[TaskBatchUpdateItem], owner_id: str) -> List[Task]:
+    ids = [task_update.id for task_update in task_updates]
+    owned_ids = set((await session.exec(
+        select(Task.id).where(Task.owner_id == owner_id, Task.id.in_(ids))
+    )).all())
+
+    now = datetime.datetime.utcnow()
+    change_seq = await next_task_change_seq(session, owner_id) if owned_ids else None
+    rows = [
+        {**task_update.model_dump(exclude_unset=True), "id": task_update.id, "updated_at": now, "change_seq": change_seq}
+        for task_update in task_updates
+        if task_update.id in owned_ids
+    ]
+    if rows:
+        # ORM bulk UPDATE by primary key (executemany)
+        await session.exec(sa.update(Task), params=rows)
+    tasks = (await session.exec(
+        select(Task).where(Task.id.in_(owned_ids)).order_by(Task.id).execution_options(populate_existing=True)
+    )).all()
+    record_task_events(session, owner_id, "updated", tasks)
+    await _save(session)
+    return list(tasks)
+
+async def bulk_set_tasks_completed(session: AsyncSession, task_ids: List[int], owner_id: str, completed: bool = True) -> List[Task]:
+    change_seq = await next_task_change_seq(session, owner_id)
+    # UPDATE ... WHERE id IN (...) RETURNING
+    tasks = (await session.scalars(
+        sa.update(Task)
+        .where(Task.owner_id == owner_id, Task.id.in_(task_ids))
+        .values(completed=completed, updated_at=datetime.datetime.utcnow(), change_seq=change_seq)
+        .returning(Task)
+        .execution_options(populate_existing=True)
+    )).all()
+    record_task_events(session, owner_id, "updated", tasks)
+    await _save(session)
+    return sorted(tasks, key=lambda task: task.id)
+
+async def bulk_delete_tasks(session: AsyncSession, task_ids: List[int], owner_id: str) -> List[Task]:
+    change_seq = await next_task_change_seq(session, owner_id)
+    # DELETE ... WHERE id IN (...) RETURNING
+    tasks = (await session.scalars(
+        sa.delete(Task)
+        .where(Task.owner_id == owner_id, Task.id.in_(task_ids))
+        .returning(Task)
+    )).all()
+    _add_tombstones(session, owner_id, [task.id for task in tasks], change_seq)
+    record_task_events(session, owner_id, "deleted", tasks, change_seq)
+    await _save(session)
+    return sorted(tasks, key=lambda task: task.id)
+
+async def get_task_changes(
+    session: AsyncSession,
+    owner_id: str,
+    since: int,
+    limit: int,
+) -> Tuple[List[Task], List[TaskTombstone], int, bool]:
+    """
+    owner_id's tasks written and deleted after change_seq `since`, oldest first:
+    (tasks, tombstones, watermark, has_more). The watermark is the last change_seq
+    included; a page never splits the writes sharing one change_seq (a batch).
+    """
+    tasks = (await session.exec(
+        select(Task)
+        .where(Task.owner_id == owner_id, Task.change_seq > since)
+        .order_by(Task.change_seq, Task.id)
+        .limit(limit + 1)
+    )).all()
+    tombstones = (await session.exec(
+        select(TaskTombstone)
+        .where(TaskTombstone.owner_id == owner_id, TaskTombstone.change_seq > since)
+        .order_by(TaskTombstone.change_seq, TaskTombstone.id)
+        .limit(limit + 1)
+    )).all()
+    changes = sorted([*tasks, *tombstones], key=lambda change: change.change_seq)
+    if len(changes) <= limit:
+        watermark = changes[-1].change_seq if changes else since
+        return list(tasks), list(tombstones), watermark, False
+
+    # Stop before the first change_seq that doesn't fit completely
+    cut_seq = changes[limit].change_seq
+    kept = [change for change in changes if change.change_seq < cut_seq]
+    if not kept:
+        # A single batch bigger than limit: return all of it
+        tasks = (await session.exec(
+            select(Task).where(Task.owner_id == owner_id, Task.change_seq == cut_seq).order_by(Task.id)
+        )).all()
+        tombstones = (await session.exec(
+            select(TaskTombstone)
+            .where(TaskTombstone.owner_id == owner_id, TaskTombstone.change_seq == cut_seq)
+            .order_by(TaskTombstone.id)
+        )).all()
+        return list(tasks), list(tombstones), cut_seq, True
+    return (
+        [change for change in kept if isinstance(change, Task)],
+        [change for change in kept if isinstance(change, TaskTombstone)],
+        kept[-1].change_seq,
+        True,
+    )
 
 # --- Conversation CRUD ---
-def create_conversation(session: Session, user_id: str) -> Conversation:
+async def create_conversation(session: AsyncSession, user_id: str) -> Conversation:
     conversation = Conversation(user_id=user_id)
     session.add(conversation)
-    session.commit()
-    session.refresh(conversation)
+    await _save(session, conversation)
     return conversation
 
-def get_conversation_by_id(session: Session, conversation_id: int, user_id: str) -> Optional[Conversation]:
-    return session.exec(
+async def get_conversation_by_id(session: AsyncSession, conversation_id: int, user_id: str) -> Optional[Conversation]:
+    return (await session.exec(
         select(Conversation)
         .where(Conversation.id == conversation_id, Conversation.user_id == user_id)
-    ).first()
+    )).first()
 
-def get_conversations_by_user(session: Session, user_id: str) -> List[Conversation]:
-    return session.exec(
+async def get_conversations_by_user(session: AsyncSession, user_id: str) -> List[Conversation]:
+    return (await session.exec(
         select(Conversation)
         .where(Conversation.user_id == user_id)
-    ).all()
+    )).all()
+
+# Characters of the last message included in conversation list previews
+CONVERSATION_PREVIEW_CHARS = 120
+
+async def get_conversations_page(
+    session: AsyncSession,
+    user_id: str,
+    limit: Optional[int],
+    after: Optional[Tuple[Any, int]] = None,
+) -> Tuple[List[Any], Optional[Tuple[Any, int]]]:
+    """
+    A page of user_id's conversations (all of them if limit is None), most recently active
+    first, each row carrying its message count (live plus archived) and the role and start
+    of its last message.
+    One statement: the last live message and the last archive are outer-joined by an id found
+    with a correlated subquery (the portable form of a LATERAL join), and the counts are
+    correlated subqueries, all evaluated only for the rows on the page.
+    """
+    last_message = aliased(Message)
+    last_archive = aliased(MessageArchive)
+    last_message_id = (
+        select(sa.func.max(Message.id))
+        .where(Message.conversation_id == Conversation.id)
+        .correlate(Conversation)
+        .scalar_subquery()
+    )
+    last_archive_id = (
+        select(MessageArchive.id)
+        .where(MessageArchive.conversation_id == Conversation.id)
+        .order_by(MessageArchive.last_message_id.desc())
+        .limit(1)
+        .correlate(Conversation)
+        .scalar_subquery()
+    )
+    live_count = (
+        select(sa.func.count(Message.id))
+        .where(Message.conversation_id == Conversation.id)
+        .correlate(Conversation)
+        .scalar_subquery()
+    )
+    archived_count = (
+        select(sa.func.coalesce(sa.func.sum(MessageArchive.message_count), 0))
+        .where(MessageArchive.conversation_id == Conversation.id)
+        .correlate(Conversation)
+        .scalar_subquery()
+    )
+    statement = select(
+        Conversation.id,
+        Conversation.user_id,
+        Conversation.created_at,
+        Conversation.updated_at,
+        (live_count + archived_count).label("message_count"),
+        # Live messages are newer than archived ones
+        sa.case(
+            (last_message.id.is_not(None), last_message.role),
+            else_=last_archive.last_message_role
+        ).label("last_message_role"),
+        sa.case(
+            (last_message.id.is_not(None), sa.func.substr(last_message.content, 1, CONVERSATION_PREVIEW_CHARS)),
+            else_=last_archive.last_message_preview
+        ).label("last_message_preview"),
+    ).select_from(Conversation).outerjoin(
+        last_message, last_message.id == last_message_id
+    ).outerjoin(
+        last_archive, last_archive.id == last_archive_id
+    ).where(Conversation.user_id == user_id)
+
+    if after is not None:
+        after_updated_at, after_id = after
+        statement = statement.where(
+            sa.tuple_(Conversation.updated_at, Conversation.id)
+            < sa.tuple_(sa.literal(after_updated_at, type_=Conversation.updated_at.type), sa.literal(after_id))
+        )
+
+    statement = statement.order_by(Conversation.updated_at.desc(), Conversation.id.desc())
+    if limit is None:
+        return (await session.exec(statement)).all(), None
+    rows = (await session.exec(statement.limit(limit + 1))).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, (rows[-1].updated_at, rows[-1].id)
+
+async def update_conversation_summary(session: AsyncSession, conversation: Conversation, summary: str, summary_message_id: int) -> Conversation:
+    conversation.summary = summary
+    conversation.summary_message_id = summary_message_id
+    session.add(conversation)
+    await _save(session)
+    return conversation
 
 # --- Message CRUD ---
-def create_message(session: Session, conversation_id: int, role: str, content: str, tool_calls: dict = None, tool_responses: dict = None) -> Message:
+async def create_message(session: AsyncSession, conversation_id: int, role: str, content: str, tool_calls: dict = None, tool_responses: dict = None) -> Message:
     message_data = {
         'conversation_id': conversation_id,
         'role': role,
@@ -87,21 +491,298 @@ def create_message(session: Session, conversation_id: int, role: str, content: s
 
     message = Message(**message_data)
     session.add(message)
-    session.commit()
-    session.refresh(message)
+    # Conversation lists are ordered by last activity
+    await session.exec(
+        sa.update(Conversation)
+        .where(Conversation.id == conversation_id)
+        .values(updated_at=message.created_at)
+    )
+    await _save(session, message)
     return message
 
-def get_messages_by_conversation(session: Session, conversation_id: int) -> List[Message]:
-    return session.exec(
+async def get_messages_by_conversation(session: AsyncSession, conversation_id: int) -> List[Message]:
+    # Archived messages (see app.compaction) come first, rehydrated, followed by the live ones
+    archived = await get_archived_messages(session, conversation_id)
+    return archived + list((await session.exec(
         select(Message)
         .where(Message.conversation_id == conversation_id)
         .order_by(Message.created_at)
-    ).all()
+    )).all())
+
+_MESSAGE_COLUMNS = (
+    Message.id,
+    Message.conversation_id,
+    Message.role,
+    Message.content,
+    Message.created_at,
+    Message.tool_calls,
+    Message.tool_responses,
+)
+
+async def get_messages_page(
+    session: AsyncSession,
+    conversation_id: int,
+    limit: int,
+    before: Optional[Tuple[datetime.datetime, int]] = None,
+    after: Optional[Tuple[datetime.datetime, int]] = None,
+) -> Tuple[List[Any], bool]:
+    """
+    Up to limit messages in chronological order, as rows rather than ORM objects: the most
+    recent ones, or those just older than before / newer than after ((created_at, id) keys).
+    The flag says whether more messages remain in that direction.
+    """
+    key = sa.tuple_(Message.created_at, Message.id)
+    statement = select(*_MESSAGE_COLUMNS).where(Message.conversation_id == conversation_id)
+    if after is not None:
+        bound = sa.tuple_(sa.literal(after[0], type_=Message.created_at.type), sa.literal(after[1]))
+        statement = statement.where(key > bound).order_by(Message.created_at, Message.id)
+    else:
+        if before is not None:
+            bound = sa.tuple_(sa.literal(before[0], type_=Message.created_at.type), sa.literal(before[1]))
+            statement = statement.where(key < bound)
+        statement = statement.order_by(Message.created_at.desc(), Message.id.desc())
+    rows = list((await session.exec(statement.limit(limit + 1))).all())
+
+    # Archived messages (see app.compaction) are older than every live one: they are read
+    # only when the page reaches past the live messages
+    if after is not None:
+        older_live = (await session.exec(
+            select(Message.id).where(Message.conversation_id == conversation_id, key <= bound).limit(1)
+        )).first()
+        if older_live is None:
+            archived = await _get_archived_message_rows(session, conversation_id)
+            rows = [row for row in archived if (row.created_at, row.id) > after] + rows
+    elif len(rows) <= limit:
+        archived = await _get_archived_message_rows(session, conversation_id)
+        rows += [row for row in reversed(archived) if before is None or (row.created_at, row.id) < before]
 
-def get_latest_messages(session: Session, conversation_id: int, limit: int = 10) -> List[Message]:
-    return session.exec(
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return (rows if after is not None else rows[::-1]), has_more
+
+async def get_messages_after(session: AsyncSession, conversation_id: int, after_id: Optional[int] = None) -> List[Message]:
+    statement = select(Message).where(Message.conversation_id == conversation_id)
+    if after_id is not None:
+        statement = statement.where(Message.id > after_id)
+    return (await session.exec(statement.order_by(Message.id))).all()
+
+async def get_latest_messages(session: AsyncSession, conversation_id: int, limit: int = 10) -> List[Message]:
+    return (await session.exec(
         select(Message)
         .where(Message.conversation_id == conversation_id)
         .order_by(Message.created_at.desc())
         .limit(limit)
-    ).all()
+    )).all()
+
+# --- Message archive ---
+def pack_messages(messages: List[Message]) -> bytes:
+    return zlib.compress(json.dumps([
+        {
+            "id": msg.id,
+            "role": msg.role,
+            "content": msg.content,
+            "created_at": msg.created_at.isoformat(),
+            "tool_calls": msg.tool_calls,
+            "tool_responses": msg.tool_responses,
+        }
+        for msg in messages
+    ], default=str).encode())
+
+def unpack_messages(conversation_id: int, payload: bytes) -> List[Message]:
+    # Transient Message objects: never added to the session, so they can't be flushed back
+    return [
+        Message(
+            conversation_id=conversation_id,
+            **{**data, "created_at": datetime.datetime.fromisoformat(data["created_at"])}
+        )
+        for data in json.loads(zlib.decompress(payload))
+    ]
+
+async def get_archived_messages(session: AsyncSession, conversation_id: int) -> List[Message]:
+    archives = (await session.exec(
+        select(MessageArchive)
+        .where(MessageArchive.conversation_id == conversation_id)
+        .order_by(MessageArchive.first_message_id)
+    )).all()
+    return [msg for archive in archives for msg in unpack_messages(conversation_id, archive.payload)]
+
+async def _get_archived_message_rows(session: AsyncSession, conversation_id: int) -> List[Any]:
+    payloads = (await session.exec(
+        select(MessageArchive.payload)
+        .where(MessageArchive.conversation_id == conversation_id)
+        .order_by(MessageArchive.first_message_id)
+    )).all()
+    return [
+        SimpleNamespace(
+            conversation_id=conversation_id,
+            **{**data, "created_at": datetime.datetime.fromisoformat(data["created_at"])}
+        )
+        for payload in payloads
+        for data in json.loads(zlib.decompress(payload))
+    ]
+
+async def get_inactive_conversation_ids(session: AsyncSession, inactive_before: datetime.datetime, limit: int) -> List[int]:
+    """Conversations that still have live messages, none of them newer than inactive_before."""
+    return list((await session.exec(
+        select(Message.conversation_id)
+        .group_by(Message.conversation_id)
+        .having(sa.func.max(Message.created_at) < inactive_before)
+        .order_by(Message.conversation_id)
+        .limit(limit)
+    )).all())
+
+async def lock_conversation(session: AsyncSession, conversation_id: int) -> Optional[Conversation]:
+    # Postgres: another worker compacting the same conversation skips it instead of waiting.
+    # SQLite has no row locks; its single writer serialises compactions anyway.
+    return (await session.exec(
+        select(Conversation)
+        .where(Conversation.id == conversation_id)
+        .with_for_update(skip_locked=True)
+        .execution_options(populate_existing=True)
+    )).first()
+
+async def archive_messages(session: AsyncSession, conversation: Conversation, messages: List[Message], summary: Optional[str]) -> MessageArchive:
+    """Move `messages` (ordered by id) into one compressed archive row and record the summary covering them."""
+    archive = MessageArchive(
+        conversation_id=conversation.id,
+        first_message_id=messages[0].id,
+        last_message_id=messages[-1].id,
+        message_count=len(messages),
+        last_message_role=messages[-1].role,
+        last_message_preview=messages[-1].content[:CONVERSATION_PREVIEW_CHARS],
+        payload=pack_messages(messages),
+    )
+    session.add(archive)
+    await session.exec(
+        sa.delete(Message)
+        .where(Message.conversation_id == conversation.id, Message.id <= messages[-1].id)
+    )
+    conversation.summary = summary
+    conversation.summary_message_id = messages[-1].id
+    session.add(conversation)
+    await _save(session)
+    return archive
+
+# --- Chat jobs ---
+async def create_chat_job(session: AsyncSession, user_id: str, conversation_id: int, user_message_id: int) -> ChatJob:
+    job = ChatJob(user_id=user_id, conversation_id=conversation_id, user_message_id=user_message_id)
+    session.add(job)
+    await _save(session, job)
+    return job
+
+async def get_chat_job(session: AsyncSession, job_id: int, user_id: str) -> Optional[ChatJob]:
+    return (await session.exec(
+        select(ChatJob)
+        .where(ChatJob.id == job_id, ChatJob.user_id == user_id)
+        .execution_options(populate_existing=True)
+    )).first()
+
+async def claim_chat_job(session: AsyncSession, lease_seconds: float, max_attempts: int) -> Optional[ChatJob]:
+    """
+    Take the next runnable job: queued, or running with a lapsed lease, and the oldest
+    unfinished job of its conversation so each conversation's turns run in order.
+    Jobs that have used up max_attempts are marked failed instead. Commits.
+    """
+    now = datetime.datetime.utcnow()
+    earlier = aliased(ChatJob)
+    runnable = sa.or_(
+        ChatJob.status == "queued",
+        sa.and_(ChatJob.status == "running", ChatJob.locked_until < now),
+    )
+    while True:
+        # Postgres: workers skip rows another worker is claiming. SQLite has no row locks;
+        # the conditional UPDATE below settles races there.
+        job = (await session.exec(
+            select(ChatJob)
+            .where(
+                runnable,
+                ~sa.exists().where(
+                    earlier.conversation_id == ChatJob.conversation_id,
+                    earlier.id < ChatJob.id,
+                    earlier.status.in_(("queued", "running")),
+                ),
+            )
+            .order_by(ChatJob.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        )).first()
+        if job is None:
+            await session.commit()
+            return None
+        if job.attempts >= max_attempts:
+            job.status = "failed"
+            job.error = job.error or "The worker processing this message stopped"
+            job.updated_at = now
+            session.add(job)
+            await session.commit()
+            continue
+
+        claimed = await session.exec(
+            sa.update(ChatJob)
+            .where(ChatJob.id == job.id, runnable)
+            .values(
+                status="running",
+                attempts=ChatJob.attempts + 1,
+                locked_until=now + datetime.timedelta(seconds=lease_seconds),
+                updated_at=now,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+        if claimed.rowcount == 1:
+            await session.refresh(job)
+            return job
+
+class ChatJobLeaseLost(Exception):
+    """The job's lease lapsed and another worker claimed it (or it was failed) meanwhile."""
+
+async def _update_claimed_chat_job(session: AsyncSession, job_id: int, attempt: int, values: dict) -> None:
+    # Only while the job is still ours: running, under the attempt we claimed it with
+    values["updated_at"] = datetime.datetime.utcnow()
+    updated = await session.exec(
+        sa.update(ChatJob)
+        .where(ChatJob.id == job_id, ChatJob.status == "running", ChatJob.attempts == attempt)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    if updated.rowcount != 1:
+        raise ChatJobLeaseLost(f"Chat job {job_id} is no longer held by this worker")
+    await _save(session)
+
+async def renew_chat_job_lease(session: AsyncSession, job_id: int, attempt: int, lease_seconds: float) -> None:
+    """Push a running job's lease lapse back to lease_seconds from now. Raises ChatJobLeaseLost."""
+    locked_until = datetime.datetime.utcnow() + datetime.timedelta(seconds=lease_seconds)
+    await _update_claimed_chat_job(session, job_id, attempt, {"locked_until": locked_until})
+
+async def _finish_claimed_chat_job(session: AsyncSession, job: ChatJob, attempt: int, values: dict) -> ChatJob:
+    await _update_claimed_chat_job(session, job.id, attempt, values)
+    for name, value in values.items():
+        set_committed_value(job, name, value)
+    return job
+
+async def release_chat_job(session: AsyncSession, job: ChatJob, attempt: int) -> ChatJob:
+    """Put a job claimed under attempt back in the queue without counting the attempt. Raises ChatJobLeaseLost."""
+    return await _finish_claimed_chat_job(
+        session, job, attempt, {"status": "queued", "attempts": attempt - 1, "locked_until": None}
+    )
+
+async def finish_chat_job(
+    session: AsyncSession,
+    job: ChatJob,
+    attempt: int,
+    status: str,
+    assistant_message_id: Optional[int],
+    response: Optional[str] = None,
+    error: Optional[str] = None,
+) -> ChatJob:
+    """
+    Record the outcome of a job claimed under attempt. Raises ChatJobLeaseLost, writing
+    nothing, if the job isn't ours anymore.
+    """
+    return await _finish_claimed_chat_job(session, job, attempt, {
+        "status": status,
+        "assistant_message_id": assistant_message_id,
+        "response": response,
+        "error": error,
+        "locked_until": None,
+    })
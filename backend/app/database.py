@@ -1,10 +1,20 @@
-from sqlmodel import create_engine, SQLModel, Session
-from dotenv import load_dotenv
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from starlette.requests import HTTPConnection
+from typing import Optional
+import asyncio
+import hashlib
+import logging
 import os
 
-# Load environment variables from .env file
-load_dotenv()
+logger = logging.getLogger(__name__)
 
+# .env is loaded by the app package (app/__init__.py) before this runs
 DATABASE_URL = os.getenv("DATABASE_URL")
 
 if DATABASE_URL is None:
@@ -15,26 +25,172 @@ if not DATABASE_URL:
     # Raise an error if no database URL is provided
     raise ValueError("DATABASE_URL environment variable is not set. Please configure it in your deployment platform.")
 
-# Create the engine with connection pooling and SSL settings
-engine = create_engine(
-    DATABASE_URL,
-    echo=True,
-    pool_pre_ping=True,  # Verify connections before use
-    pool_recycle=300,    # Recycle connections after 5 minutes
-    connect_args={
-        "connect_timeout": 10,  # Connection timeout
+# Async drivers used for each backend: asyncpg for Postgres/Neon, aiosqlite for local runs
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+def to_async_url(database_url: str):
+    """Rewrite a plain/sync database URL so it uses the matching async driver."""
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"Unsupported database backend for async engine: {backend}")
+    url = url.set(drivername=ASYNC_DRIVERS[backend])
+
+    # asyncpg does not understand libpq's sslmode/channel_binding query parameters
+    if backend in ("postgresql", "postgres"):
+        query = dict(url.query)
+        sslmode = query.pop("sslmode", None)
+        query.pop("channel_binding", None)
+        if sslmode and sslmode != "disable":
+            query["ssl"] = sslmode
+        url = url.set(query=query)
+    return url
+
+ASYNC_DATABASE_URL = to_async_url(DATABASE_URL)
+
+def _connect_args(url) -> dict:
+    if url.get_backend_name() == "sqlite":
+        return {"timeout": 10}
+    return {
+        "timeout": 10,  # Connection timeout
         # For PostgreSQL/Neon, you might need to adjust SSL settings
-        # "sslmode": "require"  # Uncomment if needed
+        # "ssl": "require"  # Uncomment if needed
     }
+
+# Statement logging is for local debugging only; per-request SQL metrics come from app.sql_metrics
+SQL_ECHO = os.getenv("SQL_ECHO", "false").lower() in ("1", "true", "yes")
+
+# Create the async engine with connection pooling
+engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    echo=SQL_ECHO,
+    pool_pre_ping=True,  # Verify connections before use
+    pool_recycle=300,    # Recycle connections after 5 minutes
+    connect_args=_connect_args(ASYNC_DATABASE_URL),
 )
 
-from app.models import User
+# expire_on_commit=False so attributes stay readable after commit without an implicit (sync) refresh
+async_session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
-def create_db_and_tables():
+# Optional read replica (e.g. a Neon read-only compute) with its own pool. Read-only routes
+# reach it through app.read_replica.get_read_session; everything else stays on the primary.
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL") or None
+# Kept short so an unreachable replica costs little before reads fall back to the primary
+READ_REPLICA_CONNECT_TIMEOUT_SECONDS = float(os.getenv("READ_REPLICA_CONNECT_TIMEOUT_SECONDS", "2"))
+
+read_engine = None
+read_session_factory = None
+if DATABASE_READ_URL:
+    ASYNC_DATABASE_READ_URL = to_async_url(DATABASE_READ_URL)
+    read_engine = create_async_engine(
+        ASYNC_DATABASE_READ_URL,
+        echo=SQL_ECHO,
+        pool_pre_ping=True,
+        pool_recycle=300,
+        connect_args={**_connect_args(ASYNC_DATABASE_READ_URL), "timeout": READ_REPLICA_CONNECT_TIMEOUT_SECONDS},
+    )
+    read_session_factory = async_sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
+
+# Sessions handed to a request are tagged with its path's user_id, so that user can be
+# pinned to the primary once their write commits (see app.read_replica)
+WRITER_KEY = "writer_user_id"
+
+from app.models import User, SchemaVersion
+from app.task_search import ensure_task_search_index, TASK_SEARCH_LANGUAGE
+
+# Run once, right after the column is added to an existing table
+_COLUMN_BACKFILLS = {
+    # Existing tasks get distinct positions in their owner's change sequence; ids are unique and
+    # the owner's counter starts above them (see crud.next_task_change_seq)
+    ("task", "change_seq"): "UPDATE task SET change_seq = id",
+}
+
+def _upgrade_existing_tables(connection):
+    # create_all skips tables that already exist, so columns and indexes added to a model later need this.
+    # Only columns that are nullable or have a server default can be added to a populated table.
+    inspector = sa.inspect(connection)
+    preparer = connection.dialect.identifier_preparer
+    for table in SQLModel.metadata.sorted_tables:
+        existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns or not (column.nullable or column.server_default is not None):
+                continue
+            column_ddl = CreateColumn(column).compile(dialect=connection.dialect)
+            connection.execute(sa.text(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {column_ddl}"))
+            backfill = _COLUMN_BACKFILLS.get((table.name, column.name))
+            if backfill:
+                connection.execute(sa.text(backfill))
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+def schema_fingerprint() -> str:
+    """Hash of everything create_db_and_tables would create; changes whenever a model does."""
+    parts = [TASK_SEARCH_LANGUAGE, repr(sorted(_COLUMN_BACKFILLS.items()))]
+    for table in SQLModel.metadata.sorted_tables:
+        parts.append(table.name)
+        for column in table.columns:
+            server_default = str(column.server_default.arg) if column.server_default is not None else None
+            parts.append(f"{column.name}:{column.type!r}:{column.nullable}:{server_default}")
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            parts.append(f"{index.name}:{[column.name for column in index.columns]}:{index.unique}")
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+async def create_db_and_tables():
     """Create database tables based on SQLModel metadata."""
-    SQLModel.metadata.create_all(engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+        await conn.run_sync(_upgrade_existing_tables)
+        await conn.run_sync(ensure_task_search_index)
+        # Upsert: workers starting together may both get here
+        insert = postgresql.insert if conn.dialect.name == "postgresql" else sqlite.insert
+        statement = insert(SchemaVersion).values(id=1, fingerprint=schema_fingerprint())
+        await conn.execute(statement.on_conflict_do_update(
+            index_elements=[SchemaVersion.id],
+            set_={"fingerprint": statement.excluded.fingerprint, "applied_at": statement.excluded.applied_at},
+        ))
+
+async def _bring_schema_up_to_date():
+    # One query on a normal boot: the full create/upgrade pass (a round-trip per table,
+    # column and index) only runs when the models changed since it last ran
+    async with engine.connect() as conn:
+        try:
+            current = (await conn.execute(sa.select(SchemaVersion.fingerprint).where(SchemaVersion.id == 1))).scalar()
+        except sa.exc.DBAPIError:
+            current = None  # No schema_version table yet
+        if current == schema_fingerprint():
+            if conn.dialect.name == "sqlite":
+                # Local and cheap; also finds out whether this SQLite build has FTS5
+                await conn.run_sync(ensure_task_search_index)
+            return
+    logger.info("Database schema changed, running create_all and upgrades")
+    await create_db_and_tables()
+
+_schema_check: Optional[asyncio.Future] = None
+
+async def ensure_schema():
+    """
+    Bring the schema up to date, once per process. Concurrent callers wait for the same
+    check; a failed check is retried by the next caller.
+    """
+    global _schema_check
+    if _schema_check is None:
+        _schema_check = asyncio.ensure_future(_bring_schema_up_to_date())
+    try:
+        await asyncio.shield(_schema_check)
+    except Exception:
+        _schema_check = None
+        raise
 
-def get_session():
-    """Dependency to get a database session."""
-    with Session(engine) as session:
+async def get_session(connection: HTTPConnection):
+    """Dependency to get an async database session."""
+    # Already done unless FAST_COLD_START deferred it to the first request
+    await ensure_schema()
+    async with async_session_factory() as session:
+        user_id = connection.path_params.get("user_id")
+        if user_id:
+            session.info[WRITER_KEY] = user_id
         yield session
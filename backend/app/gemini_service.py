@@ -1,21 +1,82 @@
 import os
 import json
-import google.generativeai as genai
-from typing import Dict, Any, List
-from sqlmodel import Session
-from app.task_mcp_tools import execute_tool_call
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, AsyncIterator, Optional
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.task_mcp_tools import execute_tool_call, TASK_TOOL_DEFINITIONS
+
+# Progress messages shown to the user while a tool runs during a streamed reply
+TOOL_PROGRESS_LABELS = {
+    "add_task": "Adding task…",
+    "list_tasks": "Looking up your tasks…",
+    "search_tasks": "Searching your tasks…",
+    "complete_task": "Completing task…",
+    "delete_task": "Deleting task…",
+    "update_task": "Updating task…",
+    "bulk_add_tasks": "Adding tasks…",
+    "bulk_complete_tasks": "Completing tasks…",
+}
+
+# google.generativeai takes most of a second to import, so it is only imported once a
+# GeminiAIService is built (see FAST_COLD_START in app.main); ChatTurn and
+# replay_turn_events are usable without it.
+
+# Default upper bound on tool-calling rounds per chat turn
+GEMINI_MAX_TOOL_STEPS = int(os.getenv("GEMINI_MAX_TOOL_STEPS", "5"))
+
+@dataclass
+class ChatTurn:
+    """
+    Result of chat_with_function_calling: the reply text plus one record per agent step
+    """
+    text: str
+    steps: List[Dict[str, Any]] = field(default_factory=list)
+    # Set when the turn was cut short by an exception; text then holds the apology
+    error: Optional[str] = None
+
+    @property
+    def tool_calls(self) -> Optional[Dict[str, Any]]:
+        return {"steps": [step["calls"] for step in self.steps]} if self.steps else None
+
+    @property
+    def tool_responses(self) -> Optional[Dict[str, Any]]:
+        return {"steps": [step["responses"] for step in self.steps]} if self.steps else None
+
+async def replay_turn_events(chat_turn: ChatTurn) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Yield a finished turn as the events stream_chat_with_function_calling produces,
+    for turns answered without streaming from the model (fast-path, cache hits).
+    """
+    for step_index, step in enumerate(chat_turn.steps):
+        for call in step["calls"]:
+            yield {
+                "event": "tool_call",
+                "data": {
+                    "step": step_index,
+                    **call,
+                    "label": TOOL_PROGRESS_LABELS.get(call["name"], f"Running {call['name']}…")
+                }
+            }
+        for response in step["responses"]:
+            yield {"event": "tool_result", "data": {"step": step_index, **response}}
+    yield {"event": "token", "data": {"text": chat_turn.text}}
 
 class GeminiAIService:
     """
     Service class to handle interactions with Google's Gemini API
     """
     
-    def __init__(self, api_key: str = None):
+    def __init__(self, api_key: str = None, tools: Optional[List[Dict[str, Any]]] = None, max_tool_steps: Optional[int] = None):
         # Use provided API key or get from environment
         api_key = api_key or os.getenv("GEMINI_API_KEY")
         if not api_key:
             raise ValueError("GEMINI_API_KEY environment variable is required")
-        
+
+        import google.generativeai as genai
+        from google.generativeai.types import content_types
+
+        # configure() drops genai's cached clients (and their gRPC channels), so the app builds
+        # a single instance per process and reuses it for every request
         genai.configure(api_key=api_key)
         # Use the gemini-2.0-flash model as requested (using gemini-2.0-flash as per user request)
         self.model = genai.GenerativeModel(
@@ -27,111 +88,223 @@ class GeminiAIService:
                 "max_output_tokens": 8192,
             }
         )
+
+        # Tool declarations are converted to protos once here instead of on every generate_content call
+        self.tool_definitions = tools or TASK_TOOL_DEFINITIONS
+        self.function_library = content_types.to_function_library(
+            self._convert_tools_to_gemini_format(self.tool_definitions)
+        )
+        self.tool_config = content_types.to_tool_config({"function_calling_config": {"mode": "AUTO"}})
+        self.final_tool_config = content_types.to_tool_config({"function_calling_config": {"mode": "NONE"}})
+        # Upper bound on model turns that call tools within one chat turn
+        self.max_tool_steps = max_tool_steps if max_tool_steps is not None else GEMINI_MAX_TOOL_STEPS
     
-    def chat_with_function_calling(
+    async def chat_with_function_calling(
         self, 
         messages: List[Dict[str, str]], 
-        tools: List[Dict[str, Any]], 
-        db_session: Session, 
-        user_id: str
-    ) -> str:
+        db_session: AsyncSession, 
+        user_id: str,
+        tools: Optional[List[Dict[str, Any]]] = None
+    ) -> ChatTurn:
         """
-        Send messages to Gemini API with function calling capabilities
+        Send messages to Gemini API with function calling capabilities.
+
+        Runs the agent loop: every function call in a model turn is executed, all of the
+        results go back to the model in a single follow-up request, and this repeats until
+        the model answers with text or max_tool_steps is reached.
         """
+        steps = []
         try:
             # Convert messages to Gemini format
-            gemini_contents = []
-            for msg in messages:
-                # Map roles: user/assistant remain the same, but tool becomes function response
-                role = "model" if msg["role"] == "assistant" else "user"
-                if msg["role"] == "tool":
-                    # For tool responses in Gemini, we format as function response
-                    gemini_contents.append({
-                        "role": "function",
-                        "parts": [json.dumps({"result": msg["content"]})]
-                    })
-                else:
-                    gemini_contents.append({
-                        "role": role,
-                        "parts": [msg["content"]]
-                    })
-            
-            # Convert tools to Gemini format
-            gemini_tools = self._convert_tools_to_gemini_format(tools)
+            gemini_contents = self._convert_messages_to_gemini_format(messages)
             
-            # Call the model with tools
-            response = self.model.generate_content(
-                contents=gemini_contents,
-                tools=gemini_tools,
-                tool_config={"function_calling_config": {"mode": "AUTO"}}  # AUTO mode to automatically decide when to call functions
-            )
+            # Use the precompiled tool declarations unless the caller overrides them
+            gemini_tools = self._resolve_tools(tools)
             
-            # Process the response
-            result_text = ""
-            if response.candidates:
+            for step in range(self.max_tool_steps + 1):
+                # Once the step limit is reached, ask for a plain-text answer
+                tool_config = self.tool_config if step < self.max_tool_steps else self.final_tool_config
+                response = await self.model.generate_content_async(
+                    contents=gemini_contents,
+                    tools=gemini_tools,
+                    tool_config=tool_config  # AUTO mode to automatically decide when to call functions
+                )
+                if not response.candidates:
+                    break
+
                 candidate = response.candidates[0]
                 if candidate.finish_reason and candidate.finish_reason > 1:  # If there were issues
                     print(f"Response didn't finish normally: {candidate.finish_reason}")
-                
-                # Check if there are function calls in the response
-                has_function_call = False
-                if candidate.content and candidate.content.parts:
-                    for part in candidate.content.parts:
-                        # Check if this part is a function call
-                        if hasattr(part, 'function_call') and part.function_call:
-                            has_function_call = True
-                            # Execute the function call
-                            function_call = part.function_call
-                            function_name = function_call.name
-                            function_args = {}
-                            
-                            # Convert the function arguments from protobuf to dict
-                            if hasattr(function_call, 'args') and function_call.args:
-                                for key, value in function_call.args.items():
-                                    function_args[key] = value
-                            
-                            # Execute the tool function
-                            function_result = execute_tool_call(
-                                tool_name=function_name,
-                                arguments_str=json.dumps(function_args),
-                                db_session=db_session,
-                                user_id=user_id
-                            )
-                            
-                            # Add the function result to the conversation history
-                            gemini_contents.append({
-                                "role": "function",
-                                "parts": [json.dumps(function_result)]
-                            })
-                            
-                            # Make another call to get the final response after function execution
-                            final_response = self.model.generate_content(
-                                contents=gemini_contents,
-                                tools=gemini_tools
-                            )
-                            
-                            if final_response.candidates:
-                                final_candidate = final_response.candidates[0]
-                                if final_candidate.content and final_candidate.content.parts:
-                                    for part in final_candidate.content.parts:
-                                        if hasattr(part, 'text') and part.text:
-                                            result_text += part.text
-                        elif hasattr(part, 'text') and part.text:
-                            # Regular text response
-                            result_text += part.text
-            
-            # If no function calls were made, return the initial response text
-            if not has_function_call and result_text == "":
-                for part in candidate.content.parts:
-                    if hasattr(part, 'text') and part.text:
-                        result_text += part.text
-            
-            return result_text if result_text else "I couldn't process your request. Please try again."
+
+                parts = self._chunk_parts(response)
+                function_calls = [part.function_call for part in parts if hasattr(part, 'function_call') and part.function_call]
+                if not function_calls:
+                    result_text = "".join(part.text for part in parts if hasattr(part, 'text') and part.text)
+                    return ChatTurn(text=result_text or "I couldn't process your request. Please try again.", steps=steps)
+
+                step_record = await self._execute_function_calls(function_calls, db_session, user_id)
+                steps.append(step_record)
+                gemini_contents.append(candidate.content)
+                gemini_contents.append(self._function_responses_content(step_record))
+
+            return ChatTurn(text="I couldn't process your request. Please try again.", steps=steps)
             
         except Exception as e:
             print(f"Error in Gemini API call: {str(e)}")
-            return f"Sorry, I encountered an error processing your request: {str(e)}"
+            return ChatTurn(text=f"Sorry, I encountered an error processing your request: {str(e)}", steps=steps, error=str(e))
     
+    async def stream_chat_with_function_calling(
+        self,
+        messages: List[Dict[str, str]],
+        db_session: AsyncSession,
+        user_id: str,
+        tools: Optional[List[Dict[str, Any]]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streaming variant of chat_with_function_calling.
+
+        Yields event dicts instead of returning a string: "token" events carrying the
+        model's text as it arrives, and for every agent step a "tool_call" event before
+        each tool runs and a "tool_result" event after it.
+        """
+        gemini_contents = self._convert_messages_to_gemini_format(messages)
+        gemini_tools = self._resolve_tools(tools)
+
+        for step in range(self.max_tool_steps + 1):
+            tool_config = self.tool_config if step < self.max_tool_steps else self.final_tool_config
+            response = await self.model.generate_content_async(
+                contents=gemini_contents,
+                tools=gemini_tools,
+                tool_config=tool_config,
+                stream=True
+            )
+
+            function_calls = []
+            async for chunk in response:
+                for part in self._chunk_parts(chunk):
+                    if hasattr(part, 'function_call') and part.function_call:
+                        function_calls.append(part.function_call)
+                    elif hasattr(part, 'text') and part.text:
+                        yield {"event": "token", "data": {"text": part.text}}
+
+            if not function_calls:
+                return
+
+            for function_call in function_calls:
+                yield {
+                    "event": "tool_call",
+                    "data": {
+                        "step": step,
+                        "name": function_call.name,
+                        "arguments": self._function_call_args(function_call),
+                        "label": TOOL_PROGRESS_LABELS.get(function_call.name, f"Running {function_call.name}…")
+                    }
+                }
+            step_record = await self._execute_function_calls(function_calls, db_session, user_id)
+            for result in step_record["responses"]:
+                yield {"event": "tool_result", "data": {"step": step, **result}}
+
+            # The streamed chunks have been merged into response.candidates by now
+            gemini_contents.append(response.candidates[0].content)
+            gemini_contents.append(self._function_responses_content(step_record))
+
+    async def _execute_function_calls(self, function_calls: List[Any], db_session: AsyncSession, user_id: str) -> Dict[str, Any]:
+        """
+        Execute every function call from one model turn and return the step record
+        ({"calls": [...], "responses": [...]}) that is stored on the assistant Message.
+
+        The calls share the request's session, and an AsyncSession (like the single connection
+        behind it) runs one statement at a time, so they are executed in the order given.
+        """
+        calls = []
+        responses = []
+        for function_call in function_calls:
+            function_args = self._function_call_args(function_call)
+            function_result = await execute_tool_call(
+                tool_name=function_call.name,
+                arguments_str=json.dumps(function_args),
+                db_session=db_session,
+                user_id=user_id
+            )
+            calls.append({"name": function_call.name, "arguments": function_args})
+            responses.append({"name": function_call.name, "response": function_result})
+        return {"calls": calls, "responses": responses}
+
+    @staticmethod
+    def _function_call_args(function_call) -> Dict[str, Any]:
+        """
+        Convert protobuf function-call arguments to plain Python values
+        """
+        args = type(function_call).to_dict(function_call).get("args") or {}
+
+        def normalize(value):
+            # Struct numbers are doubles; the tools expect integer IDs
+            if isinstance(value, float) and value.is_integer():
+                return int(value)
+            if isinstance(value, list):
+                return [normalize(item) for item in value]
+            if isinstance(value, dict):
+                return {key: normalize(item) for key, item in value.items()}
+            return value
+
+        return {key: normalize(value) for key, value in args.items()}
+
+    @staticmethod
+    def _function_responses_content(step_record: Dict[str, Any]) -> Any:
+        """
+        Package all results of one step as a single content block for the follow-up request
+        """
+        from google.generativeai import protos
+
+        return protos.Content(
+            role="user",
+            parts=[
+                protos.Part(function_response=protos.FunctionResponse(
+                    name=result["name"],
+                    response={"result": json.loads(json.dumps(result["response"], default=str))}
+                ))
+                for result in step_record["responses"]
+            ]
+        )
+
+    @staticmethod
+    def _chunk_parts(chunk) -> List[Any]:
+        """
+        Return the content parts of a (streamed) response chunk, or [] if it has none
+        """
+        if not chunk.candidates:
+            return []
+        candidate = chunk.candidates[0]
+        if not candidate.content or not candidate.content.parts:
+            return []
+        return list(candidate.content.parts)
+
+    def _convert_messages_to_gemini_format(self, messages: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+        """
+        Convert role/content messages to Gemini contents
+        """
+        gemini_contents = []
+        for msg in messages:
+            # Map roles: user/assistant remain the same, but tool becomes function response
+            role = "model" if msg["role"] == "assistant" else "user"
+            if msg["role"] == "tool":
+                # For tool responses in Gemini, we format as function response
+                gemini_contents.append({
+                    "role": "function",
+                    "parts": [json.dumps({"result": msg["content"]})]
+                })
+            else:
+                gemini_contents.append({
+                    "role": role,
+                    "parts": [msg["content"]]
+                })
+        return gemini_contents
+
+    def _resolve_tools(self, tools: Optional[List[Dict[str, Any]]]) -> Any:
+        if tools is None:
+            return self.function_library
+        return self._convert_tools_to_gemini_format(tools)
+
     def _convert_tools_to_gemini_format(self, tools: List[Dict[str, Any]]) -> List[Any]:
         """
         Convert OpenAI-style tools to Gemini format
@@ -148,7 +321,23 @@ class GeminiAIService:
         
         return [{"function_declarations": gemini_tools}]
     
-    def simple_chat(self, messages: List[Dict[str, str]]) -> str:
+    async def summarize_conversation(self, previous_summary: str, messages: List[Dict[str, str]]) -> str:
+        """
+        Fold older conversation turns into the rolling summary
+        """
+        transcript = "\n".join(f"{msg['role']}: {msg['content']}" for msg in messages)
+        prompt = (
+            "You maintain a running summary of a conversation between a user and a todo-list assistant. "
+            "Update the summary with the new turns below. Keep task titles, task IDs, decisions and open "
+            "questions; drop small talk. Reply with the updated summary only, at most 200 words.\n\n"
+            f"Current summary:\n{previous_summary or '(none)'}\n\nNew turns:\n{transcript}"
+        )
+        response = await self.model.generate_content_async(prompt)
+        if response.candidates and response.candidates[0].content.parts:
+            return " ".join([part.text for part in response.candidates[0].content.parts if hasattr(part, 'text') and part.text]).strip()
+        return previous_summary or ""
+
+    async def simple_chat(self, messages: List[Dict[str, str]]) -> str:
         """
         Send messages to Gemini API without function calling
         """
@@ -162,7 +351,7 @@ class GeminiAIService:
                     "parts": [msg["content"]]
                 })
             
-            response = self.model.generate_content(gemini_contents)
+            response = await self.model.generate_content_async(gemini_contents)
             
             if response.candidates and response.candidates[0].content.parts:
                 return " ".join([part.text for part in response.candidates[0].content.parts if hasattr(part, 'text') and part.text])
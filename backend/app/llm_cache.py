@@ -0,0 +1,230 @@
+import asyncio
+import contextlib
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app import crud
+from app.cache import TTLCache
+from app.gemini_service import ChatTurn, replay_turn_events
+from app.task_mcp_tools import READ_ONLY_TOOL_NAMES
+
+# Answers to read-only questions are reused while the conversation tail, the tool schema
+# and the user's tasks are unchanged. Only turns whose tool calls were all read-only are
+# stored, so a cached answer never stands in for a write.
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "memory")  # "memory" or "sqlite"
+# Checked here rather than when the service is built, where a ValueError reads as a missing API key
+if LLM_CACHE_BACKEND not in ("memory", "sqlite"):
+    raise ValueError(f"Unsupported LLM_CACHE_BACKEND: {LLM_CACHE_BACKEND}")
+LLM_CACHE_SQLITE_PATH = os.getenv("LLM_CACHE_SQLITE_PATH", "llm_cache.sqlite3")
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2000"))
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", "600"))
+# Trailing messages of the prompt window that make up the key. With 3, the same question
+# hits in a fresh conversation and again once it has been asked twice in a row.
+LLM_CACHE_WINDOW_MESSAGES = int(os.getenv("LLM_CACHE_WINDOW_MESSAGES", "3"))
+
+class MemoryResponseCache:
+    """Per-process backend on the shared TTL/LRU cache."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def get(self, key: str) -> Optional[str]:
+        return self._cache.get(key)
+
+    async def set(self, key: str, value: str) -> None:
+        self._cache.set(key, value)
+
+class SQLiteResponseCache:
+    """
+    Backend shared by every worker on the host through one SQLite file. Calls run in a
+    thread; when over maxsize, the entries closest to expiry (the oldest) are evicted.
+    """
+
+    def __init__(self, path: str, maxsize: int, ttl: float):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # closing(): a sqlite3 connection's own context manager commits but doesn't close
+        with contextlib.closing(self._connect()) as connection, connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS llm_response_cache "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS ix_llm_response_cache_expires_at ON llm_response_cache (expires_at)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=5)
+
+    def _get(self, key: str) -> Optional[str]:
+        with contextlib.closing(self._connect()) as connection:
+            row = connection.execute(
+                "SELECT value FROM llm_response_cache WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    def _set(self, key: str, value: str) -> None:
+        now = time.time()
+        with contextlib.closing(self._connect()) as connection, connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO llm_response_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, now + self.ttl)
+            )
+            connection.execute("DELETE FROM llm_response_cache WHERE expires_at <= ?", (now,))
+            connection.execute(
+                "DELETE FROM llm_response_cache WHERE key IN ("
+                "SELECT key FROM llm_response_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                (self.maxsize,)
+            )
+
+    async def get(self, key: str) -> Optional[str]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: str) -> None:
+        await asyncio.to_thread(self._set, key, value)
+
+def make_response_cache():
+    if LLM_CACHE_BACKEND == "sqlite":
+        return SQLiteResponseCache(LLM_CACHE_SQLITE_PATH, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL_SECONDS)
+    return MemoryResponseCache(LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL_SECONDS)
+
+def _normalise(text: str) -> str:
+    return " ".join(text.split()).lower()
+
+def is_cacheable(chat_turn: ChatTurn) -> bool:
+    if chat_turn.error:
+        return False
+    return all(
+        call["name"] in READ_ONLY_TOOL_NAMES
+        for step in chat_turn.steps
+        for call in step["calls"]
+    )
+
+class CachedGeminiService:
+    """
+    Wraps GeminiAIService with the response cache; everything other than the two chat
+    methods is passed through to the wrapped service.
+    """
+
+    def __init__(self, service, cache=None):
+        self.service = service
+        self.cache = cache or make_response_cache()
+        self._schema_digest = hashlib.sha256(
+            json.dumps(
+                {"model": getattr(service.model, "model_name", None), "tools": service.tool_definitions},
+                sort_keys=True
+            ).encode()
+        ).hexdigest()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.uncacheable = 0
+
+    def __getattr__(self, name):
+        return getattr(self.service, name)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.cache).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "uncacheable": self.uncacheable,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    async def _key(self, messages: List[Dict[str, str]], db_session: AsyncSession, user_id: str) -> str:
+        # Every task write takes a new change_seq, so any write changes the version
+        task_list_version = await crud.get_task_list_version(db_session, user_id)
+        if not crud.in_unit_of_work(db_session):
+            # Don't hold the read transaction's connection while the model is answering
+            await db_session.commit()
+        window = [
+            {"role": msg["role"], "content": _normalise(msg["content"])}
+            for msg in messages[-LLM_CACHE_WINDOW_MESSAGES:]
+        ]
+        material = json.dumps(
+            {
+                "user": user_id,
+                "schema": self._schema_digest,
+                "tasks": task_list_version,
+                "messages": window,
+            },
+            sort_keys=True
+        )
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    async def _lookup(self, key: str) -> Optional[ChatTurn]:
+        cached = await self.cache.get(key)
+        if cached is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return ChatTurn(**json.loads(cached))
+
+    async def _store(self, key: str, chat_turn: ChatTurn) -> None:
+        if not is_cacheable(chat_turn):
+            self.uncacheable += 1
+            return
+        await self.cache.set(key, json.dumps({"text": chat_turn.text, "steps": chat_turn.steps}, default=str))
+        self.stores += 1
+
+    async def chat_with_function_calling(
+        self,
+        messages: List[Dict[str, str]],
+        db_session: AsyncSession,
+        user_id: str,
+        tools: Optional[List[Dict[str, Any]]] = None
+    ) -> ChatTurn:
+        if tools is not None:
+            return await self.service.chat_with_function_calling(messages, db_session, user_id, tools)
+        key = await self._key(messages, db_session, user_id)
+        cached = await self._lookup(key)
+        if cached is not None:
+            return cached
+        chat_turn = await self.service.chat_with_function_calling(messages, db_session, user_id)
+        await self._store(key, chat_turn)
+        return chat_turn
+
+    async def stream_chat_with_function_calling(
+        self,
+        messages: List[Dict[str, str]],
+        db_session: AsyncSession,
+        user_id: str,
+        tools: Optional[List[Dict[str, Any]]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        if tools is not None:
+            async for event in self.service.stream_chat_with_function_calling(messages, db_session, user_id, tools):
+                yield event
+            return
+        key = await self._key(messages, db_session, user_id)
+        cached = await self._lookup(key)
+        if cached is not None:
+            async for event in replay_turn_events(cached):
+                yield event
+            return
+
+        # Rebuild the turn from the events so it can be stored once the stream completes
+        chunks = []
+        steps = []
+        async for event in self.service.stream_chat_with_function_calling(messages, db_session, user_id):
+            if event["event"] == "token":
+                chunks.append(event["data"]["text"])
+            elif event["event"] == "tool_call":
+                if event["data"]["step"] == len(steps):
+                    steps.append({"calls": [], "responses": []})
+                steps[-1]["calls"].append({"name": event["data"]["name"], "arguments": event["data"]["arguments"]})
+            elif event["event"] == "tool_result":
+                steps[-1]["responses"].append({"name": event["data"]["name"], "response": event["data"]["response"]})
+            yield event
+        if chunks:
+            await self._store(key, ChatTurn(text="".join(chunks), steps=steps))
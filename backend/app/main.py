@@ -1,23 +1,142 @@
-from typing import List
-from fastapi import FastAPI, Depends, HTTPException, status
+from typing import List, Optional
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect, status
 from fastapi.security import OAuth2PasswordRequestForm # Added import
 from fastapi.middleware.cors import CORSMiddleware
-from sqlmodel import Session
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from sqlmodel.ext.asyncio.session import AsyncSession
 import os
-
-from app.database import create_db_and_tables, get_session
+import hmac
+import json
+import logging
+import datetime
+import anyio
+import asyncio
+from urllib.parse import urlencode
+from pydantic import TypeAdapter
+
+from app.database import engine, read_engine, ensure_schema, get_session
 from app.models import User, Task, Conversation, Message # Ensure User is imported
-from app.schemas import UserCreate, Token, TaskCreate, TaskRead, TaskUpdate, TaskCompletionStatus, ChatRequest, ChatResponse, ConversationRead, ConversationWithMessages # Added TaskCompletionStatus and conversation-related schemas
+from app.schemas import UserCreate, Token, TaskCreate, TaskRead, TaskSearchHit, TaskChanges, TaskUpdate, TaskCompletionStatus, TaskBatchCreate, TaskBatchUpdate, TaskBatchIds, TaskBatchCompletion, TaskBatchResult, ChatRequest, ChatResponse, ChatJobRead, ConversationRead, ConversationListItem, ConversationWithMessages # Added TaskCompletionStatus and conversation-related schemas
 from app.security import (
-    get_password_hash, verify_password,
-    create_access_token, get_current_user,
+    get_password_hash, verify_password, verify_and_update_password_async,
+    create_access_token, get_current_user, verify_access_token,
     get_authorized_user # For path parameter authorization
 )
 from app import crud
 from app.task_mcp_tools import execute_tool_call
-from app.gemini_service import GeminiAIService
+from app.gemini_service import GeminiAIService, replay_turn_events
+from app.pagination import encode_cursor, decode_cursor
+from app.chat_context import build_chat_context
+from app.chat_intents import try_fast_path, is_fast_path_command, fast_path_stats
+from app.llm_cache import CachedGeminiService, LLM_CACHE_ENABLED
+from app.compaction import run_compaction_loop, MESSAGE_COMPACTION_ENABLED
+from app.tombstones import run_tombstone_pruning_loop, TASK_TOMBSTONE_RETENTION_DAYS
+from app.admission import AdmissionRejected, LLMSlot, make_llm_limiter, make_chat_rate_limiter
+from app.chat_jobs import (
+    CHAT_JOBS_ENABLED, CHAT_JOB_IN_PROCESS_WORKERS, CHAT_JOB_WAIT_MAX_SECONDS,
+    FINISHED_STATUSES, ChatJobWorkerPool, notify_chat_job_queued, wait_for_chat_job
+)
+from app.task_list_cache import task_list_etag, get_cached_response, cache_response
+from app.sql_metrics import SQLMetricsMiddleware
+from app.task_events import task_event_bus, TASK_EVENTS_HEARTBEAT_SECONDS
+from app.read_replica import get_read_session, read_router, mark_read_after, ReadYourWritesMiddleware, READ_AFTER_HEADER
+
+logger = logging.getLogger(__name__)
+
+# Page size for GET /tasks when paginating (limit or cursor given; without either the whole
+# list is returned); clients follow X-Next-Cursor for further pages
+TASK_PAGE_SIZE_DEFAULT = int(os.getenv("TASK_PAGE_SIZE_DEFAULT", "200"))
+TASK_PAGE_SIZE_MAX = int(os.getenv("TASK_PAGE_SIZE_MAX", "1000"))
+
+task_list_adapter = TypeAdapter(List[TaskRead])
+search_hit_adapter = TypeAdapter(List[TaskSearchHit])
+task_changes_adapter = TypeAdapter(TaskChanges)
+
+# Page size for GET /conversations when paginating, as for GET /tasks
+CONVERSATION_PAGE_SIZE_DEFAULT = int(os.getenv("CONVERSATION_PAGE_SIZE_DEFAULT", "20"))
+CONVERSATION_PAGE_SIZE_MAX = int(os.getenv("CONVERSATION_PAGE_SIZE_MAX", "100"))
+
+conversation_list_adapter = TypeAdapter(List[ConversationListItem])
+
+# Messages per GET /conversations/{id} page; X-Before-Cursor / X-After-Cursor lead to older / newer ones
+MESSAGE_PAGE_SIZE_DEFAULT = int(os.getenv("MESSAGE_PAGE_SIZE_DEFAULT", "50"))
+MESSAGE_PAGE_SIZE_MAX = int(os.getenv("MESSAGE_PAGE_SIZE_MAX", "500"))
+
+conversation_messages_adapter = TypeAdapter(ConversationWithMessages)
+
+# Run each POST /chat turn (user message, tool writes, summary, assistant message) as one
+# transaction with a single commit. This saves a round-trip per write, but the pooled
+# connection then stays checked out while Gemini is answering, so it is opt-in.
+CHAT_SINGLE_TRANSACTION = os.getenv("CHAT_SINGLE_TRANSACTION", "false").lower() in ("1", "true", "yes")
+
+# GET /metrics is off (404) unless METRICS_TOKEN is set, and then needs "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN") or None
+
+# For scale-from-zero deployments: start serving without touching the database or loading the
+# Gemini SDK. The schema check runs on the first request that needs a session, and the SDK is
+# imported (in a thread) on the first chat, so requests that need neither are not held up by them.
+FAST_COLD_START = os.getenv("FAST_COLD_START", "false").lower() in ("1", "true", "yes")
+
+async def load_gemini_service(app: FastAPI) -> Optional[GeminiAIService]:
+    """The process-wide Gemini service, built on first use. None if chat is not configured."""
+    # A service put on app.state beforehand (e.g. a benchmark's stub) is used as is
+    if app.state.gemini_service is None and not app.state.gemini_service_loaded:
+        async with app.state.gemini_service_lock:
+            if app.state.gemini_service is None and not app.state.gemini_service_loaded:
+                # One Gemini service per process: it owns the configured client, its pooled channel
+                # and the precompiled tool declarations, so chat turns don't rebuild any of it
+                try:
+                    # The SDK import takes most of a second; keep it off the event loop
+                    gemini_service = await asyncio.to_thread(GeminiAIService)
+                    if app.state.gemini_service is None:
+                        app.state.gemini_service = CachedGeminiService(gemini_service) if LLM_CACHE_ENABLED else gemini_service
+                except ValueError as e:
+                    logger.warning("Chat assistant disabled: %s", e)
+                app.state.gemini_service_loaded = True
+    return app.state.gemini_service
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.gemini_service = None
+    app.state.gemini_service_loaded = False
+    app.state.gemini_service_lock = asyncio.Lock()
+    if not FAST_COLD_START:
+        await ensure_schema()
+        await load_gemini_service(app)
+    # Admission control for chat turns: LLM concurrency cap and per-user rate limit
+    app.state.llm_limiter = make_llm_limiter()
+    app.state.chat_rate_limiter = make_chat_rate_limiter()
+
+    # Task deltas for /ws sockets; connects the cross-worker relay if one is configured
+    await task_event_bus.start()
+
+    background_tasks = []
+    if MESSAGE_COMPACTION_ENABLED:
+        background_tasks.append(asyncio.create_task(
+            run_compaction_loop(lambda: load_gemini_service(app), app.state.llm_limiter)
+        ))
+    if TASK_TOMBSTONE_RETENTION_DAYS > 0:
+        background_tasks.append(asyncio.create_task(run_tombstone_pruning_loop()))
+    app.state.chat_job_pool = None
+    if CHAT_JOBS_ENABLED and CHAT_JOB_IN_PROCESS_WORKERS > 0:
+        app.state.chat_job_pool = ChatJobWorkerPool(
+            CHAT_JOB_IN_PROCESS_WORKERS, lambda: load_gemini_service(app), app.state.llm_limiter
+        )
+        background_tasks.extend(app.state.chat_job_pool.start())
+    yield
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await task_event_bus.stop()
+    # Pooled aiosqlite connections keep non-daemon threads alive, which would stop the process exiting
+    await engine.dispose()
+    if read_engine is not None:
+        await read_engine.dispose()
 
 app = FastAPI(
+    lifespan=lifespan,
     title="Todo Full-Stack Web Application Backend",
     version="Phase II",
     description="FastAPI backend for a multi-user Todo application with JWT authentication and Neon PostgreSQL."
@@ -30,124 +149,378 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allow all methods (GET, POST, PUT, DELETE, etc.)
     allow_headers=["*"],  # Allow all headers
+    expose_headers=["X-Next-Cursor", "X-Before-Cursor", "X-After-Cursor", "ETag", READ_AFTER_HEADER],  # Let browser clients read the pagination cursors, ETag and read-after token
 )
 
-@app.on_event("startup")
-def on_startup():
-    create_db_and_tables()
+# Read-after tokens on write responses, so a writer's next reads skip a lagging replica
+app.add_middleware(ReadYourWritesMiddleware)
+
+# Query count and DB time per request, as a Server-Timing header and sampled JSON logs
+app.add_middleware(SQLMetricsMiddleware)
+
 
 # --- Authentication Endpoints ---
 @app.post("/auth/register", response_model=Token, status_code=status.HTTP_201_CREATED)
-def register_user(user_create: UserCreate, session: Session = Depends(get_session)):
-    db_user = crud.get_user_by_email(session, email=user_create.email)
+async def register_user(user_create: UserCreate, session: AsyncSession = Depends(get_session)):
+    db_user = await crud.get_user_by_email(session, email=user_create.email)
     if db_user:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered")
     
-    user = crud.create_user(session, user_create)
+    user = await crud.create_user(session, user_create)
     access_token = create_access_token(data={"sub": str(user.id)})
     return Token(access_token=access_token, token_type="bearer")
 
 @app.post("/auth/login", response_model=Token)
-def login_for_access_token(
+async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_session)
 ):
-    user = crud.get_user_by_email(session, email=form_data.username)
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    user = await crud.get_user_by_email(session, email=form_data.username)
+    password_valid, new_hash = (False, None)
+    if user:
+        password_valid, new_hash = await verify_and_update_password_async(form_data.password, user.hashed_password)
+    if not password_valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if new_hash:
+        # Stored hash used a different bcrypt cost; upgrade it transparently
+        await crud.update_user_password_hash(session, user, new_hash)
     access_token = create_access_token(data={"sub": str(user.id)})
     return Token(access_token=access_token, token_type="bearer")
 
 
+# --- Task change push ---
+@app.websocket("/ws/{user_id}")
+async def task_events_socket(websocket: WebSocket, user_id: str, token: Optional[str] = None):
+    """
+    Pushes the user's task changes as JSON messages, so clients don't need to poll GET /tasks:
+    {"type": "task.created" | "task.updated", "task": <TaskRead>}, {"type": "task.deleted",
+    "task": {"id": ...}}, {"type": "resync"} when deltas were lost and the list should be
+    fetched again, and {"type": "ping"} heartbeats. Authenticates with the usual JWT, passed as
+    ?token= (browsers can't set headers on a WebSocket) or an Authorization: Bearer header.
+    """
+    if token is None:
+        scheme, _, credentials = websocket.headers.get("authorization", "").partition(" ")
+        token = credentials if scheme.lower() == "bearer" else None
+    try:
+        token_user_id = verify_access_token(token) if token else None
+    except HTTPException:
+        token_user_id = None
+    if token_user_id != user_id:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    with task_event_bus.subscribe(user_id) as subscription:
+        async def push_events():
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.get(), TASK_EVENTS_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    event = {"type": "ping"}
+                await websocket.send_json(event)
+
+        async with anyio.create_task_group() as task_group:
+            task_group.start_soon(push_events)
+            try:
+                # Clients don't send anything; reading is how a disconnect is noticed
+                while True:
+                    await websocket.receive_text()
+            except WebSocketDisconnect:
+                pass
+            task_group.cancel_scope.cancel()
+
 # --- Task Endpoints ---
 @app.get("/api/{user_id}/tasks", response_model=List[TaskRead])
-def read_tasks(
+async def read_tasks(
     user_id: str,  # Changed from int to str to match User.id type
-    session: Session = Depends(get_session),
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=TASK_PAGE_SIZE_MAX, description="page size; without limit or cursor the whole list is returned"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+    completed: Optional[bool] = None,
+    updated_since: Optional[datetime.datetime] = None,
+    sort: str = Query("id", pattern=r"^-?(id|updated_at)$", description="id or updated_at; prefix with - for descending"),
+    session: AsyncSession = Depends(get_read_session),
+    current_user: User = Depends(get_authorized_user) # Authorization check
+):
+    # Conditional GET: unchanged lists are answered from the ETag or the response cache after one
+    # version lookup. Read before the list, so a cached body is never older than its version.
+    version = await crud.get_task_list_version(session, user_id)
+    etag = task_list_etag(user_id, version, urlencode(sorted(request.query_params.multi_items())))
+    cache_headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers)
+    cached = get_cached_response(etag)
+    if cached:
+        body, headers = cached
+        return Response(content=body, media_type="application/json", headers={**headers, **cache_headers})
+
+    # Keyset pagination: the next page's cursor is returned in the X-Next-Cursor header
+    if limit is None and cursor is not None:
+        limit = TASK_PAGE_SIZE_DEFAULT
+    tasks, next_key = await crud.get_tasks_page(
+        session,
+        owner_id=user_id,
+        limit=limit,
+        after=decode_cursor(cursor),
+        completed=completed,
+        updated_since=updated_since,
+        sort=sort.lstrip("-"),
+        descending=sort.startswith("-")
+    )
+    headers = {}
+    if next_key is not None:
+        headers["X-Next-Cursor"] = encode_cursor(*next_key)
+
+    body = task_list_adapter.dump_json(task_list_adapter.validate_python(tasks, from_attributes=True))
+    cache_response(etag, body, headers)
+    return Response(content=body, media_type="application/json", headers={**headers, **cache_headers})
+
+# Declared before /tasks/{task_id} so "search" isn't taken for a task id
+@app.get("/api/{user_id}/tasks/search", response_model=List[TaskSearchHit])
+async def search_tasks(
+    user_id: str,
+    q: str = Query(..., min_length=1, max_length=200, description="Words to look for in titles and descriptions"),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+    session: AsyncSession = Depends(get_session),
     current_user: User = Depends(get_authorized_user) # Authorization check
 ):
-    tasks = crud.get_tasks_by_owner(session, owner_id=user_id)
-    return tasks
+    # Results are ordered by rank, which has no stable keyset, so the cursor carries an offset
+    offset = 0
+    if cursor:
+        offset, _ = decode_cursor(cursor)
+        if not isinstance(offset, int) or offset < 0:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+    hits, has_more = await crud.search_tasks(session, owner_id=user_id, query=q, limit=limit, offset=offset)
+    headers = {}
+    if has_more:
+        headers["X-Next-Cursor"] = encode_cursor(offset + len(hits), hits[-1][0].id)
+
+    body = search_hit_adapter.dump_json(
+        search_hit_adapter.validate_python([{**task.model_dump(), "rank": rank} for task, rank in hits])
+    )
+    return Response(content=body, media_type="application/json", headers=headers)
 
 @app.post("/api/{user_id}/tasks", response_model=TaskRead, status_code=status.HTTP_201_CREATED)
-def create_task_for_user(
+async def create_task_for_user(
     user_id: str,  # Changed from int to str to match User.id type
     task: TaskCreate,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_session),
     current_user: User = Depends(get_authorized_user) # Authorization check
 ):
-    db_task = crud.create_task(session, task, owner_id=user_id)
+    db_task = await crud.create_task(session, task, owner_id=user_id)
     return db_task
 
+@app.get("/api/{user_id}/tasks/changes", response_model=TaskChanges)
+async def read_task_changes(
+    user_id: str,
+    since: int = Query(0, ge=0, description="watermark from the previous sync; 0 for everything"),
+    limit: int = Query(TASK_PAGE_SIZE_DEFAULT, ge=1, le=TASK_PAGE_SIZE_MAX),
+    session: AsyncSession = Depends(get_read_session),
+    current_user: User = Depends(get_authorized_user) # Authorization check
+):
+    """
+    Delta sync: tasks created or updated and tasks deleted since the watermark, so a client
+    only downloads what changed. Repeat with the returned watermark while has_more is set.
+    A watermark older than the retained tombstones gets 410: sync again from since=0.
+    """
+    if since > 0 and since < await crud.get_task_pruned_seq(session, user_id):
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="Deletions since this watermark are no longer kept; full resync required (since=0)"
+        )
+    tasks, tombstones, watermark, has_more = await crud.get_task_changes(session, user_id, since=since, limit=limit)
+    body = task_changes_adapter.dump_json(task_changes_adapter.validate_python(
+        {
+            "changed": tasks,
+            "deleted": [
+                {"id": tombstone.task_id, "change_seq": tombstone.change_seq, "deleted_at": tombstone.deleted_at}
+                for tombstone in tombstones
+            ],
+            "watermark": watermark,
+            "has_more": has_more,
+        },
+        from_attributes=True
+    ))
+    return Response(content=body, media_type="application/json")
+
 @app.get("/api/{user_id}/tasks/{task_id}", response_model=TaskRead)
-def read_single_task(
+async def read_single_task(
     user_id: str,  # Changed from int to str to match User.id type
     task_id: int,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_read_session),
     current_user: User = Depends(get_authorized_user) # Authorization check
 ):
-    task = crud.get_task_by_id_and_owner(session, task_id=task_id, owner_id=user_id)
+    task = await crud.get_task_by_id_and_owner(session, task_id=task_id, owner_id=user_id)
     if not task:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Task not found")
     return task
 
 @app.put("/api/{user_id}/tasks/{task_id}", response_model=TaskRead)
-def update_single_task(
+async def update_single_task(
     user_id: str,  # Changed from int to str to match User.id type
     task_id: int,
     task_update: TaskUpdate, # Corrected to TaskUpdate
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_session),
     current_user: User = Depends(get_authorized_user) # Authorization check
 ):
-    db_task = crud.get_task_by_id_and_owner(session, task_id=task_id, owner_id=user_id)
+    db_task = await crud.get_task_by_id_and_owner(session, task_id=task_id, owner_id=user_id)
     if not db_task:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Task not found")
     
     # Using TaskUpdate for partial update logic
-    updated_task = crud.update_task(session, db_task, task_update)
+    updated_task = await crud.update_task(session, db_task, task_update)
     return updated_task
 
 @app.patch("/api/{user_id}/tasks/{task_id}/complete", response_model=TaskRead)
-def toggle_task_completion(
+async def toggle_task_completion(
     user_id: str,  # Changed from int to str to match User.id type
     task_id: int,
     completed_status: TaskCompletionStatus, # Corrected to TaskCompletionStatus
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_session),
     current_user: User = Depends(get_authorized_user) # Authorization check
 ):
-    db_task = crud.get_task_by_id_and_owner(session, task_id=task_id, owner_id=user_id)
+    db_task = await crud.get_task_by_id_and_owner(session, task_id=task_id, owner_id=user_id)
     if not db_task:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Task not found")
     
     # Use the completed status directly from the schema model
     task_update_model = TaskUpdate(completed=completed_status.completed)
-    updated_task = crud.update_task(session, db_task, task_update_model)
+    updated_task = await crud.update_task(session, db_task, task_update_model)
     return updated_task
 
 @app.delete("/api/{user_id}/tasks/{task_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_single_task(
+async def delete_single_task(
     user_id: str,  # Changed from int to str to match User.id type
     task_id: int,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_session),
     current_user: User = Depends(get_authorized_user) # Authorization check
 ):
-    db_task = crud.get_task_by_id_and_owner(session, task_id=task_id, owner_id=user_id)
+    db_task = await crud.get_task_by_id_and_owner(session, task_id=task_id, owner_id=user_id)
     if not db_task:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Task not found")
 
-    crud.delete_task(session, db_task)
+    await crud.delete_task(session, db_task)
     return
 
+# --- Bulk Task Endpoints ---
+def batch_result(tasks: List[Task], requested_ids: List[int]) -> TaskBatchResult:
+    found_ids = {task.id for task in tasks}
+    return TaskBatchResult(
+        tasks=tasks,
+        missing_ids=[task_id for task_id in dict.fromkeys(requested_ids) if task_id not in found_ids]
+    )
+
+@app.post("/api/{user_id}/tasks:batch", response_model=TaskBatchResult, status_code=status.HTTP_201_CREATED)
+async def create_tasks_batch(
+    user_id: str,
+    batch: TaskBatchCreate,
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_authorized_user) # Authorization check
+):
+    tasks = await crud.bulk_create_tasks(session, batch.tasks, owner_id=user_id)
+    return TaskBatchResult(tasks=tasks)
+
+@app.patch("/api/{user_id}/tasks:batch", response_model=TaskBatchResult)
+async def update_tasks_batch(
+    user_id: str,
+    batch: TaskBatchUpdate,
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_authorized_user) # Authorization check
+):
+    tasks = await crud.bulk_update_tasks(session, batch.tasks, owner_id=user_id)
+    return batch_result(tasks, [task.id for task in batch.tasks])
+
+@app.patch("/api/{user_id}/tasks:batch/complete", response_model=TaskBatchResult)
+async def complete_tasks_batch(
+    user_id: str,
+    batch: TaskBatchCompletion,
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_authorized_user) # Authorization check
+):
+    tasks = await crud.bulk_set_tasks_completed(session, batch.ids, owner_id=user_id, completed=batch.completed)
+    return batch_result(tasks, batch.ids)
+
+@app.delete("/api/{user_id}/tasks:batch", response_model=TaskBatchResult)
+async def delete_tasks_batch(
+    user_id: str,
+    batch: TaskBatchIds,
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_authorized_user) # Authorization check
+):
+    # Returns the deleted tasks
+    tasks = await crud.bulk_delete_tasks(session, batch.ids, owner_id=user_id)
+    return batch_result(tasks, batch.ids)
+
 # --- Chat Endpoints ---
-@app.post("/api/{user_id}/chat", response_model=ChatResponse)
-def chat_with_assistant(
+async def get_gemini_service(request: Request) -> GeminiAIService:
+    """Dependency returning the process-wide GeminiAIService."""
+    gemini_service = await load_gemini_service(request.app)
+    if gemini_service is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Chat assistant is not configured"
+        )
+    return gemini_service
+
+async def get_or_create_conversation(session: AsyncSession, user_id: str, conversation_id: Optional[int]) -> Conversation:
+    """Return the user's conversation with the given id, or start a new one."""
+    if conversation_id:
+        # Verify the conversation belongs to the user
+        conversation = await crud.get_conversation_by_id(session, conversation_id, user_id)
+        if not conversation:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Conversation not found"
+            )
+        return conversation
+    # Create a new conversation
+    return await crud.create_conversation(session, user_id)
+
+async def admit_chat_turn(request: Request, user_id: str, message: str, reserve_llm_slot: bool = True) -> Optional[LLMSlot]:
+    """
+    Admission for a chat turn, before anything is saved: the user's rate limit (429), then an
+    LLM slot (503) unless the fast path will answer it. Returns the slot for the caller to release.
+    """
+    try:
+        await request.app.state.chat_rate_limiter.check(user_id)
+        if not reserve_llm_slot or is_fast_path_command(message):
+            return None
+        return await request.app.state.llm_limiter.acquire()
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers={"Retry-After": str(e.retry_after)})
+
+async def enqueue_chat_turn(session: AsyncSession, user_id: str, chat_request: ChatRequest) -> Response:
+    """Job mode: save the user message and queue the turn in one transaction, then answer 202."""
+    async with crud.unit_of_work(session):
+        conversation = await get_or_create_conversation(session, user_id, chat_request.conversation_id)
+        user_message = await crud.create_message(
+            session,
+            conversation_id=conversation.id,
+            role="user",
+            content=chat_request.message
+        )
+        job = await crud.create_chat_job(session, user_id, conversation.id, user_message.id)
+    notify_chat_job_queued()
+    return Response(
+        content=ChatJobRead.model_validate(job).model_dump_json(),
+        status_code=status.HTTP_202_ACCEPTED,
+        media_type="application/json",
+        headers={"Location": f"/api/{user_id}/chat/jobs/{job.id}", "Preference-Applied": "respond-async"}
+    )
+
+@app.post("/api/{user_id}/chat", response_model=ChatResponse, responses={202: {"model": ChatJobRead}})
+async def chat_with_assistant(
     user_id: str,  # Changed from int to str to match User.id type
     chat_request: ChatRequest,
-    session: Session = Depends(get_session),
+    request: Request,
+    session: AsyncSession = Depends(get_session),
+    gemini_service: GeminiAIService = Depends(get_gemini_service),
     current_user: User = Depends(get_authorized_user) # Authorization check
 ):
     # Verify the user_id in the path matches the authenticated user
@@ -157,150 +530,242 @@ def chat_with_assistant(
             detail="Not authorized to access this user's conversations"
         )
 
-    # Create or get conversation
-    if chat_request.conversation_id:
-        # Verify the conversation belongs to the user
-        conversation = crud.get_conversation_by_id(session, chat_request.conversation_id, user_id)
-        if not conversation:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Conversation not found"
+    # Job mode, opted into per request with "Prefer: respond-async": the turn runs on a chat job worker
+    if CHAT_JOBS_ENABLED and "respond-async" in request.headers.get("prefer", "").lower():
+        await admit_chat_turn(request, user_id, chat_request.message, reserve_llm_slot=False)
+        return await enqueue_chat_turn(session, user_id, chat_request)
+
+    llm_slot = await admit_chat_turn(request, user_id, chat_request.message)
+    try:
+        # Create or get conversation
+        conversation = await get_or_create_conversation(session, user_id, chat_request.conversation_id)
+        # Kept aside: a rolled-back turn expires the loaded conversation
+        conversation_id = conversation.id
+
+        try:
+            # With CHAT_SINGLE_TRANSACTION the CRUD calls below only flush; the turn commits once
+            # at the end of the block and a failure anywhere rolls all of it back
+            async with crud.unit_of_work(session, enabled=CHAT_SINGLE_TRANSACTION):
+                # Create user message
+                await crud.create_message(
+                    session,
+                    conversation_id=conversation.id,
+                    role="user",
+                    content=chat_request.message
+                )
+
+                # Plain task commands are run locally, without loading history or calling Gemini
+                chat_turn = await try_fast_path(chat_request.message, session, user_id)
+                if chat_turn is None:
+                    # Recent history (including the message just saved) plus the rolling summary of older turns
+                    gemini_messages = await build_chat_context(session, conversation, gemini_service)
+
+                    # Call Gemini API with function calling
+                    chat_turn = await gemini_service.chat_with_function_calling(
+                        messages=gemini_messages,
+                        db_session=session,
+                        user_id=user_id
+                    )
+                if chat_turn.error and CHAT_SINGLE_TRANSACTION:
+                    # Don't commit the tool writes of a turn that failed part-way
+                    raise RuntimeError(chat_turn.error)
+
+                # Create assistant message, recording every agent step's tool calls and results
+                assistant_message = await crud.create_message(
+                    session,
+                    conversation_id=conversation.id,
+                    role="assistant",
+                    content=chat_turn.text,
+                    tool_calls=chat_turn.tool_calls,
+                    tool_responses=chat_turn.tool_responses
+                )
+
+            return ChatResponse(
+                response=chat_turn.text,
+                conversation_id=conversation.id,
+                message_id=assistant_message.id
+            )
+        except Exception as e:
+            # In case of error, create an error response
+            error_message = f"Sorry, I encountered an error processing your request: {str(e)}"
+            if CHAT_SINGLE_TRANSACTION:
+                # The turn was rolled back, so record the user's message alongside the error
+                await crud.create_message(
+                    session,
+                    conversation_id=conversation_id,
+                    role="user",
+                    content=chat_request.message
+                )
+            assistant_message = await crud.create_message(
+                session,
+                conversation_id=conversation_id,
+                role="assistant",
+                content=error_message
             )
-    else:
-        # Create a new conversation
-        conversation = crud.create_conversation(session, user_id)
 
-    # Create user message
-    user_message = crud.create_message(
-        session,
-        conversation_id=conversation.id,
-        role="user",
-        content=chat_request.message
-    )
+            return ChatResponse(
+                response=error_message,
+                conversation_id=conversation_id,
+                message_id=assistant_message.id
+            )
+    finally:
+        if llm_slot is not None:
+            await llm_slot.release()
+
+
+@app.get("/api/{user_id}/chat/jobs/{job_id}", response_model=ChatJobRead)
+async def read_chat_job(
+    request: Request,
+    user_id: str,
+    job_id: int,
+    wait: float = Query(0, ge=0, le=CHAT_JOB_WAIT_MAX_SECONDS, description="Seconds to wait for the job to finish"),
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_authorized_user) # Authorization check
+):
+    """Status of a queued chat turn; with wait, a long poll that returns as soon as it finishes."""
+    if current_user.id != user_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to access this user's conversations"
+        )
 
+    job = await wait_for_chat_job(session, job_id, user_id, wait)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat job not found")
+    if job.status in FINISHED_STATUSES:
+        # A worker wrote the reply, maybe in another process: read the conversation from the primary
+        mark_read_after(request, user_id)
+    return job
+
+def format_sse(event: str, data: dict) -> str:
+    """Encode one Server-Sent Event frame."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@app.post("/api/{user_id}/chat/stream")
+async def stream_chat_with_assistant(
+    user_id: str,
+    chat_request: ChatRequest,
+    request: Request,
+    session: AsyncSession = Depends(get_session),
+    gemini_service: GeminiAIService = Depends(get_gemini_service),
+    current_user: User = Depends(get_authorized_user) # Authorization check
+):
+    """
+    Streaming variant of /chat. Responds with text/event-stream:
+    "conversation" first, then "tool_call"/"tool_result" progress events and "token"
+    events as the reply is generated, and finally "done" with the saved message id.
+    """
+    # Refused turns get a 429/503 status here, before the stream starts
+    llm_slot = await admit_chat_turn(request, user_id, chat_request.message)
     try:
-        # Initialize Gemini API service
-        gemini_service = GeminiAIService()
-
-        # Define the tools for Gemini (function calling)
-        tools_list = [
-            {
-                "name": "add_task",
-                "description": "Create a new task",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "title": {"type": "string", "description": "The task title"},
-                        "description": {"type": "string", "description": "The task description"}
-                    },
-                    "required": ["title"]
-                }
-            },
-            {
-                "name": "list_tasks",
-                "description": "Retrieve tasks from the list",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "status": {"type": "string", "enum": ["all", "pending", "completed"], "description": "Filter tasks by status"}
-                    }
-                }
-            },
-            {
-                "name": "complete_task",
-                "description": "Mark a task as complete",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "task_id": {"type": "integer", "description": "The ID of the task to complete"}
-                    },
-                    "required": ["task_id"]
-                }
-            },
-            {
-                "name": "delete_task",
-                "description": "Remove a task from the list",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "task_id": {"type": "integer", "description": "The ID of the task to delete"}
-                    },
-                    "required": ["task_id"]
-                }
-            },
-            {
-                "name": "update_task",
-                "description": "Modify task title or description",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "task_id": {"type": "integer", "description": "The ID of the task to update"},
-                        "title": {"type": "string", "description": "The new title"},
-                        "description": {"type": "string", "description": "The new description"}
-                    },
-                    "required": ["task_id"]
-                }
-            }
-        ]
-
-        # Get conversation history for context
-        messages = crud.get_messages_by_conversation(session, conversation.id)
-
-        # Prepare messages for Gemini
-        gemini_messages = []
-        for msg in messages:
-            gemini_messages.append({
-                "role": msg.role,
-                "content": msg.content
-            })
-
-        # Add the new user message
-        gemini_messages.append({
-            "role": "user",
-            "content": chat_request.message
-        })
-
-        # Call Gemini API with function calling
-        response_content = gemini_service.chat_with_function_calling(
-            messages=gemini_messages,
-            tools=tools_list,
-            db_session=session,
-            user_id=user_id
-        )
+        conversation = await get_or_create_conversation(session, user_id, chat_request.conversation_id)
+        conversation_id = conversation.id
 
-        # Create assistant message
-        assistant_message = crud.create_message(
+        await crud.create_message(
             session,
-            conversation_id=conversation.id,
-            role="assistant",
-            content=response_content
+            conversation_id=conversation_id,
+            role="user",
+            content=chat_request.message
         )
+        fast_turn = await try_fast_path(chat_request.message, session, user_id)
+        if fast_turn is None:
+            gemini_messages = await build_chat_context(session, conversation, gemini_service)
+            turn_events = gemini_service.stream_chat_with_function_calling(
+                messages=gemini_messages,
+                db_session=session,
+                user_id=user_id
+            )
+        else:
+            turn_events = replay_turn_events(fast_turn)
+    except BaseException:
+        if llm_slot is not None:
+            await llm_slot.release()
+        raise
+
+    async def event_stream():
+        chunks = []
+        steps = []
+        saved = False
+
+        async def save_assistant_message() -> Message:
+            nonlocal saved
+            saved = True
+            return await crud.create_message(
+                session,
+                conversation_id=conversation_id,
+                role="assistant",
+                content="".join(chunks) or "I couldn't process your request. Please try again.",
+                tool_calls={"steps": [step["calls"] for step in steps]} if steps else None,
+                tool_responses={"steps": [step["responses"] for step in steps]} if steps else None
+            )
 
-        return ChatResponse(
-            response=response_content,
-            conversation_id=conversation.id,
-            message_id=assistant_message.id
-        )
-    except Exception as e:
-        # In case of error, create an error response
-        error_message = f"Sorry, I encountered an error processing your request: {str(e)}"
-        assistant_message = crud.create_message(
-            session,
-            conversation_id=conversation.id,
-            role="assistant",
-            content=error_message
-        )
+        yield format_sse("conversation", {"conversation_id": conversation_id})
+        try:
+            async for event in turn_events:
+                if event["event"] == "token":
+                    chunks.append(event["data"]["text"])
+                elif event["event"] == "tool_call":
+                    if event["data"]["step"] == len(steps):
+                        steps.append({"calls": [], "responses": []})
+                    steps[-1]["calls"].append({"name": event["data"]["name"], "arguments": event["data"]["arguments"]})
+                elif event["event"] == "tool_result":
+                    steps[-1]["responses"].append({"name": event["data"]["name"], "response": event["data"]["response"]})
+                yield format_sse(event["event"], event["data"])
+
+            assistant_message = await save_assistant_message()
+            yield format_sse("done", {"conversation_id": conversation_id, "message_id": assistant_message.id})
+        except Exception as e:
+            error_message = f"Sorry, I encountered an error processing your request: {str(e)}"
+            chunks.append(("\n\n" if chunks else "") + error_message)
+            yield format_sse("error", {"detail": error_message})
+        finally:
+            if llm_slot is not None:
+                await llm_slot.release()
+            # Persist whatever was generated, even if the client went away mid-stream
+            if not saved:
+                with anyio.CancelScope(shield=True):
+                    await save_assistant_message()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Also runs if the client disconnects before event_stream starts
+        background=BackgroundTask(llm_slot.release) if llm_slot is not None else None
+    )
 
-        return ChatResponse(
-            response=error_message,
-            conversation_id=conversation.id,
-            message_id=assistant_message.id
+def require_metrics_token(request: Request) -> None:
+    """Dependency admitting only requests bearing METRICS_TOKEN."""
+    if METRICS_TOKEN is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid metrics token",
+            headers={"WWW-Authenticate": "Bearer"},
         )
 
-@app.get("/api/{user_id}/conversations", response_model=List[ConversationRead])
-def read_conversations(
+@app.get("/metrics", dependencies=[Depends(require_metrics_token)])
+async def read_metrics(request: Request):
+    """Process-local counters for the chat pipeline."""
+    gemini_service = request.app.state.gemini_service
+    return {
+        "chat_fast_path": fast_path_stats.snapshot(),
+        "llm_response_cache": gemini_service.stats() if isinstance(gemini_service, CachedGeminiService) else None,
+        "llm_admission": request.app.state.llm_limiter.stats(),
+        "chat_rate_limit": request.app.state.chat_rate_limiter.stats(),
+        "chat_jobs": request.app.state.chat_job_pool.stats() if request.app.state.chat_job_pool else None,
+        "task_events": task_event_bus.stats(),
+        "read_replica": read_router.stats(),
+    }
+
+@app.get("/api/{user_id}/conversations", response_model=List[ConversationListItem])
+async def read_conversations(
     user_id: str,  # Changed from int to str to match User.id type
-    session: Session = Depends(get_session),
+    limit: Optional[int] = Query(None, ge=1, le=CONVERSATION_PAGE_SIZE_MAX, description="page size; without limit or cursor the whole list is returned"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+    session: AsyncSession = Depends(get_read_session),
     current_user: User = Depends(get_authorized_user) # Authorization check
 ):
     # Verify the user_id in the path matches the authenticated user
@@ -310,14 +775,25 @@ def read_conversations(
             detail="Not authorized to access this user's conversations"
         )
 
-    conversations = crud.get_conversations_by_user(session, user_id)
-    return conversations
+    # Most recently active first, with message counts and previews from the same query
+    if limit is None and cursor is not None:
+        limit = CONVERSATION_PAGE_SIZE_DEFAULT
+    rows, next_key = await crud.get_conversations_page(session, user_id, limit=limit, after=decode_cursor(cursor))
+    headers = {}
+    if next_key is not None:
+        headers["X-Next-Cursor"] = encode_cursor(*next_key)
+
+    body = conversation_list_adapter.dump_json(conversation_list_adapter.validate_python(rows, from_attributes=True))
+    return Response(content=body, media_type="application/json", headers=headers)
 
 @app.get("/api/{user_id}/conversations/{conversation_id}", response_model=ConversationWithMessages)
-def read_conversation(
+async def read_conversation(
     user_id: str,  # Changed from int to str to match User.id type
     conversation_id: int,
-    session: Session = Depends(get_session),
+    limit: int = Query(MESSAGE_PAGE_SIZE_DEFAULT, ge=1, le=MESSAGE_PAGE_SIZE_MAX),
+    before: Optional[str] = Query(None, description="X-Before-Cursor value: page of older messages"),
+    after: Optional[str] = Query(None, description="X-After-Cursor value: page of newer messages"),
+    session: AsyncSession = Depends(get_read_session),
     current_user: User = Depends(get_authorized_user) # Authorization check
 ):
     # Verify the user_id in the path matches the authenticated user
@@ -326,37 +802,37 @@ def read_conversation(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to access this user's conversations"
         )
+    if before and after:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Use either before or after, not both")
 
-    conversation = crud.get_conversation_by_id(session, conversation_id, user_id)
+    conversation = await crud.get_conversation_by_id(session, conversation_id, user_id)
     if not conversation:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Conversation not found")
 
-    # Get messages for this conversation
-    messages = crud.get_messages_by_conversation(session, conversation_id)
-
-    # Convert to response model manually to avoid from_orm issues
-    conversation_response = ConversationWithMessages(
-        id=conversation.id,
-        user_id=conversation.user_id,
-        created_at=conversation.created_at,
-        updated_at=conversation.updated_at,
-        messages=[MessageRead(
-            id=msg.id,
-            conversation_id=msg.conversation_id,
-            role=msg.role,
-            content=msg.content,
-            created_at=msg.created_at,
-            tool_calls=msg.tool_calls,
-            tool_responses=msg.tool_responses
-        ) for msg in messages]
+    # The most recent messages by default; cursors page through (created_at, id)
+    before_key, after_key = decode_cursor(before), decode_cursor(after)
+    messages, has_more = await crud.get_messages_page(
+        session, conversation_id, limit=limit, before=before_key, after=after_key
     )
-
-    return conversation_response
+    headers = {}
+    if messages:
+        # Paging forward always leaves older messages behind
+        if has_more or after_key is not None:
+            headers["X-Before-Cursor"] = encode_cursor(messages[0].created_at, messages[0].id)
+        # Also given on the newest page, so clients can poll for new messages from there
+        headers["X-After-Cursor"] = encode_cursor(messages[-1].created_at, messages[-1].id)
+    elif after_key is not None:
+        headers["X-After-Cursor"] = after
+
+    body = conversation_messages_adapter.dump_json(conversation_messages_adapter.validate_python(
+        {**conversation.model_dump(), "messages": messages}, from_attributes=True
+    ))
+    return Response(content=body, media_type="application/json", headers=headers)
 
 @app.post("/api/{user_id}/conversations", response_model=ConversationRead, status_code=status.HTTP_201_CREATED)
-def create_conversation_endpoint(
+async def create_conversation_endpoint(
     user_id: str,  # Changed from int to str to match User.id type
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_session),
     current_user: User = Depends(get_authorized_user) # Authorization check
 ):
     # Verify the user_id in the path matches the authenticated user
@@ -366,5 +842,5 @@ def create_conversation_endpoint(
             detail="Not authorized to create conversations for this user"
         )
 
-    conversation = crud.create_conversation(session, user_id)
+    conversation = await crud.create_conversation(session, user_id)
     return conversation
@@ -18,6 +18,15 @@ class User(SQLModel, table=True):
     conversations: List["Conversation"] = Relationship(back_populates="user")
 
 class Task(SQLModel, table=True):
+    # Composite indexes backing keyset pagination of a user's tasks (see crud.get_tasks_page)
+    __table_args__ = (
+        sa.Index("ix_task_owner_id_id", "owner_id", "id"),
+        sa.Index("ix_task_owner_id_completed_id", "owner_id", "completed", "id"),
+        sa.Index("ix_task_owner_id_updated_at_id", "owner_id", "updated_at", "id"),
+        # Delta sync (see crud.get_task_changes)
+        sa.Index("ix_task_owner_id_change_seq", "owner_id", "change_seq"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     title: str
     description: Optional[str] = None
@@ -25,26 +34,69 @@ class Task(SQLModel, table=True):
 
     created_at: datetime.datetime = Field(default_factory=datetime.datetime.utcnow, nullable=False)
     updated_at: datetime.datetime = Field(default_factory=datetime.datetime.utcnow, nullable=False)
+    # Position of the task's last write in its owner's change sequence (TaskChangeCounter)
+    change_seq: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
 
     owner_id: str = Field(foreign_key="users.id")
     owner: Optional["User"] = Relationship(back_populates="tasks")
 
+class TaskChangeCounter(SQLModel, table=True):
+    # Last change_seq handed out for an owner's tasks. Each task write takes the next value under
+    # this row's lock, so an owner's changes commit in change_seq order and a sync watermark
+    # never skips a change that commits later.
+    __tablename__ = "task_change_counters"
+
+    owner_id: str = Field(foreign_key="users.id", primary_key=True)
+    last_seq: int = 0
+    # Highest change_seq whose tombstones have been pruned (app.tombstones); a sync from an
+    # older watermark could miss deletions and has to start over
+    pruned_seq: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+
+class TaskTombstone(SQLModel, table=True):
+    # A deleted task, kept for TASK_TOMBSTONE_RETENTION_DAYS so delta sync can report the deletion
+    __tablename__ = "task_tombstones"
+    __table_args__ = (
+        sa.Index("ix_task_tombstones_owner_id_change_seq", "owner_id", "change_seq"),
+        sa.Index("ix_task_tombstones_deleted_at", "deleted_at"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    task_id: int
+    owner_id: str = Field(foreign_key="users.id")
+    change_seq: int
+    deleted_at: datetime.datetime = Field(default_factory=datetime.datetime.utcnow, nullable=False)
+
 class Conversation(SQLModel, table=True):
     __tablename__ = "conversations"
+    # Keyset pagination of a user's conversations, most recently active first (see crud.get_conversations_page)
+    __table_args__ = (
+        sa.Index("ix_conversations_user_id_updated_at_id", "user_id", "updated_at", "id"),
+    )
 
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: str = Field(foreign_key="users.id", index=True)
     created_at: datetime.datetime = Field(default_factory=datetime.datetime.utcnow, nullable=False)
     updated_at: datetime.datetime = Field(default_factory=datetime.datetime.utcnow, nullable=False)
+    # Rolling summary of older turns, covering messages up to and including summary_message_id
+    summary: Optional[str] = Field(default=None, sa_column=sa.Column(sa.Text))
+    summary_message_id: Optional[int] = None
 
     user: Optional["User"] = Relationship(back_populates="conversations")
     messages: List["Message"] = Relationship(back_populates="conversation")
 
 class Message(SQLModel, table=True):
     __tablename__ = "messages"
+    # Keyset pagination of a conversation's messages (see crud.get_messages_page); also serves
+    # every other lookup by conversation_id, so that column has no index of its own
+    __table_args__ = (
+        sa.Index("ix_messages_conversation_id_created_at_id", "conversation_id", "created_at", "id"),
+        # Message ids must never be reused once archived messages are deleted
+        # (summary_message_id and MessageArchive ranges rely on it); Postgres sequences never are
+        {"sqlite_autoincrement": True},
+    )
 
     id: Optional[int] = Field(default=None, primary_key=True)
-    conversation_id: int = Field(foreign_key="conversations.id", index=True)
+    conversation_id: int = Field(foreign_key="conversations.id")
     role: str = Field(sa_column_kwargs={"comment": "user, assistant, system, or tool"})
     content: str = Field(sa_column=sa.Column(sa.Text))
     created_at: datetime.datetime = Field(default_factory=datetime.datetime.utcnow, nullable=False)
@@ -52,3 +104,51 @@ class Message(SQLModel, table=True):
     tool_responses: Optional[dict] = Field(default=None, sa_column=sa.Column(sa.JSON))
 
     conversation: Optional["Conversation"] = Relationship(back_populates="messages")
+
+class MessageArchive(SQLModel, table=True):
+    # Messages of an inactive conversation, moved out of "messages" by app.compaction as one
+    # zlib-compressed JSON array. Conversation.summary covers everything up to last_message_id.
+    __tablename__ = "message_archives"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    conversation_id: int = Field(foreign_key="conversations.id", index=True)
+    first_message_id: int
+    last_message_id: int
+    message_count: int
+    # Role and start of the last archived message, for conversation list previews
+    last_message_role: Optional[str] = None
+    last_message_preview: Optional[str] = Field(default=None, sa_column=sa.Column(sa.Text))
+    payload: bytes = Field(sa_column=sa.Column(sa.LargeBinary, nullable=False))
+    archived_at: datetime.datetime = Field(default_factory=datetime.datetime.utcnow, nullable=False)
+
+class ChatJob(SQLModel, table=True):
+    # A chat turn queued by POST /chat in job mode and run by the app.chat_jobs worker pool.
+    # status: queued -> running -> succeeded | failed. A running job whose lease (locked_until)
+    # has lapsed belonged to a worker that died and is claimed again.
+    __tablename__ = "chat_jobs"
+    __table_args__ = (
+        sa.Index("ix_chat_jobs_status_id", "status", "id"),
+        sa.Index("ix_chat_jobs_conversation_id_id", "conversation_id", "id"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: str = Field(foreign_key="users.id", index=True)
+    conversation_id: int = Field(foreign_key="conversations.id")
+    user_message_id: int
+    status: str = Field(default="queued")
+    attempts: int = 0
+    locked_until: Optional[datetime.datetime] = None
+    assistant_message_id: Optional[int] = None
+    response: Optional[str] = Field(default=None, sa_column=sa.Column(sa.Text))
+    error: Optional[str] = Field(default=None, sa_column=sa.Column(sa.Text))
+    created_at: datetime.datetime = Field(default_factory=datetime.datetime.utcnow, nullable=False)
+    updated_at: datetime.datetime = Field(default_factory=datetime.datetime.utcnow, nullable=False)
+
+class SchemaVersion(SQLModel, table=True):
+    # Fingerprint of the models the database schema was last brought up to date with; lets
+    # startup skip create_all and the upgrade checks when nothing changed (app.database.ensure_schema)
+    __tablename__ = "schema_version"
+
+    id: int = Field(default=1, primary_key=True)
+    fingerprint: str
+    applied_at: datetime.datetime = Field(default_factory=datetime.datetime.utcnow, nullable=False)
@@ -0,0 +1,27 @@
+import base64
+import datetime
+import json
+from typing import Any, Optional, Tuple
+
+from fastapi import HTTPException, status
+
+# Keyset cursors are opaque to clients: base64url(JSON [sort_value, id]).
+# Datetimes are tagged so they round-trip back to datetime objects for the SQL comparison.
+
+def encode_cursor(sort_value: Any, row_id: int) -> str:
+    if isinstance(sort_value, datetime.datetime):
+        sort_value = {"dt": sort_value.isoformat()}
+    raw = json.dumps([sort_value, row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[Any, int]]:
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if isinstance(sort_value, dict):
+            sort_value = datetime.datetime.fromisoformat(sort_value["dt"])
+        return sort_value, int(row_id)
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
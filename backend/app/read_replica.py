@@ -0,0 +1,195 @@
+import contextlib
+import hashlib
+import hmac
+import logging
+import math
+import os
+import time
+from typing import Optional
+
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+from starlette.requests import HTTPConnection
+
+from app.cache import TTLCache
+from app.database import WRITER_KEY, async_session_factory, ensure_schema, read_session_factory
+from app.security import SECRET_KEY
+
+logger = logging.getLogger(__name__)
+
+# Read routing for DATABASE_READ_URL. get_read_session gives read-only routes a replica session,
+# except that:
+# - a user who wrote in the last READ_YOUR_WRITES_SECONDS reads from the primary, so they never
+#   get the replica's view from before their own change. The pin travels with the client: write
+#   responses (and finished chat job polls) carry a signed "read after" token as the X-Read-After
+#   header and a cookie, which later reads send back to whichever worker serves them. Writes
+#   committed in this process also pin the user here, for clients that send neither;
+# - a replica that fails to connect (or drops a connection mid-request) is skipped for
+#   READ_REPLICA_RETRY_SECONDS and reads go to the primary meanwhile.
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+READ_REPLICA_RETRY_SECONDS = float(os.getenv("READ_REPLICA_RETRY_SECONDS", "30"))
+READ_PIN_MAX_USERS = int(os.getenv("READ_PIN_MAX_USERS", "10000"))
+
+_WROTE_KEY = "read_replica_wrote"
+
+_pinned = TTLCache(maxsize=READ_PIN_MAX_USERS, ttl=READ_YOUR_WRITES_SECONDS)
+
+def pin_to_primary(user_id: str) -> None:
+    _pinned.set(user_id, True)
+
+def is_pinned(user_id: str) -> bool:
+    return _pinned.get(user_id, False)
+
+READ_AFTER_HEADER = "X-Read-After"
+READ_AFTER_COOKIE = "read_after"
+_SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+_READ_AFTER_STATE_KEY = "read_after_user_id"
+
+def _read_after_signature(user_id: str, until: int) -> str:
+    return hmac.new(SECRET_KEY.encode(), f"read_after|{user_id}|{until}".encode(), hashlib.sha256).hexdigest()[:32]
+
+def issue_read_after_token(user_id: str) -> str:
+    """Signed token sending user_id's reads to the primary until READ_YOUR_WRITES_SECONDS from now."""
+    until = math.ceil(time.time() + READ_YOUR_WRITES_SECONDS)
+    return f"{until}.{_read_after_signature(user_id, until)}"
+
+def read_after_token_valid(token: Optional[str], user_id: str) -> bool:
+    until, _, signature = (token or "").partition(".")
+    if not until.isdigit() or int(until) < time.time():
+        return False
+    return hmac.compare_digest(signature, _read_after_signature(user_id, int(until)))
+
+def mark_read_after(connection: HTTPConnection, user_id: str) -> None:
+    """Have this request's response carry a read-after token, e.g. when a chat job it polled has finished."""
+    connection.scope.setdefault("state", {})[_READ_AFTER_STATE_KEY] = user_id
+
+class ReadYourWritesMiddleware:
+    """
+    ASGI middleware issuing read-after tokens: on successful writes to /api/{user_id}/...
+    and on responses marked with mark_read_after. Does nothing without a read replica.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or read_session_factory is None:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_token(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                user_id = scope.get("state", {}).get(_READ_AFTER_STATE_KEY)
+                if user_id is None and scope["method"] not in _SAFE_METHODS:
+                    user_id = scope.get("path_params", {}).get("user_id")
+                if user_id:
+                    token = issue_read_after_token(user_id)
+                    cookie = (
+                        f"{READ_AFTER_COOKIE}={token}; Max-Age={math.ceil(READ_YOUR_WRITES_SECONDS)}; "
+                        "Path=/; HttpOnly; SameSite=Lax"
+                    )
+                    message = {**message, "headers": [
+                        *message.get("headers", []),
+                        (READ_AFTER_HEADER.lower().encode(), token.encode()),
+                        (b"set-cookie", cookie.encode()),
+                    ]}
+            await send(message)
+
+        await self.app(scope, receive, send_with_token)
+
+class ReadRouter:
+    """Chooses the replica or the primary for each read session and tracks the replica's health."""
+
+    def __init__(self, replica_factory, primary_factory, retry_seconds: float, timer=time.monotonic):
+        self.replica_factory = replica_factory
+        self.primary_factory = primary_factory
+        self.retry_seconds = retry_seconds
+        self._timer = timer
+        self._unhealthy_until = 0.0
+        self.replica_reads = 0
+        self.pinned_reads = 0
+        self.fallback_reads = 0
+        self.replica_failures = 0
+
+    @property
+    def healthy(self) -> bool:
+        return self._timer() >= self._unhealthy_until
+
+    def stats(self) -> dict:
+        return {
+            "configured": self.replica_factory is not None,
+            "healthy": self.healthy,
+            "replica_reads": self.replica_reads,
+            "pinned_reads": self.pinned_reads,
+            "fallback_reads": self.fallback_reads,
+            "replica_failures": self.replica_failures,
+            "pinned_users": len(_pinned),
+        }
+
+    def _mark_unhealthy(self, error: Exception) -> None:
+        logger.warning("Read replica unavailable, reading from the primary for %ss: %s", self.retry_seconds, error)
+        self.replica_failures += 1
+        self._unhealthy_until = self._timer() + self.retry_seconds
+
+    def _use_replica(self, user_id: Optional[str], read_after: Optional[str] = None) -> bool:
+        if self.replica_factory is None:
+            return False
+        if user_id and (is_pinned(user_id) or read_after_token_valid(read_after, user_id)):
+            self.pinned_reads += 1
+            return False
+        if not self.healthy:
+            self.fallback_reads += 1
+            return False
+        return True
+
+    @contextlib.asynccontextmanager
+    async def session(self, user_id: Optional[str] = None, read_after: Optional[str] = None):
+        if self._use_replica(user_id, read_after):
+            async with self.replica_factory() as session:
+                try:
+                    # Check a connection out up front (pool_pre_ping tests it), so a dead
+                    # replica is noticed here, while the primary can still take the read
+                    await session.connection()
+                except Exception as e:
+                    self._mark_unhealthy(e)
+                    self.fallback_reads += 1
+                else:
+                    self.replica_reads += 1
+                    try:
+                        yield session
+                    except sa.exc.DBAPIError as e:
+                        if e.connection_invalidated:
+                            self._mark_unhealthy(e)
+                        raise
+                    return
+        async with self.primary_factory() as session:
+            yield session
+
+read_router = ReadRouter(read_session_factory, async_session_factory, READ_REPLICA_RETRY_SECONDS)
+
+async def get_read_session(connection: HTTPConnection):
+    """Dependency for read-only routes: a replica session where possible, else a primary one."""
+    await ensure_schema()
+    read_after = connection.headers.get(READ_AFTER_HEADER) or connection.cookies.get(READ_AFTER_COOKIE)
+    async with read_router.session(connection.path_params.get("user_id"), read_after) as session:
+        yield session
+
+# A transaction that wrote pins its request's user (WRITER_KEY) once it commits
+@sa.event.listens_for(Session, "after_flush")
+def _note_flushed_writes(session, flush_context):
+    session.info[_WROTE_KEY] = True
+
+@sa.event.listens_for(Session, "do_orm_execute")
+def _note_statement_writes(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info[_WROTE_KEY] = True
+
+@sa.event.listens_for(Session, "after_commit")
+def _pin_committed_writers(session):
+    user_id = session.info.get(WRITER_KEY)
+    if session.info.pop(_WROTE_KEY, False) and user_id:
+        pin_to_primary(user_id)
+
+@sa.event.listens_for(Session, "after_rollback")
+def _discard_rolled_back_writes(session):
+    session.info.pop(_WROTE_KEY, None)
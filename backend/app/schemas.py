@@ -1,5 +1,5 @@
 from typing import Optional, List, Dict, Any
-from sqlmodel import SQLModel
+from sqlmodel import Field, SQLModel
 import datetime
 from pydantic import EmailStr # Added EmailStr import
 
@@ -36,10 +36,49 @@ class TaskRead(TaskBase):
     created_at: datetime.datetime
     updated_at: datetime.datetime
     owner_id: str # Include owner_id for API response - changed to string to match User.id
+    change_seq: int # Delta sync watermark of the task's last write
+
+class TaskTombstoneRead(SQLModel):
+    id: int # The deleted task's id
+    change_seq: int
+    deleted_at: datetime.datetime
+
+class TaskChanges(SQLModel):
+    changed: List[TaskRead]
+    deleted: List[TaskTombstoneRead]
+    # Pass as ?since= next time; more changes are waiting when has_more is set
+    watermark: int
+    has_more: bool
+
+class TaskSearchHit(TaskRead):
+    rank: float # Higher is a better match
 
 class TaskCompletionStatus(SQLModel):
     completed: bool
 
+# --- Bulk Task Schemas ---
+
+TASK_BATCH_MAX_SIZE = 500
+
+class TaskBatchCreate(SQLModel):
+    tasks: List[TaskCreate] = Field(min_length=1, max_length=TASK_BATCH_MAX_SIZE)
+
+class TaskBatchUpdateItem(TaskUpdate):
+    id: int
+
+class TaskBatchUpdate(SQLModel):
+    tasks: List[TaskBatchUpdateItem] = Field(min_length=1, max_length=TASK_BATCH_MAX_SIZE)
+
+class TaskBatchIds(SQLModel):
+    ids: List[int] = Field(min_length=1, max_length=TASK_BATCH_MAX_SIZE)
+
+class TaskBatchCompletion(TaskBatchIds):
+    completed: bool = True
+
+class TaskBatchResult(SQLModel):
+    tasks: List[TaskRead]
+    missing_ids: List[int] = [] # Requested IDs that don't exist or belong to another user
+
 # --- Chat Schemas ---
 
 class ChatRequest(SQLModel):
@@ -76,5 +115,21 @@ class ConversationRead(ConversationBase):
     created_at: datetime.datetime
     updated_at: datetime.datetime
 
+class ConversationListItem(ConversationRead):
+    message_count: int
+    last_message_role: Optional[str] = None
+    last_message_preview: Optional[str] = None
+
 class ConversationWithMessages(ConversationRead):
     messages: List[MessageRead] = []
+
+class ChatJobRead(SQLModel):
+    id: int
+    status: str
+    conversation_id: int
+    user_message_id: int
+    assistant_message_id: Optional[int] = None
+    response: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime.datetime
+    updated_at: datetime.datetime
@@ -1,20 +1,21 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from dotenv import load_dotenv
 import os
+import time
+import sqlalchemy as sa
 
 from app.database import get_session
 from app.models import User
 from app.schemas import TokenData # Assuming TokenData has user ID
-
-# Load environment variables
-load_dotenv()
+from app.cache import TTLCache
 
 SECRET_KEY = os.getenv("BETTER_AUTH_SECRET")
 if not SECRET_KEY:
@@ -23,7 +24,38 @@ if not SECRET_KEY:
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Verified tokens and user rows are cached in-process so authenticated requests skip the users lookup.
+# With AUTH_STATELESS the signed 'sub' claim alone is trusted and the users table is never queried;
+# a deleted user's token then stays usable until it expires.
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+AUTH_STATELESS = os.getenv("AUTH_STATELESS", "false").lower() in ("1", "true", "yes")
+
+_token_cache = TTLCache(maxsize=AUTH_CACHE_MAX_ENTRIES, ttl=AUTH_CACHE_TTL_SECONDS)
+_user_cache = TTLCache(maxsize=AUTH_CACHE_MAX_ENTRIES, ttl=AUTH_CACHE_TTL_SECONDS)
+
+# bcrypt cost factor. Hashes made with a different cost are re-hashed on the next successful login.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Hashing runs on its own bounded pool so signup/login bursts can't starve the event loop or
+# the default threadpool. At most PASSWORD_HASH_MAX_PENDING jobs run or wait at once; beyond that
+# a request waits up to PASSWORD_HASH_QUEUE_TIMEOUT seconds for a slot, then gets a 503.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(PASSWORD_HASH_WORKERS * 4)))
+PASSWORD_HASH_QUEUE_TIMEOUT = float(os.getenv("PASSWORD_HASH_QUEUE_TIMEOUT", "2"))
+
+def make_password_context(rounds: int) -> CryptContext:
+    # min == max == default rounds, so any hash with another cost is flagged by verify_and_update
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__rounds=rounds,
+        bcrypt__min_rounds=rounds,
+        bcrypt__max_rounds=rounds,
+    )
+
+pwd_context = make_password_context(BCRYPT_ROUNDS)
+_password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+_password_slots = asyncio.Semaphore(PASSWORD_HASH_MAX_PENDING)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login") # Needs to match our login endpoint
 
 # --- Password Hashing ---
@@ -35,6 +67,30 @@ def get_password_hash(password: str) -> str:
     truncated_password = password[:72] if len(password) > 72 else password
     return pwd_context.hash(truncated_password)
 
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify a password; also returns a new hash when the stored one uses an outdated cost."""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+async def _run_password_job(func, *args):
+    try:
+        await asyncio.wait_for(_password_slots.acquire(), timeout=PASSWORD_HASH_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many sign-in requests, please retry shortly",
+            headers={"Retry-After": "1"},
+        )
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_password_executor, func, *args)
+    finally:
+        _password_slots.release()
+
+async def hash_password_async(password: str) -> str:
+    return await _run_password_job(get_password_hash, password)
+
+async def verify_and_update_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return await _run_password_job(verify_and_update_password, plain_password, hashed_password)
+
 # --- JWT Functions ---
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
@@ -58,22 +114,57 @@ def decode_access_token(token: str) -> TokenData: # Type hint for TokenData
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+def verify_access_token(token: str) -> Optional[str]:
+    """Return the token's user ID, reusing earlier verifications until the cache TTL or token expiry."""
+    user_id = _token_cache.get(token)
+    if user_id is not None:
+        return user_id
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    user_id = payload.get("sub")
+    if user_id is not None and payload.get("exp") is not None:
+        _token_cache.set(token, user_id, ttl=payload["exp"] - time.time())
+    return user_id
+
+def invalidate_cached_user(user_id: str) -> None:
+    _user_cache.pop(user_id)
+
+@sa.event.listens_for(User, "after_update")
+@sa.event.listens_for(User, "after_delete")
+def _invalidate_changed_user(mapper, connection, target):
+    invalidate_cached_user(target.id)
+
 # --- Authentication Dependency ---
-async def get_current_user(token: str = Depends(oauth2_scheme), session: Session = Depends(get_session)) -> User:
+async def get_current_user(token: str = Depends(oauth2_scheme), session: AsyncSession = Depends(get_session)) -> User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    token_data = decode_access_token(token) # Use decode_access_token returning TokenData
-    user_id = token_data.id # Access id attribute
+    user_id = verify_access_token(token)
     if user_id is None:
         raise credentials_exception
-    
+
+    if AUTH_STATELESS:
+        # Only the id is populated; authorization needs nothing else
+        return User(id=user_id)
+
+    user = _user_cache.get(user_id)
+    if user is not None:
+        return user
+
     # Fetch user from DB using the ID
-    user = session.get(User, user_id) # User ID is now a string/UUID
+    user = await session.get(User, user_id) # User ID is now a string/UUID
     if user is None:
         raise credentials_exception
+    # Cache a detached copy so it is never tied to (or refreshed through) a request's session
+    _user_cache.set(user_id, User(**user.model_dump()))
     return user
 
 async def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
@@ -0,0 +1,144 @@
+import logging
+import os
+import random
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Optional, Set, Tuple
+
+import sqlalchemy as sa
+from sqlalchemy.engine import Engine
+
+# Per-request SQL statistics, collected from engine events instead of echoing every statement.
+# Each HTTP response gets a Server-Timing header; a sample of requests (plus every slow one) is
+# logged at INFO, and a WARNING is logged when a request repeats one statement shape more than
+# SQL_N_PLUS_ONE_THRESHOLD times. Both carry their fields in the record's extra for structured
+# log handlers.
+SQL_METRICS_ENABLED = os.getenv("SQL_METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+SQL_METRICS_LOG_SAMPLE_RATE = float(os.getenv("SQL_METRICS_LOG_SAMPLE_RATE", "0.01"))
+SQL_METRICS_SLOW_REQUEST_MS = float(os.getenv("SQL_METRICS_SLOW_REQUEST_MS", "500"))
+SQL_N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", "10"))
+
+_STATEMENT_LOG_CHARS = 300
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class RequestSQLStats:
+    count: int = 0
+    total_seconds: float = 0.0
+    slowest_seconds: float = 0.0
+    slowest_statement: Optional[str] = None
+    shapes: Counter = field(default_factory=Counter)
+
+    def record(self, statement: str, seconds: float) -> None:
+        self.count += 1
+        self.total_seconds += seconds
+        if seconds > self.slowest_seconds:
+            self.slowest_seconds = seconds
+            self.slowest_statement = statement
+        self.shapes[statement_shape(statement)] += 1
+
+_current_stats: ContextVar[Optional[RequestSQLStats]] = ContextVar("sql_request_stats", default=None)
+
+# (route, shape) pairs already reported, so a hot endpoint warns once per process
+_reported_repeats: Set[Tuple[str, str]] = set()
+
+_IN_LIST = re.compile(r"\((?:\s*(?:\?|\$\d+|%s|:\w+)\s*,)+\s*(?:\?|\$\d+|%s|:\w+)\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+def statement_shape(statement: str) -> str:
+    """Normalise a statement so executions differing only in expanded IN-list length compare equal."""
+    return _IN_LIST.sub("(...)", _WHITESPACE.sub(" ", statement).strip())
+
+# Registered on the Engine class so every engine (the async engine's sync core included) reports.
+# The async engine runs these inside a greenlet that shares the request's contextvars.
+@sa.event.listens_for(Engine, "before_cursor_execute")
+def _start_timer(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._sql_metrics_started = time.perf_counter()
+
+@sa.event.listens_for(Engine, "after_cursor_execute")
+def _record_statement(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_stats.get()
+    started = getattr(context, "_sql_metrics_started", None)
+    if stats is None or started is None:
+        return
+    stats.record(statement, time.perf_counter() - started)
+
+def server_timing_header(stats: RequestSQLStats) -> str:
+    return (
+        f'db;dur={stats.total_seconds * 1000:.1f};desc="{stats.count} queries", '
+        f"db-slowest;dur={stats.slowest_seconds * 1000:.1f}"
+    )
+
+def _report(scope, status: Optional[int], stats: RequestSQLStats) -> None:
+    route = scope.get("route")
+    route_path = getattr(route, "path", scope.get("path", ""))
+
+    for shape, count in stats.shapes.items():
+        if count > SQL_N_PLUS_ONE_THRESHOLD and (route_path, shape) not in _reported_repeats:
+            _reported_repeats.add((route_path, shape))
+            logger.warning(
+                "sql_n_plus_one %s %s ran one statement %d times",
+                scope.get("method"), route_path, count,
+                extra={
+                    "event": "sql_n_plus_one",
+                    "method": scope.get("method"),
+                    "route": route_path,
+                    "count": count,
+                    "statement": shape[:_STATEMENT_LOG_CHARS],
+                },
+            )
+
+    db_ms = stats.total_seconds * 1000
+    if db_ms >= SQL_METRICS_SLOW_REQUEST_MS or random.random() < SQL_METRICS_LOG_SAMPLE_RATE:
+        logger.info(
+            "sql_request %s %s %s: %d queries, %.2f ms",
+            scope.get("method"), route_path, status, stats.count, db_ms,
+            extra={
+                "event": "sql_request",
+                "method": scope.get("method"),
+                "route": route_path,
+                "status": status,
+                "queries": stats.count,
+                "db_ms": round(db_ms, 2),
+                "slowest_ms": round(stats.slowest_seconds * 1000, 2),
+                "slowest_statement": (stats.slowest_statement or "")[:_STATEMENT_LOG_CHARS],
+            },
+        )
+
+class SQLMetricsMiddleware:
+    """
+    ASGI middleware that collects SQL statistics per HTTP request. Streaming responses get
+    the header as of their first byte; the log line covers the whole request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not SQL_METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestSQLStats()
+        token = _current_stats.set(stats)
+        status = None
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing_header(stats).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_stats.reset(token)
+            _report(scope, status, stats)
@@ -0,0 +1,277 @@
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import uuid
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set
+
+import asyncpg
+import sqlalchemy as sa
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+
+from app.database import DATABASE_URL
+from app.read_replica import pin_to_primary
+from app.schemas import TaskRead
+
+logger = logging.getLogger(__name__)
+
+# Task deltas pushed to GET /ws/{user_id}. The task writes in app.crud record events on the
+# session; they are published when the transaction commits and dropped if it rolls back.
+# Sockets held by this process get them from the in-process bus. With
+# TASK_EVENTS_BACKEND=postgres, events are also relayed over LISTEN/NOTIFY on the app's
+# database, so sockets held by other workers (and writes made by chat job workers) are covered.
+TASK_EVENTS_BACKEND = os.getenv("TASK_EVENTS_BACKEND", "memory")  # "memory" or "postgres"
+TASK_EVENTS_CHANNEL = os.getenv("TASK_EVENTS_CHANNEL", "task_events")
+# Deltas buffered per socket; a client that falls further behind is told to resync instead
+TASK_EVENTS_QUEUE_SIZE = int(os.getenv("TASK_EVENTS_QUEUE_SIZE", "100"))
+TASK_EVENTS_HEARTBEAT_SECONDS = float(os.getenv("TASK_EVENTS_HEARTBEAT_SECONDS", "30"))
+
+_PENDING_KEY = "task_events_pending"
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+_MAX_NOTIFY_BYTES = 7900
+# Owner ids are 36-character UUIDs; 100 of them stay well under the limit
+_RESYNC_OWNERS_PER_PAYLOAD = 100
+
+RESYNC_EVENT = {"type": "resync"}
+
+def record_task_events(session, owner_id: str, kind: str, tasks: List[Any], change_seq: Optional[int] = None) -> None:
+    """
+    Queue task.<kind> events ("created", "updated" or "deleted") for publishing on commit.
+    Created/updated tasks are serialised at commit, once they have their ids; deletions
+    carry the change_seq of their tombstone.
+    """
+    pending = session.info.setdefault(_PENDING_KEY, [])
+    for task in tasks:
+        # A deleted row's attributes may be gone after the flush, so keep what is needed now
+        pending.append((kind, owner_id, {"id": task.id, "change_seq": change_seq} if kind == "deleted" else task))
+
+def _event(kind: str, owner_id: str, task: Any) -> Dict[str, Any]:
+    if kind == "deleted":
+        return {"type": "task.deleted", "owner_id": owner_id, "task": task}
+    return {"type": f"task.{kind}", "owner_id": owner_id, "task": TaskRead.model_validate(task).model_dump(mode="json")}
+
+class Subscription:
+    """One socket's bounded queue of events for one owner."""
+
+    def __init__(self, owner_id: str, maxsize: int):
+        self.owner_id = owner_id
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize)
+
+    def put(self, event: Dict[str, Any]) -> bool:
+        """Queue an event; on overflow the backlog is replaced by a single resync. False if dropped."""
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self._queue.put_nowait(RESYNC_EVENT)
+            return False
+
+    async def get(self) -> Dict[str, Any]:
+        return await self._queue.get()
+
+class PostgresNotifyBackend:
+    """
+    Relays events between processes with NOTIFY on one channel, over a dedicated asyncpg connection.
+
+    asyncpg runs one operation at a time per connection, so payloads are queued and sent in
+    order by a single sender task.
+    """
+
+    _RECONNECT_SECONDS = 1.0
+
+    def __init__(self, dsn: str, channel: str):
+        self.dsn = dsn
+        self.channel = channel
+        self._connection = None
+        self._connected = asyncio.Event()
+        self._outbox: asyncio.Queue = asyncio.Queue()
+        self._runners: List[asyncio.Task] = []
+
+    async def start(
+        self,
+        on_message: Callable[[str], None],
+        on_reconnect: Callable[[], None],
+        on_send_failed: Callable[[str], None],
+    ) -> None:
+        self._runners = [
+            asyncio.create_task(self._run(on_message, on_reconnect)),
+            asyncio.create_task(self._send_loop(on_send_failed)),
+        ]
+
+    async def _run(self, on_message, on_reconnect) -> None:
+        connected_before = False
+        while True:
+            closed = asyncio.Event()
+            try:
+                connection = await asyncpg.connect(self.dsn)
+                connection.add_termination_listener(lambda _: closed.set())
+                await connection.add_listener(self.channel, lambda _conn, _pid, _channel, payload: on_message(payload))
+                self._connection = connection
+                self._connected.set()
+                if connected_before:
+                    # Whatever was sent while we were away is lost
+                    on_reconnect()
+                connected_before = True
+                await closed.wait()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Task events listener error")
+            self._connected.clear()
+            self._connection = None
+            await asyncio.sleep(self._RECONNECT_SECONDS)
+
+    async def _send_loop(self, on_send_failed) -> None:
+        while True:
+            payload = await self._outbox.get()
+            # Held while disconnected rather than dropped
+            await self._connected.wait()
+            try:
+                await self._connection.execute("SELECT pg_notify($1, $2)", self.channel, payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Error publishing task events")
+                on_send_failed(payload)
+                await asyncio.sleep(self._RECONNECT_SECONDS)
+
+    def send(self, payload: str) -> None:
+        self._outbox.put_nowait(payload)
+
+    async def stop(self) -> None:
+        for runner in self._runners:
+            runner.cancel()
+        if self._connection is not None:
+            await self._connection.close()
+
+class TaskEventBus:
+    """Fan-out of committed task events to this process's subscribers, plus the optional relay."""
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self.origin = uuid.uuid4().hex
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self.published = 0
+        self.relayed_in = 0
+        self.dropped = 0
+        self.relay_failures = 0
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__ if self.backend else "memory",
+            "subscribers": sum(len(subscriptions) for subscriptions in self._subscribers.values()),
+            "published": self.published,
+            "relayed_in": self.relayed_in,
+            "dropped": self.dropped,
+            "relay_failures": self.relay_failures,
+        }
+
+    @contextlib.contextmanager
+    def subscribe(self, owner_id: str) -> Iterator[Subscription]:
+        subscription = Subscription(owner_id, TASK_EVENTS_QUEUE_SIZE)
+        self._subscribers.setdefault(owner_id, set()).add(subscription)
+        try:
+            yield subscription
+        finally:
+            subscriptions = self._subscribers.get(owner_id)
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscribers[owner_id]
+
+    def _deliver(self, event: Dict[str, Any]) -> None:
+        for subscription in self._subscribers.get(event["owner_id"], ()):
+            if not subscription.put(event):
+                self.dropped += 1
+
+    def publish(self, events: List[Dict[str, Any]]) -> None:
+        """Deliver locally and relay to other processes. Never blocks; safe in a sync event hook."""
+        for event in events:
+            self._deliver(event)
+        self.published += len(events)
+        if self.backend is not None:
+            for payload in self._payloads(events):
+                self.backend.send(payload)
+
+    def _payloads(self, events: List[Dict[str, Any]]) -> Iterator[str]:
+        payload = json.dumps({"origin": self.origin, "events": events})
+        if len(payload.encode()) <= _MAX_NOTIFY_BYTES:
+            yield payload
+            return
+        for event in events:
+            payload = json.dumps({"origin": self.origin, "events": [event]})
+            if len(payload.encode()) > _MAX_NOTIFY_BYTES:
+                # Too big to relay whole: send the id only, clients fetch the task itself
+                event = {**event, "task": {"id": event["task"]["id"], "change_seq": event["task"]["change_seq"]}}
+                payload = json.dumps({"origin": self.origin, "events": [event]})
+            yield payload
+
+    def _on_send_failed(self, payload: str) -> None:
+        # The other processes missed these owners' changes: tell them to resync those owners
+        # instead. Queued behind later sends and retried until it goes through.
+        message = json.loads(payload)
+        owners = {event["owner_id"] for event in message.get("events", ())} | set(message.get("resync", ()))
+        self.relay_failures += 1
+        owners = sorted(owners)
+        for start in range(0, len(owners), _RESYNC_OWNERS_PER_PAYLOAD):
+            self.backend.send(json.dumps({"origin": self.origin, "resync": owners[start:start + _RESYNC_OWNERS_PER_PAYLOAD]}))
+
+    def _resync_owner(self, owner_id: str) -> None:
+        pin_to_primary(owner_id)
+        for subscription in self._subscribers.get(owner_id, ()):
+            subscription.put(RESYNC_EVENT)
+
+    def _on_message(self, payload: str) -> None:
+        message = json.loads(payload)
+        if message["origin"] == self.origin:
+            return
+        for owner_id in message.get("resync", ()):
+            self._resync_owner(owner_id)
+        for event in message.get("events", ()):
+            # Another process changed these tasks; the replica may not have the change yet
+            pin_to_primary(event["owner_id"])
+            self._deliver(event)
+            self.relayed_in += 1
+
+    def _on_reconnect(self) -> None:
+        for subscriptions in self._subscribers.values():
+            for subscription in subscriptions:
+                subscription.put(RESYNC_EVENT)
+
+    async def start(self) -> None:
+        if self.backend is not None:
+            await self.backend.start(self._on_message, self._on_reconnect, self._on_send_failed)
+
+    async def stop(self) -> None:
+        if self.backend is not None:
+            await self.backend.stop()
+
+def _listen_dsn() -> str:
+    # libpq-style URL for asyncpg.connect; it understands sslmode but not channel_binding
+    url = make_url(DATABASE_URL)
+    if url.get_backend_name() not in ("postgresql", "postgres"):
+        raise ValueError("TASK_EVENTS_BACKEND=postgres needs a Postgres DATABASE_URL")
+    query = {key: value for key, value in url.query.items() if key != "channel_binding"}
+    return url.set(drivername="postgresql", query=query).render_as_string(hide_password=False)
+
+def make_task_event_bus() -> TaskEventBus:
+    if TASK_EVENTS_BACKEND == "postgres":
+        return TaskEventBus(PostgresNotifyBackend(_listen_dsn(), TASK_EVENTS_CHANNEL))
+    if TASK_EVENTS_BACKEND == "memory":
+        return TaskEventBus()
+    raise ValueError(f"Unsupported TASK_EVENTS_BACKEND: {TASK_EVENTS_BACKEND}")
+
+task_event_bus = make_task_event_bus()
+
+@sa.event.listens_for(Session, "after_commit")
+def _publish_committed_events(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        task_event_bus.publish([_event(kind, owner_id, task) for kind, owner_id, task in pending])
+
+@sa.event.listens_for(Session, "after_rollback")
+def _discard_rolled_back_events(session):
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,31 @@
+import hashlib
+import json
+import os
+from typing import Dict, Optional, Tuple
+
+from app.cache import TTLCache
+from app.schemas import TaskRead
+
+# GET /tasks derives its ETag from the owner's task list version and the query, so a matching
+# If-None-Match is answered with 304 and a repeated query is served from the response cache.
+#
+# The version is the owner's task_change_counters.last_seq, which every task write advances in
+# its own transaction (crud.next_task_change_seq). Reading it is one primary-key lookup, and it
+# is the same in every process, so writes made by other workers, instances or chat job workers
+# invalidate ETags and cached responses here too.
+TASK_LIST_CACHE_MAX_ENTRIES = int(os.getenv("TASK_LIST_CACHE_MAX_ENTRIES", "5000"))
+TASK_LIST_CACHE_TTL_SECONDS = float(os.getenv("TASK_LIST_CACHE_TTL_SECONDS", "300"))
+
+# Changes with the response format, so a deploy that changes TaskRead invalidates old ETags
+_FORMAT = hashlib.sha1(json.dumps(TaskRead.model_json_schema(), sort_keys=True).encode()).hexdigest()[:8]
+_responses = TTLCache(maxsize=TASK_LIST_CACHE_MAX_ENTRIES, ttl=TASK_LIST_CACHE_TTL_SECONDS)
+
+def task_list_etag(owner_id: str, version: int, query: str) -> str:
+    digest = hashlib.sha1(f"{owner_id}|{version}|{query}".encode()).hexdigest()[:16]
+    return f'W/"{_FORMAT}-{digest}"'
+
+def get_cached_response(etag: str) -> Optional[Tuple[bytes, Dict[str, str]]]:
+    return _responses.get(etag)
+
+def cache_response(etag: str, body: bytes, headers: Dict[str, str]) -> None:
+    _responses.set(etag, (body, headers))
@@ -1,26 +1,33 @@
 import os
 import json
-from typing import Dict, Any, List
-from app.crud import get_tasks_by_owner, create_task, get_task_by_id_and_owner, update_task, delete_task
+import inspect
+import re
+import typing
+from typing import Dict, Any, List, Literal
+from app.crud import in_unit_of_work, get_tasks_by_owner, search_tasks, create_task, get_task_by_id_and_owner, update_task, delete_task, bulk_create_tasks, bulk_set_tasks_completed
 from app.schemas import TaskCreate, TaskUpdate
-from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 class TaskMCPTools:
     """
     MCP Tools for task operations that can be used by the AI assistant
     """
 
-    def __init__(self, db_session: Session, user_id: str):
+    def __init__(self, db_session: AsyncSession, user_id: str):
         self.db_session = db_session
         self.user_id = user_id
 
-    def add_task(self, title: str, description: str = None) -> Dict[str, Any]:
+    async def add_task(self, title: str, description: str = None) -> Dict[str, Any]:
         """
         Create a new task
+
+        Args:
+            title: The task title
+            description: The task description
         """
         try:
             task_data = TaskCreate(title=title, description=description)
-            new_task = create_task(self.db_session, task_data, self.user_id)
+            new_task = await create_task(self.db_session, task_data, self.user_id)
 
             return {
                 "task_id": new_task.id,
@@ -33,17 +40,16 @@ class TaskMCPTools:
                 "error": f"Failed to create task: {str(e)}"
             }
 
-    def list_tasks(self, status: str = "all") -> List[Dict[str, Any]]:
+    async def list_tasks(self, status: Literal["all", "pending", "completed"] = "all") -> List[Dict[str, Any]]:
         """
         Retrieve tasks from the list
+
+        Args:
+            status: Filter tasks by status
         """
         try:
-            tasks = get_tasks_by_owner(self.db_session, self.user_id)
-
-            if status == "pending":
-                tasks = [task for task in tasks if not task.completed]
-            elif status == "completed":
-                tasks = [task for task in tasks if task.completed]
+            completed = {"pending": False, "completed": True}.get(status)
+            tasks = await get_tasks_by_owner(self.db_session, self.user_id, completed=completed)
 
             return [
                 {
@@ -57,19 +63,45 @@ class TaskMCPTools:
         except Exception as e:
             return [{"error": f"Failed to retrieve tasks: {str(e)}"}]
 
-    def complete_task(self, task_id: int) -> Dict[str, Any]:
+    async def search_tasks(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Find tasks whose title or description match the given words, best match first. Use this to find the ID of a task the user refers to by name
+
+        Args:
+            query: Words to search for, e.g. "dentist"
+            limit: Maximum number of tasks to return
+        """
+        try:
+            hits, _ = await search_tasks(self.db_session, self.user_id, query, limit=min(max(limit, 1), 50))
+
+            return [
+                {
+                    "id": task.id,
+                    "title": task.title,
+                    "description": task.description,
+                    "completed": task.completed
+                }
+                for task, _ in hits
+            ]
+        except Exception as e:
+            return [{"error": f"Failed to search tasks: {str(e)}"}]
+
+    async def complete_task(self, task_id: int) -> Dict[str, Any]:
         """
         Mark a task as complete
+
+        Args:
+            task_id: The ID of the task to complete
         """
         try:
-            task = get_task_by_id_and_owner(self.db_session, task_id, self.user_id)
+            task = await get_task_by_id_and_owner(self.db_session, task_id, self.user_id)
             if not task:
                 return {
                     "error": f"Task with ID {task_id} not found"
                 }
 
             task_update = TaskUpdate(completed=True)
-            updated_task = update_task(self.db_session, task, task_update)
+            updated_task = await update_task(self.db_session, task, task_update)
 
             return {
                 "task_id": updated_task.id,
@@ -81,12 +113,15 @@ class TaskMCPTools:
                 "error": f"Failed to complete task: {str(e)}"
             }
 
-    def delete_task(self, task_id: int) -> Dict[str, Any]:
+    async def delete_task(self, task_id: int) -> Dict[str, Any]:
         """
         Remove a task from the list
+
+        Args:
+            task_id: The ID of the task to delete
         """
         try:
-            task = get_task_by_id_and_owner(self.db_session, task_id, self.user_id)
+            task = await get_task_by_id_and_owner(self.db_session, task_id, self.user_id)
             if not task:
                 return {
                     "error": f"Task with ID {task_id} not found"
@@ -94,7 +129,7 @@ class TaskMCPTools:
 
             # In the actual crud implementation, delete_task only takes session and db_task
             from app.crud import delete_task as delete_db_task
-            delete_db_task(self.db_session, task)
+            await delete_db_task(self.db_session, task)
 
             return {
                 "task_id": task_id,
@@ -106,12 +141,17 @@ class TaskMCPTools:
                 "error": f"Failed to delete task: {str(e)}"
             }
 
-    def update_task(self, task_id: int, title: str = None, description: str = None) -> Dict[str, Any]:
+    async def update_task(self, task_id: int, title: str = None, description: str = None) -> Dict[str, Any]:
         """
         Modify task title or description
+
+        Args:
+            task_id: The ID of the task to update
+            title: The new title
+            description: The new description
         """
         try:
-            task = get_task_by_id_and_owner(self.db_session, task_id, self.user_id)
+            task = await get_task_by_id_and_owner(self.db_session, task_id, self.user_id)
             if not task:
                 return {
                     "error": f"Task with ID {task_id} not found"
@@ -125,7 +165,7 @@ class TaskMCPTools:
                 update_data["description"] = description
 
             task_update = TaskUpdate(**update_data)
-            updated_task = update_task(self.db_session, task, task_update)
+            updated_task = await update_task(self.db_session, task, task_update)
 
             return {
                 "task_id": updated_task.id,
@@ -137,7 +177,102 @@ class TaskMCPTools:
                 "error": f"Failed to update task: {str(e)}"
             }
 
-def execute_tool_call(tool_name: str, arguments_str: str, db_session: Session, user_id: str) -> Dict[str, Any]:
+    async def bulk_add_tasks(self, titles: List[str]) -> Dict[str, Any]:
+        """
+        Create several tasks at once
+
+        Args:
+            titles: The titles of the tasks to create
+        """
+        try:
+            task_creates = [TaskCreate(title=title) for title in titles]
+            new_tasks = await bulk_create_tasks(self.db_session, task_creates, self.user_id)
+
+            return {
+                "status": "created",
+                "tasks": [{"task_id": task.id, "title": task.title} for task in new_tasks]
+            }
+        except Exception as e:
+            return {
+                "error": f"Failed to create tasks: {str(e)}"
+            }
+
+    async def bulk_complete_tasks(self, task_ids: List[int]) -> Dict[str, Any]:
+        """
+        Mark several tasks as complete at once
+
+        Args:
+            task_ids: The IDs of the tasks to complete
+        """
+        try:
+            updated_tasks = await bulk_set_tasks_completed(self.db_session, task_ids, self.user_id, completed=True)
+            found_ids = {task.id for task in updated_tasks}
+
+            result = {
+                "status": "completed",
+                "tasks": [{"task_id": task.id, "title": task.title} for task in updated_tasks]
+            }
+            missing_ids = [task_id for task_id in task_ids if task_id not in found_ids]
+            if missing_ids:
+                result["not_found"] = missing_ids
+            return result
+        except Exception as e:
+            return {
+                "error": f"Failed to complete tasks: {str(e)}"
+            }
+
+# TaskMCPTools methods exposed to the model
+TASK_TOOL_NAMES = ("add_task", "list_tasks", "search_tasks", "complete_task", "delete_task", "update_task", "bulk_add_tasks", "bulk_complete_tasks")
+# Tools that never write; a turn that only called these can be answered again from cache
+READ_ONLY_TOOL_NAMES = ("list_tasks", "search_tasks")
+
+_JSON_SCHEMA_TYPES = {str: "string", int: "integer", float: "number", bool: "boolean"}
+
+def _tool_declaration(method) -> Dict[str, Any]:
+    """
+    Build a function declaration from a TaskMCPTools method: the docstring's first
+    paragraph is the description, its Args section describes the parameters.
+    """
+    description, _, args_doc = (inspect.getdoc(method) or "").partition("Args:")
+    param_docs = dict(re.findall(r"^\s*(\w+):\s*(.+)$", args_doc, re.MULTILINE))
+    hints = typing.get_type_hints(method)
+
+    properties = {}
+    required = []
+    for name, param in inspect.signature(method).parameters.items():
+        if name == "self":
+            continue
+        hint = hints.get(name, str)
+        if typing.get_origin(hint) is typing.Union:
+            hint = next(arg for arg in typing.get_args(hint) if arg is not type(None))
+
+        if typing.get_origin(hint) is Literal:
+            schema = {"type": "string", "enum": list(typing.get_args(hint))}
+        elif typing.get_origin(hint) in (list, List):
+            item_type = (typing.get_args(hint) or (str,))[0]
+            schema = {"type": "array", "items": {"type": _JSON_SCHEMA_TYPES.get(item_type, "string")}}
+        else:
+            schema = {"type": _JSON_SCHEMA_TYPES.get(hint, "string")}
+        if name in param_docs:
+            schema["description"] = param_docs[name]
+
+        properties[name] = schema
+        if param.default is inspect.Parameter.empty:
+            required.append(name)
+
+    parameters = {"type": "object", "properties": properties}
+    if required:
+        parameters["required"] = required
+    return {
+        "name": method.__name__,
+        "description": description.strip(),
+        "parameters": parameters
+    }
+
+# Tool declarations offered to the model for function calling, generated once at import
+TASK_TOOL_DEFINITIONS = [_tool_declaration(getattr(TaskMCPTools, name)) for name in TASK_TOOL_NAMES]
+
+async def execute_tool_call(tool_name: str, arguments_str: str, db_session: AsyncSession, user_id: str) -> Dict[str, Any]:
     """
     Execute a tool call with the provided arguments
     """
@@ -148,25 +283,20 @@ def execute_tool_call(tool_name: str, arguments_str: str, db_session: Session, u
         # Initialize tools
         tools = TaskMCPTools(db_session, user_id)
 
-        # Map tool name to function
-        tool_functions = {
-            "add_task": tools.add_task,
-            "list_tasks": tools.list_tasks,
-            "complete_task": tools.complete_task,
-            "delete_task": tools.delete_task,
-            "update_task": tools.update_task,
-        }
-
         # Get the function
-        if tool_name not in tool_functions:
+        if tool_name not in TASK_TOOL_NAMES:
             return {"error": f"Unknown tool: {tool_name}"}
 
         # Call the function with arguments
-        func = tool_functions[tool_name]
-        result = func(**arguments)
-
-        return result
+        func = getattr(tools, tool_name)
+        result = await func(**arguments)
     except json.JSONDecodeError as e:
         return {"error": f"Invalid JSON arguments: {str(e)}"}
     except Exception as e:
-        return {"error": f"Error executing tool: {str(e)}"}
\ No newline at end of file
+        return {"error": f"Error executing tool: {str(e)}"}
+
+    # Inside a chat turn's unit of work a failed flush leaves the transaction unusable;
+    # stop the turn here so it is rolled back as a whole instead of running more tools
+    if in_unit_of_work(db_session) and not db_session.is_active:
+        raise RuntimeError(f"{tool_name} failed and the chat turn was rolled back")
+    return result
\ No newline at end of file
@@ -0,0 +1,111 @@
+import logging
+import os
+import re
+from typing import Optional
+
+import sqlalchemy as sa
+
+from app.models import Task
+
+logger = logging.getLogger(__name__)
+
+# Full-text search over Task.title and Task.description.
+# Postgres: an expression GIN index on to_tsvector(...), queried with websearch_to_tsquery.
+# SQLite: an external-content FTS5 table kept in sync with triggers. If the SQLite build
+# lacks FTS5, search falls back to an unindexed LIKE scan of the user's tasks.
+TASK_SEARCH_LANGUAGE = os.getenv("TASK_SEARCH_LANGUAGE", "english")
+if not re.fullmatch(r"[a-z_]+", TASK_SEARCH_LANGUAGE):
+    raise ValueError(f"Invalid TASK_SEARCH_LANGUAGE: {TASK_SEARCH_LANGUAGE}")
+
+# Written out literally (no bound parameters) so the query expression matches the index expression
+def _pg_document(prefix: str = "") -> str:
+    return (
+        f"to_tsvector('{TASK_SEARCH_LANGUAGE}'::regconfig, "
+        f"coalesce({prefix}title, '') || ' ' || coalesce({prefix}description, ''))"
+    )
+
+_PG_INDEX_NAME = f"ix_task_search_{TASK_SEARCH_LANGUAGE}"
+
+_SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE task_fts USING fts5("
+    "title, description, content='task', content_rowid='id', tokenize='porter unicode61')",
+    "CREATE TRIGGER task_fts_ai AFTER INSERT ON task BEGIN "
+    "INSERT INTO task_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+    "CREATE TRIGGER task_fts_ad AFTER DELETE ON task BEGIN "
+    "INSERT INTO task_fts(task_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description); END",
+    "CREATE TRIGGER task_fts_au AFTER UPDATE OF title, description ON task BEGIN "
+    "INSERT INTO task_fts(task_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description); "
+    "INSERT INTO task_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+    # Index the rows that existed before the table was added
+    "INSERT INTO task_fts(task_fts) VALUES ('rebuild')",
+]
+
+_sqlite_fts_available = True
+
+def ensure_task_search_index(connection) -> None:
+    """Create the search index for the connected backend if it is missing (run via run_sync)."""
+    global _sqlite_fts_available
+    dialect = connection.dialect.name
+    if dialect == "postgresql":
+        connection.execute(sa.text(f"CREATE INDEX IF NOT EXISTS {_PG_INDEX_NAME} ON task USING GIN ({_pg_document()})"))
+    elif dialect == "sqlite":
+        if connection.execute(sa.text("SELECT 1 FROM sqlite_master WHERE name = 'task_fts'")).first():
+            return
+        try:
+            with connection.begin_nested():
+                for statement in _SQLITE_DDL:
+                    connection.execute(sa.text(statement))
+        except sa.exc.OperationalError as e:
+            logger.warning("FTS5 unavailable, task search will scan: %s", e)
+            _sqlite_fts_available = False
+
+def _fts5_query(query: str) -> Optional[str]:
+    # Each word becomes a quoted prefix term, so user input can't use (or break) FTS5 syntax
+    words = re.findall(r"\w+", query)
+    return " ".join(f'"{word}"*' for word in words) or None
+
+def search_statement(dialect: str, owner_id: str, query: str) -> Optional[sa.Select]:
+    """
+    SELECT (Task, rank) for owner_id's tasks matching query, best match first.
+    Returns None when the query has nothing searchable in it.
+    """
+    if not query.strip():
+        return None
+
+    if dialect == "postgresql":
+        ts_query = sa.func.websearch_to_tsquery(sa.literal_column(f"'{TASK_SEARCH_LANGUAGE}'::regconfig"), query)
+        document = sa.literal_column(_pg_document("task."))
+        rank = sa.func.ts_rank(document, ts_query).label("rank")
+        return (
+            sa.select(Task, rank)
+            .where(Task.owner_id == owner_id, document.op("@@")(ts_query))
+            .order_by(rank.desc(), Task.id)
+        )
+
+    if dialect == "sqlite" and _sqlite_fts_available:
+        match = _fts5_query(query)
+        if match is None:
+            return None
+        fts = sa.table("task_fts", sa.column("rowid"))
+        # bm25() is lower-is-better; negate it so rank is higher-is-better on both backends.
+        # Title matches weigh twice as much as description matches.
+        rank = (-sa.func.bm25(sa.literal_column("task_fts"), 2.0, 1.0)).label("rank")
+        return (
+            sa.select(Task, rank)
+            .join(fts, fts.c.rowid == Task.id)
+            .where(Task.owner_id == owner_id, sa.literal_column("task_fts").op("MATCH")(match))
+            .order_by(rank.desc(), Task.id)
+        )
+
+    words = re.findall(r"\w+", query)
+    if not words:
+        return None
+    conditions = [
+        sa.or_(Task.title.ilike(f"%{word}%"), Task.description.ilike(f"%{word}%"))
+        for word in words
+    ]
+    return (
+        sa.select(Task, sa.literal(0.0).label("rank"))
+        .where(Task.owner_id == owner_id, *conditions)
+        .order_by(Task.id)
+    )
@@ -0,0 +1,32 @@
+import asyncio
+import datetime
+import logging
+import os
+
+from app import crud
+from app.database import async_session_factory
+
+logger = logging.getLogger(__name__)
+
+# Tombstones of deleted tasks are what delta sync (GET /tasks/changes) reports deletions from.
+# They are dropped after TASK_TOMBSTONE_RETENTION_DAYS; a client syncing from a watermark older
+# than the last dropped one gets 410 and starts over from since=0. 0 keeps them forever.
+TASK_TOMBSTONE_RETENTION_DAYS = float(os.getenv("TASK_TOMBSTONE_RETENTION_DAYS", "30"))
+TASK_TOMBSTONE_PRUNE_INTERVAL_SECONDS = float(os.getenv("TASK_TOMBSTONE_PRUNE_INTERVAL_SECONDS", "3600"))
+
+async def prune_expired_tombstones() -> int:
+    """Drop the tombstones past retention. Returns how many were dropped."""
+    deleted_before = datetime.datetime.utcnow() - datetime.timedelta(days=TASK_TOMBSTONE_RETENTION_DAYS)
+    async with async_session_factory() as session:
+        return await crud.prune_task_tombstones(session, deleted_before)
+
+async def run_tombstone_pruning_loop() -> None:
+    """Background task started by the app lifespan; prunes every TASK_TOMBSTONE_PRUNE_INTERVAL_SECONDS."""
+    while True:
+        await asyncio.sleep(TASK_TOMBSTONE_PRUNE_INTERVAL_SECONDS)
+        try:
+            pruned = await prune_expired_tombstones()
+            if pruned:
+                logger.info("Pruned %d task tombstones", pruned)
+        except Exception:
+            logger.exception("Error pruning task tombstones")
@@ -0,0 +1,110 @@
+"""
+Task-endpoint latency while slow chat calls are in flight.
+
+Runs the FastAPI app in-process against a throwaway SQLite database, replaces
+GeminiAIService with a stub that just sleeps, then measures GET /tasks latency
+on its own and again while CHATS concurrent chat requests are waiting on the
+"LLM". With the async request path the two distributions should be nearly
+identical; with the old sync handlers the task calls queue behind the chats
+once the threadpool (40 slots) is exhausted.
+
+Usage (from backend/):
+    python -m benchmarks.bench_async_concurrency [--chats 64] [--llm-latency 2.0] [--requests 200]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+_db_file = os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_db_file}")
+os.environ.setdefault("BETTER_AUTH_SECRET", "benchmark-secret")
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-key")
+
+import httpx
+
+from app import main
+from app.database import engine
+from app.gemini_service import ChatTurn
+from app.security import decode_access_token
+
+
+class SlowGeminiStub:
+    """Stands in for GeminiAIService; sleeps instead of calling the API."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    async def chat_with_function_calling(self, messages, db_session, user_id, tools=None):
+        await asyncio.sleep(self.latency)
+        return ChatTurn(text="stub reply")
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def measure_task_reads(client, user_id, headers, count):
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        response = await client.get(f"/api/{user_id}/tasks", headers=headers)
+        response.raise_for_status()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(label, samples):
+    print(
+        f"{label:<28} n={len(samples):<5} "
+        f"p50={statistics.median(samples):7.2f}ms "
+        f"p95={percentile(samples, 95):7.2f}ms "
+        f"max={max(samples):7.2f}ms"
+    )
+
+
+async def run(chats: int, llm_latency: float, requests: int):
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app), \
+            httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        main.app.state.gemini_service = SlowGeminiStub(llm_latency)
+
+        response = await client.post("/auth/register", json={"email": "bench@example.com", "password": "bench-password"})
+        response.raise_for_status()
+        token = response.json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        user_id = decode_access_token(token).id
+
+        for i in range(20):
+            await client.post(f"/api/{user_id}/tasks", json={"title": f"task {i}"}, headers=headers)
+
+        idle = await measure_task_reads(client, user_id, headers, requests)
+
+        chat_calls = [
+            asyncio.create_task(client.post(f"/api/{user_id}/chat", json={"message": "hello"}, headers=headers))
+            for _ in range(chats)
+        ]
+        await asyncio.sleep(0.1)  # let the chats reach the stubbed LLM call
+        loaded = await measure_task_reads(client, user_id, headers, requests)
+        await asyncio.gather(*chat_calls)
+
+    report("GET /tasks (idle)", idle)
+    report(f"GET /tasks ({chats} chats)", loaded)
+    await engine.dispose()
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=64, help="concurrent slow chat requests")
+    parser.add_argument("--llm-latency", type=float, default=2.0, help="stubbed LLM latency in seconds")
+    parser.add_argument("--requests", type=int, default=200, help="task reads per measurement")
+    args = parser.parse_args()
+    asyncio.run(run(args.chats, args.llm_latency, args.requests))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,90 @@
+"""
+POST /chat latency for simple task commands with and without the local intent fast-path.
+
+Runs the app in-process against a throwaway SQLite database with StubGeminiService
+(LLM_LATENCY seconds per model call) and sends the same list of commands twice:
+once with CHAT_FAST_PATH_ENABLED and once without. Without it, each command costs
+two stubbed model calls (tool call, then answer); with it, none.
+
+Usage (from backend/):
+    python -m benchmarks.bench_chat_fast_path [--llm-latency 0.5] [--rounds 10]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+_db_file = os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_db_file}")
+os.environ.setdefault("BETTER_AUTH_SECRET", "benchmark-secret")
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-key")
+os.environ.setdefault("SQL_METRICS_LOG_SAMPLE_RATE", "0")
+os.environ.setdefault("CHAT_RATE_LIMIT_ENABLED", "false")
+
+import httpx
+
+from app import chat_intents, main
+from app.database import engine
+from app.security import decode_access_token
+from benchmarks.stub_gemini import StubGeminiService
+
+COMMANDS = ["add buy milk", "show pending tasks", "complete {task_id}", "add call the plumber", "delete task {task_id}"]
+
+
+async def run_commands(client, user_id, headers, rounds):
+    samples = []
+    conversation_id = None
+    for _ in range(rounds):
+        response = await client.post(f"/api/{user_id}/tasks", json={"title": "scratch"}, headers=headers)
+        task_id = response.json()["id"]
+        for command in COMMANDS:
+            body = {"message": command.format(task_id=task_id), "conversation_id": conversation_id}
+            start = time.perf_counter()
+            response = await client.post(f"/api/{user_id}/chat", json=body, headers=headers)
+            samples.append((time.perf_counter() - start) * 1000)
+            response.raise_for_status()
+            conversation_id = response.json()["conversation_id"]
+    return samples
+
+
+def report(label, samples, model_calls):
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    print(
+        f"{label:<18} n={len(samples):<4} p50={statistics.median(samples):8.2f}ms "
+        f"p95={p95:8.2f}ms model calls={model_calls}"
+    )
+
+
+async def run(llm_latency, rounds):
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app), \
+            httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        response = await client.post("/auth/register", json={"email": "bench@example.com", "password": "bench-password"})
+        response.raise_for_status()
+        token = response.json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        user_id = decode_access_token(token).id
+
+        for enabled in (False, True):
+            chat_intents.CHAT_FAST_PATH_ENABLED = enabled
+            stub = StubGeminiService(llm_latency)
+            main.app.state.gemini_service = stub
+            samples = await run_commands(client, user_id, headers, rounds)
+            report("fast-path on" if enabled else "fast-path off", samples, stub.model_calls)
+        print(f"fast-path stats: {chat_intents.fast_path_stats.snapshot()}")
+    await engine.dispose()
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="stubbed seconds per model call")
+    parser.add_argument("--rounds", type=int, default=10, help="times to send the command list")
+    args = parser.parse_args()
+    asyncio.run(run(args.llm_latency, args.rounds))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,58 @@
+"""
+Per-turn chat setup overhead: building a GeminiAIService and converting the tool
+declarations on every request (the old behaviour) versus reusing the process-wide
+instance created by the app lifespan.
+
+Nothing here talks to the network; only the client-side setup work is timed.
+
+Usage (from backend/):
+    python -m benchmarks.bench_chat_setup [--iterations 2000]
+"""
+import argparse
+import os
+import timeit
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("BETTER_AUTH_SECRET", "benchmark-secret")
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-key")
+
+from google.generativeai.types import content_types
+
+from app.gemini_service import GeminiAIService
+from app.task_mcp_tools import TASK_TOOL_DEFINITIONS
+
+
+def per_request_setup():
+    # What every chat request used to pay before generate_content was even called
+    service = GeminiAIService()
+    tools = service._convert_tools_to_gemini_format(TASK_TOOL_DEFINITIONS)
+    content_types.to_function_library(tools)
+    content_types.to_tool_config({"function_calling_config": {"mode": "AUTO"}})
+
+
+def shared_setup(service):
+    # What a chat request pays now: look up the shared instance and its precompiled tools
+    content_types.to_function_library(service._resolve_tools(None))
+    content_types.to_tool_config(service.tool_config)
+
+
+def report(label, seconds, iterations):
+    print(f"{label:<34} {seconds / iterations * 1e6:10.1f} us/turn")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    shared = GeminiAIService()
+    per_request = timeit.timeit(per_request_setup, number=args.iterations)
+    reused = timeit.timeit(lambda: shared_setup(shared), number=args.iterations)
+
+    report("new GeminiAIService per request", per_request, args.iterations)
+    report("shared GeminiAIService", reused, args.iterations)
+    print(f"{'speedup':<34} {per_request / reused:10.1f}x")
+
+
+if __name__ == "__main__":
+    main_cli()
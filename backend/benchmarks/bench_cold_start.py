@@ -0,0 +1,158 @@
+"""
+Cold start: how long a fresh process takes to import the app, run its startup and
+answer its first requests, with and without FAST_COLD_START.
+
+Every run is a new interpreter, so nothing is cached between runs but the database
+(and the OS file cache). A setup process first creates the schema and a user, as an
+already-deployed database would have them. Each run then reports:
+
+    import         import app.main
+    startup        the app lifespan (schema check, Gemini setup, background tasks)
+    first request  GET /tasks, the first request that needs the database
+    first chat     a fast-path POST /chat, the first request that needs the Gemini service
+    process        parent-measured wall time from spawn to the first request's answer
+
+Nothing talks to Gemini; the fake API key is only used to build the client. Against
+a remote --database-url the schema check and the deferred connection weigh much more
+than against the default local SQLite file.
+
+Usage (from backend/):
+    python -m benchmarks.bench_cold_start [--runs 5] [--database-url postgresql://localhost/todo_bench]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+MODES = {
+    "default": {"FAST_COLD_START": "false"},
+    "FAST_COLD_START": {"FAST_COLD_START": "true"},
+}
+
+STAGES = ["import", "startup", "first request", "first chat", "process"]
+
+
+async def setup_database():
+    import httpx
+
+    from app import main
+    from app.database import engine
+    from app.security import decode_access_token
+
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            response = await client.post(
+                "/auth/register", json={"email": "cold-start@example.com", "password": "cold-start-password"}
+            )
+            response.raise_for_status()
+            print(json.dumps({"user_id": decode_access_token(response.json()["access_token"]).id}))
+    await engine.dispose()
+
+
+def run_child(user_id):
+    # Only app imports are timed; httpx is the client, not part of the app
+    import httpx
+
+    started = time.perf_counter()
+    from app import main
+    from app.database import engine
+    from app.security import create_access_token
+    imported = time.perf_counter()
+
+    async def requests():
+        headers = {"Authorization": f"Bearer {create_access_token({'sub': user_id})}"}
+        timings = {"import": imported - started}
+        async with main.app.router.lifespan_context(main.app):
+            timings["startup"] = time.perf_counter() - imported
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=headers) as client:
+                request_started = time.perf_counter()
+                (await client.get(f"/api/{user_id}/tasks")).raise_for_status()
+                timings["first request"] = time.perf_counter() - request_started
+                print(json.dumps({"ready": True}), flush=True)
+
+                chat_started = time.perf_counter()
+                (await client.post(f"/api/{user_id}/chat", json={"message": "show my tasks"})).raise_for_status()
+                timings["first chat"] = time.perf_counter() - chat_started
+        await engine.dispose()
+        print(json.dumps(timings), flush=True)
+
+    asyncio.run(requests())
+
+
+def spawn(args, env):
+    return subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.bench_cold_start", *args],
+        env=env, stdout=subprocess.PIPE, text=True,
+    )
+
+
+def read_result(process, key):
+    # Skips anything else the app prints, e.g. its schema check
+    for line in process.stdout:
+        if line.startswith("{"):
+            result = json.loads(line)
+            if key in result:
+                return result
+    raise RuntimeError("cold start run failed")
+
+
+def measure(user_id, env):
+    spawned = time.perf_counter()
+    process = spawn(["--child", user_id], env)
+    # The child prints a line as soon as its first request has been answered
+    read_result(process, "ready")
+    process_seconds = time.perf_counter() - spawned
+    timings = read_result(process, "import")
+    if process.wait() != 0:
+        raise RuntimeError("cold start run failed")
+    return {**timings, "process": process_seconds}
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes per mode")
+    parser.add_argument("--database-url", help="e.g. postgresql://localhost/todo_bench (default: temporary SQLite)")
+    parser.add_argument("--child", metavar="USER_ID", help=argparse.SUPPRESS)
+    parser.add_argument("--setup", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.setup:
+        asyncio.run(setup_database())
+        return
+    if args.child:
+        run_child(args.child)
+        return
+
+    env = dict(os.environ)
+    env["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    env.setdefault("BETTER_AUTH_SECRET", "benchmark-secret")
+    env.setdefault("GEMINI_API_KEY", "benchmark-key")
+    # Fast-path chat turns only, so no rate limit or compaction pass gets in the way
+    env["CHAT_RATE_LIMIT_ENABLED"] = "false"
+    env["MESSAGE_COMPACTION_ENABLED"] = "false"
+
+    setup = spawn(["--setup"], env)
+    user_id = read_result(setup, "user_id")["user_id"]
+    if setup.wait() != 0:
+        raise RuntimeError("setup failed")
+
+    results = {}
+    for mode, mode_env in MODES.items():
+        runs = [measure(user_id, {**env, **mode_env}) for _ in range(args.runs)]
+        results[mode] = {stage: statistics.median(run[stage] for run in runs) for stage in STAGES}
+
+    print(f"median of {args.runs} runs, milliseconds")
+    print(f"{'':<16}" + "".join(f"{mode:>18}" for mode in MODES))
+    for stage in STAGES:
+        print(f"{stage:<16}" + "".join(f"{results[mode][stage] * 1000:18.1f}" for mode in MODES))
+
+
+if __name__ == "__main__":
+    main_cli()
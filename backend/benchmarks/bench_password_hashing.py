@@ -0,0 +1,66 @@
+"""
+Login throughput per bcrypt cost setting.
+
+For each cost factor, verifies a password repeatedly on one thread (logins/s/core)
+and then through the app's bounded password-hashing pool from concurrent tasks
+(aggregate logins/s with PASSWORD_HASH_WORKERS threads). Use it to pick
+BCRYPT_ROUNDS for the login rate you have to absorb.
+
+Usage (from backend/):
+    python -m benchmarks.bench_password_hashing [--rounds 10 11 12 13] [--seconds 2]
+"""
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("BETTER_AUTH_SECRET", "benchmark-secret")
+
+from app import security
+
+PASSWORD = "correct horse battery staple"
+
+
+def single_core_rate(context, hashed, seconds):
+    count = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        context.verify(PASSWORD, hashed)
+        count += 1
+    return count / seconds
+
+
+async def pool_rate(context, hashed, seconds):
+    count = 0
+    deadline = time.perf_counter() + seconds
+    security.pwd_context = context
+
+    async def worker():
+        nonlocal count
+        while time.perf_counter() < deadline:
+            await security.verify_and_update_password_async(PASSWORD, hashed)
+            count += 1
+
+    await asyncio.gather(*(worker() for _ in range(security.PASSWORD_HASH_MAX_PENDING)))
+    return count / seconds
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, nargs="+", default=[10, 11, 12, 13])
+    parser.add_argument("--seconds", type=float, default=2.0, help="measurement time per setting")
+    args = parser.parse_args()
+
+    workers = security.PASSWORD_HASH_WORKERS
+    print(f"{'rounds':>6} {'logins/s/core':>14} {f'logins/s ({workers} workers)':>24}")
+    for rounds in args.rounds:
+        context = security.make_password_context(rounds)
+        hashed = context.hash(PASSWORD)
+        per_core = single_core_rate(context, hashed, args.seconds)
+        pooled = asyncio.run(pool_rate(context, hashed, args.seconds))
+        print(f"{rounds:>6} {per_core:>14.1f} {pooled:>24.1f}")
+
+
+if __name__ == "__main__":
+    main_cli()
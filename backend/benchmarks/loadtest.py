@@ -0,0 +1,306 @@
+"""
+Load test: a mix of auth, task CRUD and chat traffic against the app in-process.
+
+Starts the FastAPI app (lifespan included) on a throwaway SQLite database, or on
+--database-url, and swaps GeminiAIService for StubGeminiService. USERS virtual
+users each register and then loop over randomly chosen operations for DURATION
+seconds. The --mix weights decide how often each kind of traffic is picked. Every
+virtual user has its own seeded RNG, so runs with the same arguments send the
+same requests.
+
+Reports count, errors, throughput and p50/p95/p99 latency per endpoint. --output
+saves the results as JSON; --compare prints the p95 change against a saved run.
+
+Usage (from backend/):
+    python -m benchmarks.loadtest [--users 20] [--duration 30] [--mix auth=1,tasks=8,chat=1]
+        [--llm-latency 0.2] [--database-url postgresql://localhost/todo_bench]
+        [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+
+PASSWORD = "loadtest-password"
+
+CHAT_MESSAGES = [
+    "add buy milk",
+    "add call the plumber",
+    "show pending tasks",
+    "show all tasks",
+    "what should I focus on today?",
+    "hello",
+]
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ("auth", "tasks", "chat"):
+            raise argparse.ArgumentTypeError(f"unknown traffic kind: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(samples, pct):
+    # Linear interpolation between closest ranks
+    ordered = sorted(samples)
+    if len(ordered) == 1:
+        return ordered[0]
+    position = pct / 100 * (len(ordered) - 1)
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def call(self, client, label, method, url, expected=(200, 201, 204), **kwargs):
+        start = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        self.samples[label].append((time.perf_counter() - start) * 1000)
+        if response.status_code not in expected:
+            self.errors[label] += 1
+        return response
+
+    def summary(self, elapsed):
+        endpoints = {}
+        for label in sorted(self.samples):
+            samples = self.samples[label]
+            endpoints[label] = {
+                "count": len(samples),
+                "errors": self.errors[label],
+                "throughput_rps": round(len(samples) / elapsed, 2),
+                "p50_ms": round(percentile(samples, 50), 2),
+                "p95_ms": round(percentile(samples, 95), 2),
+                "p99_ms": round(percentile(samples, 99), 2),
+                "mean_ms": round(statistics.fmean(samples), 2),
+                "max_ms": round(max(samples), 2),
+            }
+        total = sum(len(samples) for samples in self.samples.values())
+        return {
+            "requests": total,
+            "errors": sum(self.errors.values()),
+            "throughput_rps": round(total / elapsed, 2),
+        }, endpoints
+
+
+class VirtualUser:
+    def __init__(self, client, recorder, rng, email):
+        self.client = client
+        self.recorder = recorder
+        self.rng = rng
+        self.email = email
+        self.user_id = None
+        self.headers = None
+        self.task_ids = []
+        self.conversation_id = None
+
+    async def register(self):
+        from app.security import decode_access_token
+
+        response = await self.recorder.call(
+            self.client, "POST /auth/register", "POST", "/auth/register",
+            json={"email": self.email, "password": PASSWORD},
+        )
+        response.raise_for_status()
+        token = response.json()["access_token"]
+        self.user_id = decode_access_token(token).id
+        self.headers = {"Authorization": f"Bearer {token}"}
+
+    async def auth(self):
+        await self.recorder.call(
+            self.client, "POST /auth/login", "POST", "/auth/login",
+            data={"username": self.email, "password": PASSWORD},
+        )
+
+    async def tasks(self):
+        base = f"/api/{self.user_id}/tasks"
+        roll = self.rng.random()
+        if roll < 0.4 or not self.task_ids:
+            if roll < 0.2 or not self.task_ids:
+                response = await self.recorder.call(
+                    self.client, "POST /api/{user_id}/tasks", "POST", base,
+                    json={"title": f"task {self.rng.randrange(10**6)}"}, headers=self.headers,
+                )
+                if response.status_code == 201:
+                    self.task_ids.append(response.json()["id"])
+            else:
+                await self.recorder.call(
+                    self.client, "GET /api/{user_id}/tasks", "GET", base,
+                    params={"limit": 50}, headers=self.headers,
+                )
+            return
+
+        task_id = self.rng.choice(self.task_ids)
+        if roll < 0.6:
+            await self.recorder.call(
+                self.client, "GET /api/{user_id}/tasks/{task_id}", "GET", f"{base}/{task_id}",
+                headers=self.headers,
+            )
+        elif roll < 0.75:
+            await self.recorder.call(
+                self.client, "PUT /api/{user_id}/tasks/{task_id}", "PUT", f"{base}/{task_id}",
+                json={"description": f"edited {self.rng.randrange(10**6)}"}, headers=self.headers,
+            )
+        elif roll < 0.9:
+            await self.recorder.call(
+                self.client, "PATCH /api/{user_id}/tasks/{task_id}/complete", "PATCH", f"{base}/{task_id}/complete",
+                json={"completed": self.rng.random() < 0.5}, headers=self.headers,
+            )
+        else:
+            self.task_ids.remove(task_id)
+            await self.recorder.call(
+                self.client, "DELETE /api/{user_id}/tasks/{task_id}", "DELETE", f"{base}/{task_id}",
+                headers=self.headers,
+            )
+
+    async def chat(self):
+        body = {"message": self.rng.choice(CHAT_MESSAGES)}
+        if self.conversation_id is not None:
+            body["conversation_id"] = self.conversation_id
+        response = await self.recorder.call(
+            self.client, "POST /api/{user_id}/chat", "POST", f"/api/{self.user_id}/chat",
+            json=body, headers=self.headers,
+        )
+        if response.status_code == 200:
+            self.conversation_id = response.json()["conversation_id"]
+
+    async def run(self, mix, deadline):
+        kinds = list(mix)
+        weights = [mix[kind] for kind in kinds]
+        while time.perf_counter() < deadline:
+            await getattr(self, self.rng.choices(kinds, weights)[0])()
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args):
+    import httpx
+
+    from app import main
+    from app.database import ASYNC_DATABASE_URL, engine
+    from benchmarks.stub_gemini import StubGeminiService
+
+    stub = StubGeminiService(args.llm_latency, args.llm_jitter, args.seed)
+    recorder = Recorder()
+    run_id = uuid.uuid4().hex[:8]
+    transport = httpx.ASGITransport(app=main.app)
+    try:
+        async with main.app.router.lifespan_context(main.app), \
+                httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=None) as client:
+            main.app.state.gemini_service = stub
+
+            users = [
+                VirtualUser(client, recorder, random.Random(args.seed * 1000 + i), f"load-{run_id}-{i}@example.com")
+                for i in range(args.users)
+            ]
+            # One at a time: a burst of registrations would only measure the bcrypt pool's queue limit
+            for user in users:
+                await user.register()
+
+            start = time.perf_counter()
+            await asyncio.gather(*(user.run(args.mix, start + args.duration) for user in users))
+            elapsed = time.perf_counter() - start
+    finally:
+        # aiosqlite's worker threads keep the process alive until the pool is closed
+        await engine.dispose()
+
+    totals, endpoints = recorder.summary(elapsed)
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+            "python": platform.python_version(),
+            "database": ASYNC_DATABASE_URL.get_backend_name(),
+            "users": args.users,
+            "duration_s": args.duration,
+            "elapsed_s": round(elapsed, 2),
+            "mix": args.mix,
+            "llm_latency_s": args.llm_latency,
+            "llm_jitter_s": args.llm_jitter,
+            "llm_model_calls": stub.model_calls,
+            "seed": args.seed,
+        },
+        "totals": totals,
+        "endpoints": endpoints,
+    }
+
+
+def print_report(results):
+    meta, totals = results["meta"], results["totals"]
+    print(f"{meta['database']} | {meta['users']} users | {meta['elapsed_s']}s | commit {meta['commit']}")
+    print(f"{'endpoint':<48} {'count':>6} {'err':>4} {'rps':>7} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for label, row in results["endpoints"].items():
+        print(
+            f"{label:<48} {row['count']:>6} {row['errors']:>4} {row['throughput_rps']:>7.1f} "
+            f"{row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} {row['p99_ms']:>8.2f}"
+        )
+    print(f"{'total':<48} {totals['requests']:>6} {totals['errors']:>4} {totals['throughput_rps']:>7.1f}")
+
+
+def print_comparison(results, baseline):
+    print(f"\np95 vs baseline (commit {baseline['meta'].get('commit')}):")
+    for label, row in results["endpoints"].items():
+        before = baseline["endpoints"].get(label)
+        if not before or not before["p95_ms"]:
+            continue
+        change = (row["p95_ms"] - before["p95_ms"]) / before["p95_ms"] * 100
+        print(f"{label:<48} {before['p95_ms']:>8.2f} -> {row['p95_ms']:>8.2f} ms ({change:+.1f}%)")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of traffic after registration")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("auth=1,tasks=8,chat=1"),
+                        help="relative weights of auth, tasks and chat operations")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="stubbed seconds per model call")
+    parser.add_argument("--llm-jitter", type=float, default=0.0, help="+/- seconds of seeded jitter per model call")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--database-url", help="e.g. postgresql://localhost/todo_bench (default: temporary SQLite)")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare p95 against")
+    args = parser.parse_args()
+
+    # The app reads its configuration at import time
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'loadtest.db')}"
+    os.environ.setdefault("BETTER_AUTH_SECRET", "loadtest-secret")
+    os.environ.setdefault("GEMINI_API_KEY", "loadtest-key")
+    os.environ.setdefault("SQL_METRICS_LOG_SAMPLE_RATE", "0")
+    # Virtual users chat far faster than the per-user limit allows; set it to "true" to load-test the limiter
+    os.environ.setdefault("CHAT_RATE_LIMIT_ENABLED", "false")
+
+    results = asyncio.run(run(args))
+    print_report(results)
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            print_comparison(results, json.load(baseline_file))
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+        print(f"\nresults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,70 @@
+"""
+Deterministic stand-in for GeminiAIService used by the load tests.
+
+Each "model call" sleeps for a fixed latency (plus optional seeded jitter) instead
+of going to the network. Requests that look like task commands run the matching
+task tool through execute_tool_call, so chat turns still do their real database
+work.
+"""
+import asyncio
+import json
+import random
+import re
+
+from app.gemini_service import ChatTurn
+from app.task_mcp_tools import execute_tool_call
+
+_ADD = re.compile(r"^add (?P<title>.+)$", re.IGNORECASE)
+_COMPLETE = re.compile(r"^complete (?P<task_id>\d+)$", re.IGNORECASE)
+_DELETE = re.compile(r"^delete task (?P<task_id>\d+)$", re.IGNORECASE)
+_LIST = re.compile(r"^(?:show|list) (?P<status>all|pending|completed) tasks$", re.IGNORECASE)
+
+
+class StubGeminiService:
+    """Implements the parts of GeminiAIService the chat endpoints use."""
+
+    def __init__(self, latency: float = 0.2, jitter: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self.model_calls = 0
+
+    async def _model_call(self):
+        self.model_calls += 1
+        delay = self.latency
+        if self.jitter:
+            delay += self._random.uniform(-self.jitter, self.jitter)
+        await asyncio.sleep(max(delay, 0.0))
+
+    @staticmethod
+    def _tool_for(text: str):
+        text = text.strip()
+        if match := _ADD.match(text):
+            return "add_task", {"title": match["title"]}
+        if match := _COMPLETE.match(text):
+            return "complete_task", {"task_id": int(match["task_id"])}
+        if match := _DELETE.match(text):
+            return "delete_task", {"task_id": int(match["task_id"])}
+        if match := _LIST.match(text):
+            return "list_tasks", {"status": match["status"].lower()}
+        return None
+
+    async def chat_with_function_calling(self, messages, db_session, user_id, tools=None):
+        await self._model_call()
+        tool = self._tool_for(messages[-1]["content"])
+        if tool is None:
+            return ChatTurn(text="Stub reply.")
+
+        name, arguments = tool
+        response = await execute_tool_call(name, json.dumps(arguments), db_session, user_id)
+        step = {
+            "calls": [{"name": name, "arguments": arguments}],
+            "responses": [{"name": name, "response": response}],
+        }
+        # Second model call: the answer after seeing the tool result
+        await self._model_call()
+        return ChatTurn(text=f"Done: {name}.", steps=[step])
+
+    async def summarize_conversation(self, previous_summary, messages):
+        await self._model_call()
+        return f"{previous_summary or ''} [{len(messages)} earlier messages]".strip()
@@ -0,0 +1,52 @@
+import os
+import tempfile
+import uuid
+
+# The app reads its configuration at import: point it at a throwaway SQLite database and
+# switch off everything that would leave the process. Set before app/.env can fill them in.
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}"
+os.environ["DATABASE_READ_URL"] = ""
+os.environ["BETTER_AUTH_SECRET"] = "test-secret"
+os.environ["GEMINI_API_KEY"] = ""  # Chat assistant off unless a test puts a stub on app.state
+os.environ["BCRYPT_ROUNDS"] = "4"
+os.environ["CHAT_RATE_LIMIT_ENABLED"] = "false"
+os.environ["MESSAGE_COMPACTION_ENABLED"] = "false"
+os.environ["SQL_METRICS_LOG_SAMPLE_RATE"] = "0"
+os.environ["METRICS_TOKEN"] = "test-metrics-token"
+
+import httpx
+import pytest
+
+from app import main
+from app.database import async_session_factory
+from app.security import decode_access_token
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    # One event loop for the whole run: module-level asyncio state outlives a single test
+    return "asyncio"
+
+@pytest.fixture
+async def client():
+    """An HTTP client on the app, with the app's lifespan running."""
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            yield client
+
+@pytest.fixture
+async def user_id(client):
+    """A newly registered user; client is authenticated as them."""
+    response = await client.post(
+        "/auth/register", json={"email": f"{uuid.uuid4().hex}@example.com", "password": "test-password"}
+    )
+    response.raise_for_status()
+    token = response.json()["access_token"]
+    client.headers["Authorization"] = f"Bearer {token}"
+    return decode_access_token(token).id
+
+@pytest.fixture
+async def session(client):
+    """A database session for setting up state the API can't create directly."""
+    async with async_session_factory() as session:
+        yield session
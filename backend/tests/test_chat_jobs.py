@@ -0,0 +1,61 @@
+import json
+
+import pytest
+import sqlalchemy as sa
+from sqlmodel import select
+
+from app import crud
+from app.chat_jobs import CHAT_JOB_LEASE_SECONDS, CHAT_JOB_MAX_ATTEMPTS, run_chat_job
+from app.gemini_service import ChatTurn
+from app.models import ChatJob, Message, Task
+from app.task_mcp_tools import execute_tool_call
+
+pytestmark = pytest.mark.anyio
+
+class AddTaskService:
+    """Stands in for Gemini: adds a task through the tool layer, as a model's function call would."""
+
+    def __init__(self, lose_lease: bool = False):
+        self.lose_lease = lose_lease
+
+    async def chat_with_function_calling(self, messages, db_session, user_id):
+        await execute_tool_call("add_task", json.dumps({"title": "from the model"}), db_session, user_id)
+        if self.lose_lease:
+            # The lease lapsed and another worker claimed the job (its next attempt) meanwhile
+            await db_session.exec(
+                sa.update(ChatJob).values(attempts=ChatJob.attempts + 1).execution_options(synchronize_session=False)
+            )
+        return ChatTurn(text="Added it.")
+
+@pytest.fixture
+async def claimed_job(client, user_id, session):
+    conversation_id = (await client.post(f"/api/{user_id}/conversations")).json()["id"]
+    # Not a fast-path command, so the turn goes to the model
+    message = await crud.create_message(session, conversation_id, "user", "could you note that I need milk?")
+    await crud.create_chat_job(session, user_id, conversation_id, message.id)
+    job = await crud.claim_chat_job(session, CHAT_JOB_LEASE_SECONDS, CHAT_JOB_MAX_ATTEMPTS)
+    assert job.user_message_id == message.id
+    return job
+
+async def task_count(session, user_id):
+    return len((await session.exec(select(Task).where(Task.owner_id == user_id))).all())
+
+async def test_finished_job_keeps_its_tool_writes(user_id, session, claimed_job):
+    await run_chat_job(session, claimed_job, AddTaskService())
+
+    assert claimed_job.status == "succeeded"
+    assert await task_count(session, user_id) == 1
+
+async def test_lost_lease_rolls_back_tool_writes(user_id, session, claimed_job):
+    job_id, conversation_id = claimed_job.id, claimed_job.conversation_id
+    with pytest.raises(crud.ChatJobLeaseLost):
+        await run_chat_job(session, claimed_job, AddTaskService(lose_lease=True))
+
+    # Neither the task nor the reply of the abandoned turn was kept
+    assert await task_count(session, user_id) == 0
+    messages = (await session.exec(
+        select(Message.role).where(Message.conversation_id == conversation_id)
+    )).all()
+    assert messages == ["user"]
+    job = await session.get(ChatJob, job_id, populate_existing=True)
+    assert job.status == "running"
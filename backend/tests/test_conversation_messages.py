@@ -0,0 +1,55 @@
+import pytest
+
+from app import crud
+from app.models import Conversation
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+async def conversation_id(client, user_id, session):
+    """A conversation with messages "0".."6", the first four of them archived."""
+    conversation_id = (await client.post(f"/api/{user_id}/conversations")).json()["id"]
+    messages = [
+        await crud.create_message(session, conversation_id, "user" if i % 2 == 0 else "assistant", str(i))
+        for i in range(7)
+    ]
+    conversation = await session.get(Conversation, conversation_id)
+    await crud.archive_messages(session, conversation, messages[:4], summary="Earlier turns")
+    return conversation_id
+
+async def read_page(client, user_id, conversation_id, **params):
+    response = await client.get(f"/api/{user_id}/conversations/{conversation_id}", params=params)
+    assert response.status_code == 200
+    return [message["content"] for message in response.json()["messages"]], response.headers
+
+async def test_pages_back_from_live_into_archived(client, user_id, conversation_id):
+    pages, params = [], {"limit": 3}
+    while True:
+        contents, headers = await read_page(client, user_id, conversation_id, **params)
+        pages.append(contents)
+        if "X-Before-Cursor" not in headers:
+            break
+        params = {"limit": 3, "before": headers["X-Before-Cursor"]}
+
+    assert pages == [["4", "5", "6"], ["1", "2", "3"], ["0"]]
+
+async def test_pages_forward_from_archived_into_live(client, user_id, conversation_id):
+    _, headers = await read_page(client, user_id, conversation_id, limit=3)
+    _, headers = await read_page(client, user_id, conversation_id, limit=3, before=headers["X-Before-Cursor"])
+    oldest, headers = await read_page(client, user_id, conversation_id, limit=3, before=headers["X-Before-Cursor"])
+    assert oldest == ["0"]
+
+    pages = []
+    while True:
+        contents, headers = await read_page(client, user_id, conversation_id, limit=3, after=headers["X-After-Cursor"])
+        if not contents:
+            break
+        pages.append(contents)
+
+    assert pages == [["1", "2", "3"], ["4", "5", "6"]]
+
+async def test_whole_conversation_in_one_page(client, user_id, conversation_id):
+    contents, headers = await read_page(client, user_id, conversation_id)
+
+    assert contents == [str(i) for i in range(7)]
+    assert "X-Before-Cursor" not in headers
@@ -0,0 +1,28 @@
+import pytest
+
+from app.llm_cache import CachedGeminiService
+
+pytestmark = pytest.mark.anyio
+
+class StubService:
+    model = None
+    tool_definitions = []
+
+MESSAGES = [{"role": "user", "content": "what's on my list?"}]
+
+async def test_key_changes_with_every_task_write(client, user_id, session):
+    cached = CachedGeminiService(StubService())
+    keys = [await cached._key(MESSAGES, session, user_id)]
+    # Unchanged tasks, same key
+    assert await cached._key(MESSAGES, session, user_id) == keys[0]
+
+    task_id = (await client.post(f"/api/{user_id}/tasks", json={"title": "a"})).json()["id"]
+    keys.append(await cached._key(MESSAGES, session, user_id))
+    # Back-to-back writes to one task can share an updated_at; each still takes its own change_seq
+    for title in ("b", "c"):
+        await client.put(f"/api/{user_id}/tasks/{task_id}", json={"title": title})
+        keys.append(await cached._key(MESSAGES, session, user_id))
+    await client.delete(f"/api/{user_id}/tasks/{task_id}")
+    keys.append(await cached._key(MESSAGES, session, user_id))
+
+    assert len(set(keys)) == len(keys)
@@ -0,0 +1,22 @@
+import pytest
+
+from app import main
+
+pytestmark = pytest.mark.anyio
+
+async def test_metrics_need_the_metrics_token(client, user_id):
+    # A user's token is not enough
+    assert (await client.get("/metrics")).status_code == 401
+    assert (await client.get("/metrics", headers={"Authorization": "Bearer wrong"})).status_code == 401
+
+    response = await client.get("/metrics", headers={"Authorization": "Bearer test-metrics-token"})
+
+    assert response.status_code == 200
+    assert "read_replica" in response.json()
+
+async def test_metrics_are_off_without_a_token(client, monkeypatch):
+    monkeypatch.setattr(main, "METRICS_TOKEN", None)
+
+    response = await client.get("/metrics", headers={"Authorization": "Bearer test-metrics-token"})
+
+    assert response.status_code == 404
@@ -0,0 +1,67 @@
+import uuid
+
+import pytest
+
+from app.security import decode_access_token
+
+pytestmark = pytest.mark.anyio
+
+async def create_batch(client, user_id, titles, **kwargs):
+    response = await client.post(f"/api/{user_id}/tasks:batch", json={"tasks": [{"title": title} for title in titles]}, **kwargs)
+    assert response.status_code == 201
+    return [task["id"] for task in response.json()["tasks"]]
+
+async def other_users_task(client):
+    response = await client.post(
+        "/auth/register", json={"email": f"{uuid.uuid4().hex}@example.com", "password": "test-password"}
+    )
+    token = response.json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    other_id = decode_access_token(token).id
+    (task_id,) = await create_batch(client, other_id, ["not yours"], headers=headers)
+    return task_id
+
+async def test_create_batch(client, user_id):
+    response = await client.post(f"/api/{user_id}/tasks:batch", json={"tasks": [{"title": "a"}, {"title": "b"}]})
+
+    assert response.status_code == 201
+    assert [task["title"] for task in response.json()["tasks"]] == ["a", "b"]
+    assert response.json()["missing_ids"] == []
+
+async def test_update_batch_reports_missing_ids(client, user_id):
+    first, second = await create_batch(client, user_id, ["a", "b"])
+    foreign = await other_users_task(client)
+
+    response = await client.patch(f"/api/{user_id}/tasks:batch", json={"tasks": [
+        {"id": first, "title": "a2"},
+        {"id": 999999, "title": "nope"},
+        {"id": foreign, "title": "taken"},
+    ]})
+
+    assert response.status_code == 200
+    assert [(task["id"], task["title"]) for task in response.json()["tasks"]] == [(first, "a2")]
+    assert response.json()["missing_ids"] == [999999, foreign]
+    assert (await client.get(f"/api/{user_id}/tasks/{second}")).json()["title"] == "b"
+
+async def test_complete_batch_reports_missing_ids(client, user_id):
+    first, second = await create_batch(client, user_id, ["a", "b"])
+
+    response = await client.patch(
+        f"/api/{user_id}/tasks:batch/complete", json={"ids": [second, 999999, second], "completed": True}
+    )
+
+    assert [task["id"] for task in response.json()["tasks"]] == [second]
+    assert all(task["completed"] for task in response.json()["tasks"])
+    assert response.json()["missing_ids"] == [999999]
+    assert (await client.get(f"/api/{user_id}/tasks/{first}")).json()["completed"] is False
+
+async def test_delete_batch_reports_missing_ids(client, user_id):
+    first, second = await create_batch(client, user_id, ["a", "b"])
+    foreign = await other_users_task(client)
+
+    response = await client.request("DELETE", f"/api/{user_id}/tasks:batch", json={"ids": [first, foreign, 999999]})
+
+    assert [task["id"] for task in response.json()["tasks"]] == [first]
+    assert response.json()["missing_ids"] == [foreign, 999999]
+    remaining = (await client.get(f"/api/{user_id}/tasks")).json()
+    assert [task["id"] for task in remaining] == [second]
@@ -0,0 +1,62 @@
+import datetime
+
+import pytest
+
+from app import crud
+
+pytestmark = pytest.mark.anyio
+
+async def changes(client, user_id, **params):
+    response = await client.get(f"/api/{user_id}/tasks/changes", params=params)
+    assert response.status_code == 200
+    return response.json()
+
+async def test_only_changes_after_the_watermark(client, user_id):
+    first = (await client.post(f"/api/{user_id}/tasks", json={"title": "a"})).json()["id"]
+    second = (await client.post(f"/api/{user_id}/tasks", json={"title": "b"})).json()["id"]
+    full = await changes(client, user_id)
+    assert [task["id"] for task in full["changed"]] == [first, second]
+    assert full["has_more"] is False
+
+    await client.put(f"/api/{user_id}/tasks/{first}", json={"title": "a2"})
+    await client.delete(f"/api/{user_id}/tasks/{second}")
+    delta = await changes(client, user_id, since=full["watermark"])
+
+    assert [(task["id"], task["title"]) for task in delta["changed"]] == [(first, "a2")]
+    assert [tombstone["id"] for tombstone in delta["deleted"]] == [second]
+    assert delta["watermark"] > full["watermark"]
+    assert await changes(client, user_id, since=delta["watermark"]) == {
+        "changed": [], "deleted": [], "watermark": delta["watermark"], "has_more": False
+    }
+
+async def test_limit_pages_without_splitting_a_batch(client, user_id):
+    await client.post(f"/api/{user_id}/tasks", json={"title": "single"})
+    await client.post(f"/api/{user_id}/tasks:batch", json={"tasks": [{"title": str(i)} for i in range(3)]})
+    await client.post(f"/api/{user_id}/tasks", json={"title": "last"})
+
+    # The batch shares one change_seq, so it comes whole even though it exceeds the limit
+    pages, since = [], 0
+    while True:
+        page = await changes(client, user_id, since=since, limit=2)
+        pages.append([task["title"] for task in page["changed"]])
+        since = page["watermark"]
+        if not page["has_more"]:
+            break
+
+    assert pages == [["single"], ["0", "1", "2"], ["last"]]
+
+async def test_watermark_below_pruned_tombstones_needs_full_resync(client, user_id, session):
+    task_ids = [(await client.post(f"/api/{user_id}/tasks", json={"title": str(i)})).json()["id"] for i in range(3)]
+    before_deletes = (await changes(client, user_id))["watermark"]
+    await client.delete(f"/api/{user_id}/tasks/{task_ids[0]}")
+    after_delete = (await changes(client, user_id, since=before_deletes))["watermark"]
+
+    pruned = await crud.prune_task_tombstones(session, datetime.datetime.utcnow() + datetime.timedelta(seconds=1))
+    assert pruned >= 1
+
+    stale = await client.get(f"/api/{user_id}/tasks/changes", params={"since": before_deletes})
+    assert stale.status_code == 410
+    assert "full resync" in stale.json()["detail"]
+    # Watermarks at or past the prune floor, and full syncs, still work
+    assert (await changes(client, user_id, since=after_delete))["changed"] == []
+    assert [task["id"] for task in (await changes(client, user_id))["changed"]] == task_ids[1:]
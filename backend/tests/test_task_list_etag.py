@@ -0,0 +1,42 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+async def test_unchanged_list_gets_304(client, user_id):
+    await client.post(f"/api/{user_id}/tasks", json={"title": "a"})
+    first = await client.get(f"/api/{user_id}/tasks")
+
+    again = await client.get(f"/api/{user_id}/tasks", headers={"If-None-Match": first.headers["ETag"]})
+
+    assert again.status_code == 304
+    assert again.headers["ETag"] == first.headers["ETag"]
+    assert again.content == b""
+
+@pytest.mark.parametrize("write", ["create", "update", "complete", "delete"])
+async def test_write_changes_the_etag(client, user_id, write):
+    task_id = (await client.post(f"/api/{user_id}/tasks", json={"title": "a"})).json()["id"]
+    etag = (await client.get(f"/api/{user_id}/tasks")).headers["ETag"]
+
+    if write == "create":
+        await client.post(f"/api/{user_id}/tasks", json={"title": "b"})
+    elif write == "update":
+        await client.put(f"/api/{user_id}/tasks/{task_id}", json={"title": "a2"})
+    elif write == "complete":
+        await client.patch(f"/api/{user_id}/tasks/{task_id}/complete", json={"completed": True})
+    else:
+        await client.delete(f"/api/{user_id}/tasks/{task_id}")
+    response = await client.get(f"/api/{user_id}/tasks", headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    expected = {"create": ["a", "b"], "update": ["a2"], "complete": ["a"], "delete": []}[write]
+    assert [task["title"] for task in response.json()] == expected
+
+async def test_query_parameters_have_their_own_etag(client, user_id):
+    await client.post(f"/api/{user_id}/tasks", json={"title": "a"})
+    etag = (await client.get(f"/api/{user_id}/tasks")).headers["ETag"]
+
+    response = await client.get(f"/api/{user_id}/tasks", params={"completed": "true"}, headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.json() == []
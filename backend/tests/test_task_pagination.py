@@ -0,0 +1,51 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+async def create_tasks(client, user_id, count):
+    return [
+        (await client.post(f"/api/{user_id}/tasks", json={"title": f"task {i}"})).json()["id"]
+        for i in range(count)
+    ]
+
+async def test_cursor_round_trip(client, user_id):
+    task_ids = await create_tasks(client, user_id, 5)
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = await client.get(f"/api/{user_id}/tasks", params=params)
+        assert response.status_code == 200
+        seen += [task["id"] for task in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+
+    assert seen == task_ids
+
+async def test_descending_updated_at_pages(client, user_id):
+    task_ids = await create_tasks(client, user_id, 3)
+
+    first = await client.get(f"/api/{user_id}/tasks", params={"limit": 2, "sort": "-updated_at"})
+    second = await client.get(
+        f"/api/{user_id}/tasks",
+        params={"limit": 2, "sort": "-updated_at", "cursor": first.headers["X-Next-Cursor"]},
+    )
+
+    assert [task["id"] for task in first.json() + second.json()] == task_ids[::-1]
+    assert "X-Next-Cursor" not in second.headers
+
+async def test_whole_list_without_limit_or_cursor(client, user_id):
+    task_ids = await create_tasks(client, user_id, 3)
+
+    response = await client.get(f"/api/{user_id}/tasks")
+
+    assert [task["id"] for task in response.json()] == task_ids
+    assert "X-Next-Cursor" not in response.headers
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", "WzEsMl0x", "eyJhIjoxfQ"])
+async def test_bad_cursor_is_rejected(client, user_id, cursor):
+    response = await client.get(f"/api/{user_id}/tasks", params={"cursor": cursor})
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
@@ -16,6 +16,9 @@ interface RequestOptions extends RequestInit {
   userId?: string | null; 
 }
 
+// Read-after token from the last write response: sent back so our next reads skip a lagging read replica
+let readAfterToken: string | null = null;
+
 async function apiFetch<T>(
   endpoint: string, // endpoint starts with / for auth, or no / for task paths (handled by userId logic)
   options: RequestOptions = {}
@@ -75,7 +78,15 @@ async function apiFetch<T>(
     };
   }
 
+  if (readAfterToken) {
+    fetchOptions.headers = {
+      ...fetchOptions.headers,
+      "X-Read-After": readAfterToken,
+    };
+  }
+
   const response = await fetch(url, fetchOptions);
+  readAfterToken = response.headers.get("X-Read-After") ?? readAfterToken;
 
   if (!response.ok) {
     // If it's an authentication error (401), clear the token to prevent continued attempts with invalid token